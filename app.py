@@ -1,33 +1,355 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, \
+    Response, stream_with_context, current_app, g, has_request_context, before_render_template, \
+    template_rendered
+from flask.json.provider import DefaultJSONProvider
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.security import check_password_hash, generate_password_hash
 import pyodbc
+import click
+import numpy as np
+import asyncio
+import atexit
+import bisect
+import contextvars
+import csv
+import hashlib
+import heapq
+import hmac
+import io
+import json
+import logging
+import math
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import lru_cache, partial, wraps
+from itertools import islice
 from datetime import date
 
+
+class AppJSONProvider(DefaultJSONProvider):
+    """JSON responses use ISO dates instead of HTTP date strings"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (date, datetime)):
+            return o.isoformat()
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
 app.secret_key = 'bloodbank_secret_key_2024'
+app.json = AppJSONProvider(app)
 
 
 # ----------------------------
 # DATABASE CONNECTION
 # ----------------------------
-def get_db_connection():
-    connection_string = 'DRIVER={SQL Server};SERVER=DESKTOP-4J5DF41;DATABASE=bloodBankSystem;Trusted_Connection=yes;'
+# Table-valued parameters (sp_RecordDonations) need one of Microsoft's
+# ODBC drivers; the legacy '{SQL Server}' driver does not support them.
+DB_DRIVER = '{ODBC Driver 17 for SQL Server}'
+DB_SERVER = 'DESKTOP-4J5DF41'
+
+POOL_MAX_SIZE = 10              # connections per database
+POOL_ACQUIRE_TIMEOUT = 10       # seconds to wait for a free connection
+POOL_IDLE_TIMEOUT = 300         # idle connections older than this are closed
+POOL_HEALTH_CHECK_AFTER = 30    # ping connections that sat idle longer than this
+
+
+def connection_string(database):
+    return f'DRIVER={DB_DRIVER};SERVER={DB_SERVER};DATABASE={database};Trusted_Connection=yes;'
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free in time"""
+
+
+class PooledConnection:
+    """Connection handed out by a ConnectionPool - close() returns it to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise pyodbc.ProgrammingError('Connection already returned to the pool')
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of DB-API connections.
+
+    `factory` is any zero-argument callable returning a new connection, so the
+    pool works the same against pyodbc or a local sqlite3 stand-in.
+    """
+
+    def __init__(self, factory, name='default', max_size=POOL_MAX_SIZE,
+                 acquire_timeout=POOL_ACQUIRE_TIMEOUT, idle_timeout=POOL_IDLE_TIMEOUT,
+                 health_check_after=POOL_HEALTH_CHECK_AFTER, health_query='SELECT 1'):
+        self.factory = factory
+        self.name = name
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.health_query = health_query
+
+        self._cond = threading.Condition()
+        self._idle = deque()        # (raw connection, idle since) - newest on the right
+        self._size = 0              # open connections, idle + checked out
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'acquired': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'evicted_idle': 0,
+            'health_check_failures': 0,
+            'wait_seconds': 0.0,
+        }
+
+    # ---- checkout / checkin ----
+    def acquire(self, timeout=None):
+        """Check out a connection, blocking while the pool is at max_size"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        stale = []
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout(f'Pool {self.name} is closed')
+                stale.extend(self._evict_idle_locked())
+                if self._idle:
+                    raw, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    raw, idle_since = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No free connection in pool {self.name} after {timeout}s')
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._stats['acquired'] += 1
+            self._stats['wait_seconds'] += time.monotonic() - started
+
+        for conn in stale:
+            self._close_raw(conn)
+
+        if raw is not None and time.monotonic() - idle_since > self.health_check_after:
+            if not self._is_healthy(raw):
+                self._close_raw(raw)
+                raw = None
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                    self._stats['closed'] += 1
+
+        if raw is None:
+            try:
+                raw = self.factory()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['created'] += 1
+
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """Return a raw connection; any open transaction is rolled back"""
+        broken = False
+        try:
+            raw.rollback()
+        except Exception:
+            broken = True
+
+        with self._cond:
+            if broken or self._closed:
+                self._size -= 1
+                self._stats['closed'] += 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+            stale = self._evict_idle_locked()
+            self._cond.notify()
+
+        if broken or self._closed:
+            self._close_raw(raw)
+        for conn in stale:
+            self._close_raw(conn)
+
+    def close(self):
+        """Close idle connections and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+            self._cond.notify_all()
+        for raw in idle:
+            self._close_raw(raw)
+
+    # ---- internals ----
+    def _evict_idle_locked(self):
+        """Pop connections idle longer than idle_timeout (caller holds the lock)"""
+        stale = []
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < cutoff:
+            stale.append(self._idle.popleft()[0])
+        self._size -= len(stale)
+        self._stats['evicted_idle'] += len(stale)
+        self._stats['closed'] += len(stale)
+        return stale
+
+    def _is_healthy(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
 
-    conn = pyodbc.connect(connection_string)
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def metrics(self):
+        """Snapshot of pool size and counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'name': self.name,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            })
+        return stats
+
+
+db_pools = {
+    database: ConnectionPool(lambda database=database: pyodbc.connect(connection_string(database)),
+                             name=database)
+    for database in ('bloodBankSystem', 'bloodBankNGO')
+}
+
+
+def borrow_connection(database):
+    """Borrow a pooled connection, charging the wait to the current request's profile"""
+    started = time.perf_counter()
+    conn = db_pools[database].acquire()
+    record_acquire(time.perf_counter() - started)
     return conn
 
-def get_db_connection_ngo():
-    connection_string = 'DRIVER={SQL Server};SERVER=DESKTOP-4J5DF41;DATABASE=bloodBankNGO;Trusted_Connection=yes;'
 
-    conn = pyodbc.connect(connection_string)
-    return conn
+def get_db_connection():
+    """Borrow a bloodBankSystem connection - close() hands it back to the pool"""
+    return borrow_connection('bloodBankSystem')
+
+def get_db_connection_ngo():
+    """Borrow a bloodBankNGO connection - close() hands it back to the pool"""
+    return borrow_connection('bloodBankNGO')
 
 # ---------------------------------------------------------
 # HELPER FUNCTIONS
 # ---------------------------------------------------------
+ROW_FETCH_BATCH = 500
+
+
+class Row(Mapping):
+    """Read-only result row
+
+    Every row of a result set shares one column -> position index, so a row
+    costs a single small object on top of the driver's own tuple. It behaves
+    like the dicts rows_to_dict_list used to return (row['col'], row.get(),
+    .keys(), dict(row)) so templates and JSON responses don't change.
+    """
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, column):
+        return self._values[self._index[column]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, column):
+        return column in self._index
+
+    def __repr__(self):
+        return f"Row({dict(self)!r})"
+
+
+def column_index(cursor):
+    """Column name -> position map shared by all rows of the current result set"""
+    return {column[0]: i for i, column in enumerate(cursor.description)}
+
+
+def iter_rows(cursor, batch_size=ROW_FETCH_BATCH):
+    """Lazily yield Row objects, fetching batch_size rows per driver call"""
+    index = column_index(cursor)
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        for values in batch:
+            yield Row(index, values)
+
+
+def fetch_rows(cursor):
+    """Materialise the current result set as a list of Row objects"""
+    return list(iter_rows(cursor))
+
+
 def rows_to_dict_list(cursor):
-    """Convert SQL rows to list of dictionaries"""
+    """Convert SQL rows to list of dictionaries
+
+    Kept for callers that need mutable rows; fetch_rows is cheaper.
+    """
     columns = [column[0] for column in cursor.description]
     results = []
     for row in cursor.fetchall():
@@ -35,35 +357,715 @@ def rows_to_dict_list(cursor):
     return results
 
 
-def execute_query(query, params=None, fetch=True):
-    """Execute SQL query with error handling"""
-    conn = get_db_connection()
-    if not conn:
+def run_query(query, params, consume, label='Query', commit=False, database='bloodBankSystem'):
+    """Execute one statement on a pooled connection and hand the cursor to consume()"""
+    try:
+        conn = borrow_connection(database)
+    except (PoolTimeout, pyodbc.Error) as e:
+        log.error('%s error: no connection: %s', label, e)
         return None
 
     try:
+        started = time.perf_counter()
         cursor = conn.cursor()
         if params:
             cursor.execute(query, params)
         else:
             cursor.execute(query)
 
-        if fetch:
-            result = rows_to_dict_list(cursor)
-        else:
+        result = consume(cursor)
+        record_query(query, time.perf_counter() - started, result_row_count(result))
+        if commit:
             conn.commit()
-            result = cursor.rowcount
-
         cursor.close()
         conn.close()
         return result
     except Exception as e:
-        print(f"❌ Query error: {e}")
-        if conn:
-            conn.close()
+        log.error('%s error: %s', label, e)
+        conn.close()
         return None
 
 
+def execute_query(query, params=None, fetch=True, database='bloodBankSystem'):
+    """Execute SQL query with error handling"""
+    if fetch:
+        return run_query(query, params, fetch_rows, database=database)
+    return run_query(query, params, lambda cursor: cursor.rowcount, commit=True, database=database)
+
+
+def first(query, params=None, database='bloodBankSystem'):
+    """First row of the result, or None when there is none (or the query failed)"""
+    def consume(cursor):
+        values = cursor.fetchone()
+        return Row(column_index(cursor), values) if values is not None else None
+
+    return run_query(query, params, consume, database=database)
+
+
+def scalar(query, params=None, default=None, database='bloodBankSystem'):
+    """First column of the first row - COUNT(*), EXISTS checks and single lookups"""
+    def consume(cursor):
+        values = cursor.fetchone()
+        return values[0] if values is not None else None
+
+    value = run_query(query, params, consume, database=database)
+    return default if value is None else value
+
+
+def execute_batch(query, params=None, database='bloodBankSystem'):
+    """Run a multi-statement batch in one round trip and return every result set"""
+    def consume(cursor):
+        result_sets = []
+        while True:
+            if cursor.description:
+                result_sets.append(fetch_rows(cursor))
+            if not cursor.nextset():
+                break
+        return result_sets
+
+    return run_query(query, params, consume, label='Batch', database=database)
+
+
+@contextmanager
+def app_lock(conn, resource):
+    """Hold a session-scoped sp_getapplock on conn for the duration of the
+    block, so one job runs across every app process and CLI. Yields False,
+    without waiting, when another session holds it. Pooled connections
+    outlive the block, so the lock is released explicitly."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SET NOCOUNT ON;
+        DECLARE @result INT;
+        EXEC @result = sp_getapplock @Resource = ?, @LockMode = 'Exclusive',
+                                     @LockOwner = 'Session', @LockTimeout = 0;
+        SELECT @result;
+    """, (resource,))
+    acquired = cursor.fetchone()[0] >= 0
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cursor.execute("EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'", (resource,))
+        cursor.close()
+
+
+# ---------------------------------------------------------
+# ASYNC DATA LAYER
+# ---------------------------------------------------------
+# pyodbc is blocking, so async views hand each query to a small thread pool
+# and await the results together. Independent queries then cost roughly the
+# slowest one instead of their sum. The workers borrow from db_pools like
+# any other caller; size them to the pool so a gather never waits on it.
+DB_EXECUTOR_WORKERS = POOL_MAX_SIZE
+
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db')
+
+
+async def run_in_db_thread(func, *args, **kwargs):
+    """Run a blocking data-layer call on db_executor
+
+    The caller's context (Flask's app/request context included) is copied
+    into the worker so g, session and current_app behave as in the view.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, partial(context.run, func, *args, **kwargs))
+
+
+async def execute_query_async(query, params=None, fetch=True):
+    """Awaitable execute_query"""
+    return await run_in_db_thread(execute_query, query, params, fetch)
+
+
+async def first_async(query, params=None):
+    """Awaitable first"""
+    return await run_in_db_thread(first, query, params)
+
+
+async def scalar_async(query, params=None, default=None):
+    """Awaitable scalar"""
+    return await run_in_db_thread(scalar, query, params, default)
+
+
+# ---------------------------------------------------------
+# REQUEST PROFILING
+# ---------------------------------------------------------
+# Every Flask request gets a RequestProfile in g. run_query records each
+# statement, the connection helpers record pool waits and the template
+# signals record render time. Totals per endpoint are served by /metrics.
+# Statements slower than SLOW_QUERY_SECONDS go to the 'bloodbank.slow_query'
+# log as one JSON object per line, keyed by an SQL fingerprint.
+SLOW_QUERY_SECONDS = 0.5
+REPEATED_QUERY_THRESHOLD = 3   # same fingerprint this often in one request is logged (N+1)
+PROFILE_DEBUG_HEADERS = False  # Server-Timing / X-Query-Count headers; always on when app.debug
+REQUEST_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+log = logging.getLogger('bloodbank')
+slow_query_log = logging.getLogger('bloodbank.slow_query')
+
+_SQL_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_SQL_LITERALS = re.compile(r"N?'(?:[^']|'')*'|\b0x[0-9a-f]+\b|\b\d+(?:\.\d+)?\b", re.I)
+_SQL_SPACE = re.compile(r'\s+')
+_SQL_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+@lru_cache(maxsize=1024)
+def sql_fingerprint(query):
+    """Normalised SQL (literals and IN-lists collapsed to ?) and a short hash of it,
+    so every execution of one statement shape groups together"""
+    text = _SQL_COMMENTS.sub(' ', query)
+    text = _SQL_LITERALS.sub('?', text)
+    text = _SQL_SPACE.sub(' ', text).strip()
+    text = _SQL_LISTS.sub('(?...)', text)
+    return text, hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+class RequestProfile:
+    """Query, pool and render timings for one request.
+
+    Async views run queries on db_executor threads, so updates take a lock.
+    """
+    __slots__ = ('queries', 'query_seconds', 'rows', 'acquire_seconds', 'render_seconds',
+                 'fingerprints', 'render_started', '_lock')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.acquire_seconds = 0.0
+        self.render_seconds = 0.0
+        self.fingerprints = {}
+        self.render_started = None
+        self._lock = threading.Lock()
+
+    def record_query(self, fingerprint, seconds, rows):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+            self.rows += rows
+            self.fingerprints[fingerprint] = self.fingerprints.get(fingerprint, 0) + 1
+
+    def record_acquire(self, seconds):
+        with self._lock:
+            self.acquire_seconds += seconds
+
+
+class EndpointMetrics:
+    """Request totals and a duration histogram per endpoint, for /metrics"""
+    FIELDS = ('requests', 'seconds', 'queries', 'query_seconds', 'rows', 'acquire_seconds', 'render_seconds')
+
+    def __init__(self, buckets=REQUEST_DURATION_BUCKETS):
+        self.buckets = buckets
+        self.slow_queries = 0
+        self._totals = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, seconds, profile):
+        with self._lock:
+            totals = self._totals.setdefault(endpoint, dict.fromkeys(self.FIELDS, 0))
+            totals['requests'] += 1
+            totals['seconds'] += seconds
+            totals['queries'] += profile.queries
+            totals['query_seconds'] += profile.query_seconds
+            totals['rows'] += profile.rows
+            totals['acquire_seconds'] += profile.acquire_seconds
+            totals['render_seconds'] += profile.render_seconds
+            # per-bucket counts; /metrics makes them cumulative
+            histogram = self._histograms.setdefault(endpoint, [0] * (len(self.buckets) + 1))
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def count_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def snapshot(self):
+        with self._lock:
+            return ({endpoint: dict(totals) for endpoint, totals in self._totals.items()},
+                    {endpoint: list(counts) for endpoint, counts in self._histograms.items()},
+                    self.slow_queries)
+
+
+request_metrics = EndpointMetrics()
+
+
+def current_profile():
+    """The RequestProfile of the request being served, or None (jobs, CLI)"""
+    return g.get('profile') if has_request_context() else None
+
+
+def result_row_count(result):
+    """Rows in a run_query result: a Row, a list of Rows, or a list of result sets"""
+    if isinstance(result, Row):
+        return 1
+    if isinstance(result, list):
+        return sum(len(rows) if isinstance(rows, list) else 1 for rows in result)
+    return 0
+
+
+def record_query(query, seconds, rows):
+    profile = current_profile()
+    if profile is not None:
+        profile.record_query(sql_fingerprint(query)[1], seconds, rows)
+    if seconds >= SLOW_QUERY_SECONDS:
+        request_metrics.count_slow_query()
+        text, fingerprint = sql_fingerprint(query)
+        slow_query_log.warning(json.dumps({
+            'event': 'slow_query',
+            'fingerprint': fingerprint,
+            'duration_ms': round(seconds * 1000, 1),
+            'rows': rows,
+            'endpoint': request.endpoint if has_request_context() else None,
+            'path': request.path if has_request_context() else None,
+            'sql': text[:1000],
+        }))
+
+
+def record_acquire(seconds):
+    profile = current_profile()
+    if profile is not None:
+        profile.record_acquire(seconds)
+
+
+@app.before_request
+def start_request_profile():
+    g.profile = RequestProfile()
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def finish_request_profile(response):
+    profile = g.get('profile')
+    if profile is None:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    request_metrics.observe(request.endpoint or 'unmatched', elapsed, profile)
+
+    repeated = {fingerprint: count for fingerprint, count in profile.fingerprints.items()
+                if count >= REPEATED_QUERY_THRESHOLD}
+    if repeated:
+        log.warning(json.dumps({'event': 'repeated_queries', 'endpoint': request.endpoint,
+                                'path': request.path, 'fingerprints': repeated}))
+
+    if PROFILE_DEBUG_HEADERS or app.debug:
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={profile.query_seconds * 1000:.1f};desc="{profile.queries} queries, {profile.rows} rows"',
+            f'pool;dur={profile.acquire_seconds * 1000:.1f}',
+            f'render;dur={profile.render_seconds * 1000:.1f}',
+            f'total;dur={elapsed * 1000:.1f}',
+        ])
+        response.headers['X-Query-Count'] = str(profile.queries)
+    return response
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        profile.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None and profile.render_started is not None:
+        profile.render_seconds += time.perf_counter() - profile.render_started
+        profile.render_started = None
+
+
+# ---------------------------------------------------------
+# CACHING
+# ---------------------------------------------------------
+DASHBOARD_CACHE_TTL = 30  # seconds
+
+
+class TTLCache:
+    """Thread-safe key/value cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}       # key -> lock held while that key loads
+        self._generations = {}      # key -> bumped by invalidate(key)
+        self._epoch = 0             # bumped by invalidate()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value or call loader() once for all threads waiting
+        on the same key; other keys load in parallel. None results are not
+        cached so a failed query is retried next time."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            value = self.get(key)
+            if value is None:
+                with self._lock:
+                    generation = (self._epoch, self._generations.get(key, 0))
+                value = loader()
+                if value is not None:
+                    with self._lock:
+                        # An invalidate() during the load means the loader may
+                        # have read data from before the write: return it, don't cache it
+                        if generation == (self._epoch, self._generations.get(key, 0)):
+                            self._entries[key] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None. A load already in
+        progress for it finishes but is not cached."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+
+dashboard_cache = TTLCache(DASHBOARD_CACHE_TTL)
+
+
+class LRUCache:
+    """Thread-safe cache holding at most `maxsize` entries, least recently used
+    evicted first. Entries optionally also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] >= time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Lookup tables behind the form dropdowns. Each query selects the union of
+# the columns the templates need.
+REFERENCE_QUERIES = {
+    'BloodGroup': "SELECT * FROM BloodGroup",
+    'GenderType': "SELECT * FROM GenderType",
+    'DonationType': "SELECT donationTypeID, donationTypeName FROM DonationType",
+    'BloodBankCenter': "SELECT centerID, bloodCenterName, city FROM BloodBankCenter",
+    'Staff': "SELECT staffID, staffName, staffRole, centerID FROM Staff",
+    'Hospital': "SELECT hospitalID, hospitalName, city FROM Hospital",
+    'Doctor': "SELECT doctorID, doctorName, specialization, hospitalID FROM Doctor",
+    'Patient': "SELECT patientID, patientName FROM Patient",
+}
+REFERENCE_CACHE_WARM_ON_STARTUP = True
+
+
+class ReferenceDataCache:
+    """Process-wide cache of small lookup tables.
+
+    Every table has a version number; invalidate() bumps it and the next get()
+    reloads. A load that races an invalidation is stored under the old version,
+    so it is never served after the bump.
+    """
+
+    def __init__(self, queries):
+        self.queries = queries
+        self._versions = {table: 0 for table in queries}
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, table):
+        """Rows of `table`, loading them if the cached copy is missing or stale"""
+        with self._lock:
+            version = self._versions[table]
+            cached = self._data.get(table)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        rows = execute_query(self.queries[table])
+        if rows is None:
+            return []
+        with self._lock:
+            self._data[table] = (version, rows)
+        return rows
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables or self.queries:
+                self._versions[table] += 1
+
+    def version(self, table):
+        with self._lock:
+            return self._versions[table]
+
+    def warm(self):
+        """Load every table in a single batch"""
+        tables = list(self.queries)
+        with self._lock:
+            versions = dict(self._versions)
+        result_sets = execute_batch(';\n'.join(self.queries[t] for t in tables))
+        if not result_sets or len(result_sets) != len(tables):
+            return False
+        with self._lock:
+            for table, rows in zip(tables, result_sets):
+                self._data[table] = (versions[table], rows)
+        return True
+
+
+reference_cache = ReferenceDataCache(REFERENCE_QUERIES)
+
+
+# ---------------------------------------------------------
+# DONOR SEARCH INDEX
+# ---------------------------------------------------------
+SEARCH_MAX_RESULTS = 1000
+SEARCH_MAX_CANDIDATES = 20000   # bound on names examined for one fuzzy query
+SEARCH_NAME_THRESHOLD = 0.6     # share of the query's trigrams a name must contain
+SEARCH_REFRESH_INTERVAL = 60    # seconds between picking up donors added elsewhere
+SEARCH_LOAD_BATCH = 5000
+SEARCH_WARM_ON_STARTUP = True
+
+_PHONE_QUERY = re.compile(r'^[\d\s()+-]+$')
+_POSTING_DTYPE = np.dtype(f"i{array('l').itemsize}")
+
+
+def _posting_view(postings):
+    """Zero-copy numpy view of an array('l') posting list"""
+    if not postings:
+        return np.empty(0, dtype=_POSTING_DTYPE)
+    return np.frombuffer(postings, dtype=_POSTING_DTYPE)
+
+
+class DonorSearchIndex:
+    """In-process index behind the donor search box.
+
+    * phone numbers - digits only, kept sorted so a prefix is a bisect range
+    * emails        - exact, case-insensitive hash lookup
+    * names         - trigram inverted index with sorted donorID postings
+
+    The index is built from Donor on first use, picks up rows above its
+    high-water donorID every SEARCH_REFRESH_INTERVAL seconds, and add() keeps
+    it current for donors registered by this process.
+    """
+
+    def __init__(self, name_threshold=SEARCH_NAME_THRESHOLD):
+        self.name_threshold = name_threshold
+        self._lock = threading.RLock()
+        self._phone_keys = []           # sorted digit strings
+        self._phone_ids = array('l')    # donorID at the same position
+        self._emails = {}
+        self._trigrams = {}
+        self.high_water = 0
+        self.built = False
+        self.last_refresh = 0.0
+
+    # ---- normalisation ----
+    @staticmethod
+    def normalize_phone(value):
+        return ''.join(ch for ch in (value or '') if ch.isdigit())
+
+    @staticmethod
+    def trigrams(text):
+        grams = set()
+        for word in (text or '').lower().split():
+            padded = f'  {word} '
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return grams
+
+    # ---- maintenance ----
+    def add(self, donor_id, name, phone, email):
+        """Index one newly inserted donor (ignored until the index is built)"""
+        with self._lock:
+            if not self.built:
+                return
+            digits = self.normalize_phone(phone)
+            if digits:
+                pos = bisect.bisect_right(self._phone_keys, digits)
+                self._phone_keys.insert(pos, digits)
+                self._phone_ids.insert(pos, donor_id)
+            if email:
+                self._emails.setdefault(email.strip().lower(), []).append(donor_id)
+            for gram in self.trigrams(name):
+                postings = self._trigrams.get(gram)
+                if postings is None:
+                    self._trigrams[gram] = array('l', [donor_id])
+                elif postings[-1] < donor_id:
+                    postings.append(donor_id)
+                else:
+                    pos = bisect.bisect_left(postings, donor_id)
+                    if pos == len(postings) or postings[pos] != donor_id:
+                        postings.insert(pos, donor_id)
+            self.high_water = max(self.high_water, donor_id)
+
+    def _bulk_load(self, rows):
+        """Full build from (donorID, name, contactNo, donorEmail) in donorID order"""
+        phones = []
+        emails = {}
+        trigram_index = {}
+        high_water = 0
+        for donor_id, name, phone, email in rows:
+            digits = self.normalize_phone(phone)
+            if digits:
+                phones.append((digits, donor_id))
+            if email:
+                emails.setdefault(email.strip().lower(), []).append(donor_id)
+            for gram in self.trigrams(name):
+                postings = trigram_index.get(gram)
+                if postings is None:
+                    trigram_index[gram] = array('l', [donor_id])
+                else:
+                    postings.append(donor_id)
+            high_water = donor_id
+        phones.sort()
+
+        self._phone_keys = [digits for digits, _ in phones]
+        self._phone_ids = array('l', (donor_id for _, donor_id in phones))
+        self._emails = emails
+        self._trigrams = trigram_index
+        self.high_water = high_water
+        self.built = True
+
+    def _stream_donors(self, after_id):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT donorID, name, contactNo, donorEmail
+                FROM Donor
+                WHERE donorID > ?
+                ORDER BY donorID
+            """, (after_id,))
+            while True:
+                batch = cursor.fetchmany(SEARCH_LOAD_BATCH)
+                if not batch:
+                    break
+                for row in batch:
+                    yield tuple(row)
+            cursor.close()
+        finally:
+            conn.close()
+
+    def ensure_fresh(self):
+        """Build on first use, then pull in donors added by other processes"""
+        with self._lock:
+            now = time.monotonic()
+            if not self.built:
+                self._bulk_load(self._stream_donors(0))
+                self.last_refresh = now
+            elif now - self.last_refresh > SEARCH_REFRESH_INTERVAL:
+                for row in self._stream_donors(self.high_water):
+                    self.add(*row)
+                self.last_refresh = now
+
+    # ---- lookups (caller holds the lock) ----
+    def _search_phone(self, digits):
+        lo = bisect.bisect_left(self._phone_keys, digits)
+        hi = bisect.bisect_left(self._phone_keys, digits + ':')  # ':' sorts after '9'
+        return self._phone_ids[lo:hi]
+
+    def _search_name(self, text, before, limit):
+        query = self.trigrams(text)
+        if not query:
+            return []
+        postings = sorted((_posting_view(self._trigrams.get(gram)) for gram in query), key=len)
+        needed = math.ceil(self.name_threshold * len(query))
+
+        # A name sharing `needed` trigrams must appear in at least one of the
+        # len(query) - needed + 1 rarest posting lists, so candidates come only
+        # from those. Scanning donorID windows from the top, each twice as wide
+        # as the last, lets us stop at `limit` without touching older donors.
+        split = len(query) - needed + 1
+        top = before or self.high_water + 1
+        width = max(top // 64, 1)
+        budget = SEARCH_MAX_CANDIDATES
+        matches = []
+        while top > 0 and budget > 0 and len(matches) < limit:
+            low = max(top - width, 0)
+            windows = [ids[np.searchsorted(ids, low):np.searchsorted(ids, top)] for ids in postings]
+            candidates = np.unique(np.concatenate(windows[:split]))[-budget:]
+            budget -= len(candidates)
+            count = np.zeros(len(candidates), dtype=np.intp)
+            for ids in windows:
+                if len(ids):
+                    pos = np.minimum(np.searchsorted(ids, candidates), len(ids) - 1)
+                    count += ids[pos] == candidates
+            found = candidates[count >= needed][::-1]
+            matches.extend(found[:limit - len(matches)].tolist())
+            top, width = low, width * 2
+        return matches
+
+    def search(self, term, before=None, limit=SEARCH_MAX_RESULTS):
+        """donorIDs matching `term` below `before`, newest first, at most `limit`.
+        Returns None when the index could not be built."""
+        term = (term or '').strip()
+        if not term:
+            return []
+        try:
+            self.ensure_fresh()
+        except Exception as e:
+            log.error('Donor search index error: %s', e)
+            if not self.built:
+                return None
+
+        with self._lock:
+            digits = self.normalize_phone(term)
+            if '@' in term or not (_PHONE_QUERY.match(term) and len(digits) >= 3):
+                if '@' in term:
+                    ids = self._emails.get(term.lower(), [])
+                else:
+                    return self._search_name(term, before, limit)
+            else:
+                ids = self._search_phone(digits)
+            if before:
+                ids = [donor_id for donor_id in ids if donor_id < before]
+            return heapq.nlargest(limit, set(ids))
+
+
+donor_search = DonorSearchIndex()
+
+
 # ---------------------------------------------------------
 # AUTHENTICATION DECORATOR
 # ---------------------------------------------------------
@@ -75,27 +1077,218 @@ def login_required(f):
         if 'user_id' not in session:
             flash('Please login to access this page!', 'warning')
             return redirect(url_for('login'))
-        return f(*args, **kwargs)
+        return current_app.ensure_sync(f)(*args, **kwargs)
 
     return decorated_function
 
 
-def role_required(required_role):
-    """Decorator to check user role"""
+def role_required(*required_roles):
+    """Decorator to check user role (any of the given roles passes)"""
 
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'user_role' not in session or session['user_role'] != required_role:
-                flash(f'Access denied! {required_role.capitalize()} role required.', 'danger')
+            if session.get('user_role') not in required_roles:
+                allowed = ' or '.join(role.capitalize() for role in required_roles)
+                flash(f'Access denied! {allowed} role required.', 'danger')
                 return redirect(url_for('dashboard'))
-            return f(*args, **kwargs)
+            return current_app.ensure_sync(f)(*args, **kwargs)
 
         return decorated_function
 
     return decorator
 
 
+# ---------------------------------------------------------
+# PASSWORDS & SESSIONS
+# ---------------------------------------------------------
+# Passwords are stored in UserLogin.passwordHash as salted PBKDF2 hashes.
+# Accounts still on the seed script's plainPassword (or its unsalted
+# HASHBYTES digest) are rehashed the first time they log in.
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+LAST_LOGIN_FLUSH_INTERVAL = 30   # seconds
+LAST_LOGIN_FLUSH_CHUNK = 1000    # (userID, time) pairs per UPDATE, under the 2100-parameter limit
+
+# Session data lives on the server; the cookie only carries a random id.
+# 'memory' is per process (fine for the dev server); use 'redis' when more
+# than one process serves the app.
+SESSION_BACKEND = 'memory'
+SESSION_REDIS_URL = 'redis://localhost:6379/0'
+SESSION_IDLE_TIMEOUT = 8 * 60 * 60  # seconds
+SESSION_MEMORY_MAX = 10000
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+def check_login_password(user, password):
+    """Check a password against a UserLogin row from login's query.
+
+    Returns (valid, new_hash); new_hash is set when the stored credential
+    should be replaced - legacy plaintext/HASHBYTES accounts, or a hash made
+    with an older PASSWORD_HASH_METHOD.
+    """
+    stored = user['passwordHash'] or ''
+    if stored.startswith(('pbkdf2:', 'scrypt:')):
+        if not check_password_hash(stored, password):
+            return False, None
+        return True, None if stored.startswith(PASSWORD_HASH_METHOD + '$') else hash_password(password)
+
+    plain = user['plainPassword']
+    if (plain is not None and hmac.compare_digest(plain.encode(), password.encode())) \
+            or user['LegacyHashMatches']:
+        return True, hash_password(password)
+    return False, None
+
+
+class LastLoginRecorder:
+    """Collects login times in memory; flush() writes them with one UPDATE per chunk
+    instead of one round trip per login."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, user_id):
+        with self._lock:
+            self._pending[user_id] = datetime.now()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        conn = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            for start in range(0, len(items), LAST_LOGIN_FLUSH_CHUNK):
+                chunk = items[start:start + LAST_LOGIN_FLUSH_CHUNK]
+                cursor.execute(f"""
+                    UPDATE u SET lastLogin = v.loginAt
+                    FROM UserLogin u
+                    JOIN (VALUES {', '.join(['(?, ?)'] * len(chunk))}) AS v (userID, loginAt)
+                        ON u.userID = v.userID
+                """, [value for pair in chunk for value in pair])
+            conn.commit()
+            cursor.close()
+        except Exception:
+            # Keep them for the next run; a newer login recorded meanwhile wins
+            with self._lock:
+                for user_id, login_at in pending.items():
+                    self._pending.setdefault(user_id, login_at)
+            raise
+        finally:
+            if conn:
+                conn.close()
+        return len(items)
+
+
+last_logins = LastLoginRecorder()
+
+
+@atexit.register
+def flush_last_logins_on_exit():
+    try:
+        last_logins.flush()
+    except Exception as e:
+        log.error('Could not flush last login times: %s', e)
+
+
+class MemorySessionStore:
+    """Session payloads in a per-process LRU"""
+
+    def __init__(self, maxsize=SESSION_MEMORY_MAX, ttl=SESSION_IDLE_TIMEOUT):
+        self._cache = LRUCache(maxsize, ttl=ttl)
+
+    def get(self, sid):
+        return self._cache.get(sid)
+
+    def set(self, sid, data):
+        self._cache.set(sid, data)
+
+    def delete(self, sid):
+        self._cache.invalidate(sid)
+
+
+class RedisSessionStore:
+    """Session payloads in Redis, shared by every app process (needs the redis package)"""
+
+    def __init__(self, url=SESSION_REDIS_URL, ttl=SESSION_IDLE_TIMEOUT, prefix='bloodbank:session:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, sid):
+        return self._redis.get(self.prefix + sid)
+
+    def set(self, sid, data):
+        self._redis.setex(self.prefix + sid, self.ttl, data)
+
+    def delete(self, sid):
+        self._redis.delete(self.prefix + sid)
+
+
+SESSION_STORES = {'memory': MemorySessionStore, 'redis': RedisSessionStore}
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session kept in a session store, keyed by an unguessable cookie id"""
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        """Move the session to a fresh id (on login, against session fixation)"""
+        self.store.delete(session.sid)
+        session.sid = secrets.token_urlsafe(32)
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # Rewritten on every request so the idle timeout slides
+        self.store.set(session.sid, self.serializer.dumps(dict(session)))
+        if session.new or session.modified or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, max_age=SESSION_IDLE_TIMEOUT, domain=domain, path=path,
+                                httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+
+app.session_interface = ServerSideSessionInterface(SESSION_STORES[SESSION_BACKEND]())
+
+
 # ---------------------------------------------------------
 # LOGIN/LOGOUT ROUTES
 # ---------------------------------------------------------
@@ -124,42 +1317,43 @@ def login():
             return render_template('login.html')
 
         try:
-            user = execute_query("""
-                SELECT userID, username, userRole, staffID, doctorID, plainPassword
+            user = first("""
+                SELECT userID, username, userRole, staffID, doctorID, passwordHash, plainPassword,
+                       CASE WHEN passwordHash IN (
+                                CONVERT(VARCHAR(255), HASHBYTES('SHA2_256', CAST(? AS VARCHAR(50)))),
+                                CONVERT(VARCHAR(255), HASHBYTES('SHA2_256', CAST(? AS NVARCHAR(50)))))
+                            THEN 1 ELSE 0 END AS LegacyHashMatches
                 FROM UserLogin
-                WHERE username = ? AND plainPassword = ?
-            """, (username, password))
-
-            if user and len(user) > 0:
-                session['user_id'] = user[0]['userID']
-                session['username'] = user[0]['username']
-                session['user_role'] = user[0]['userRole']
-                session['linked_id'] = user[0]['staffID'] or user[0]['doctorID']
-
-                execute_query(
-                    "UPDATE UserLogin SET lastLogin = GETDATE() WHERE userID = ?",
-                    (user[0]['userID'],),
-                    fetch=False
-                )
-
-                if user[0]['userRole'] == 'staff':
-                    details = execute_query(
-                        "SELECT staffName, staffRole, centerID FROM Staff WHERE staffID = ?",
-                        (session['linked_id'],)
-                    )
+                WHERE username = ? AND isActive = 1
+            """, (password, password, username))
+
+            valid, new_hash = check_login_password(user, password) if user else (False, None)
+            if valid:
+                if new_hash:
+                    execute_query("UPDATE UserLogin SET passwordHash = ?, plainPassword = NULL WHERE userID = ?",
+                                  (new_hash, user['userID']), fetch=False)
+
+                app.session_interface.regenerate(session)
+                session['user_id'] = user['userID']
+                session['username'] = user['username']
+                session['user_role'] = user['userRole']
+                session['linked_id'] = user['staffID'] or user['doctorID']
+                last_logins.record(user['userID'])
+
+                if user['userRole'] == 'staff':
+                    details = next((s for s in reference_cache.get('Staff')
+                                    if s['staffID'] == user['staffID']), None)
                     if details:
-                        session['full_name'] = details[0]['staffName']
-                        session['role_title'] = details[0]['staffRole']
-                        session['center_id'] = details[0]['centerID']
-                elif user[0]['userRole'] == 'doctor':
-                    details = execute_query(
-                        "SELECT doctorName, specialization FROM Doctor WHERE doctorID = ?",
-                        (session['linked_id'],)
-                    )
+                        session['full_name'] = details['staffName']
+                        session['role_title'] = details['staffRole']
+                        session['center_id'] = details['centerID']
+                elif user['userRole'] == 'doctor':
+                    details = next((d for d in reference_cache.get('Doctor')
+                                    if d['doctorID'] == user['doctorID']), None)
                     if details:
-                        session['full_name'] = details[0]['doctorName']
-                        session['role_title'] = details[0]['specialization']
-                elif user[0]['userRole'] == 'admin':
+                        session['full_name'] = details['doctorName']
+                        session['role_title'] = details['specialization']
+                elif user['userRole'] == 'admin':
                     session['full_name'] = 'Administrator'
                     session['role_title'] = 'System Admin'
 
@@ -169,7 +1363,7 @@ def login():
                 flash('Invalid username or password!', 'danger')
 
         except Exception as e:
-            print(f"Login error: {e}")
+            log.exception('Login error')
             flash(f'Login error: {str(e)}', 'danger')
 
     return render_template('login.html')
@@ -179,53 +1373,203 @@ def login():
 def logout():
     """Logout user"""
     session.clear()
+    app.session_interface.regenerate(session)
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('login'))
 
 
+# ---------------------------------------------------------
+# BACKGROUND JOBS
+# ---------------------------------------------------------
+UNIT_SHELF_LIFE_DAYS = 90
+EXPIRY_SWEEP_INTERVAL = 15 * 60  # seconds
+EXPIRY_SWEEP_BATCH = 500
+
+
+class BackgroundJob:
+    """Runs func() every `interval` seconds on a daemon thread.
+
+    func returns the number of items it processed; run counts, durations and
+    processed totals are kept for /admin/stats.
+    """
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            'runs': 0,
+            'errors': 0,
+            'last_run_at': None,
+            'last_duration_seconds': None,
+            'total_duration_seconds': 0.0,
+            'last_processed': None,
+            'total_processed': 0,
+            'last_error': None,
+        }
+
+    def run_once(self):
+        started = time.perf_counter()
+        processed, error = None, None
+        try:
+            processed = self.func() or 0
+        except Exception as e:
+            error = str(e)
+            log.exception('Job %s failed', self.name)
+        duration = time.perf_counter() - started
+
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['last_run_at'] = datetime.now().isoformat(timespec='seconds')
+            self._stats['last_duration_seconds'] = round(duration, 4)
+            self._stats['total_duration_seconds'] += duration
+            if error is None:
+                self._stats['last_processed'] = processed
+                self._stats['total_processed'] += processed
+            else:
+                self._stats['errors'] += 1
+                self._stats['last_error'] = error
+        return processed
+
+    def _loop(self):
+        self.run_once()
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f'job-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'name': self.name, 'interval_seconds': self.interval,
+                      'running': bool(self._thread and self._thread.is_alive())})
+        return stats
+
+
+background_jobs = {}
+_jobs_started = False
+_jobs_start_lock = threading.Lock()
+
+
+def register_job(name, func, interval):
+    background_jobs[name] = BackgroundJob(name, func, interval)
+    return background_jobs[name]
+
+
+def start_background_jobs():
+    """Start every registered job; later calls in the same process do nothing"""
+    global _jobs_started
+    with _jobs_start_lock:
+        if _jobs_started:
+            return
+        _jobs_started = True
+    for job in background_jobs.values():
+        job.start()
+
+
+@app.before_request
+def start_jobs_with_first_request():
+    """Jobs run in the process that serves requests, however it was started
+    (python app.py, flask run, or a WSGI server's worker)."""
+    if not _jobs_started and not app.testing:
+        start_background_jobs()
+
+
+def sweep_expired_units(batch_size=EXPIRY_SWEEP_BATCH):
+    """Move stored units past their expiry date to 'expired', batch_size rows per statement.
+
+    Uses the (status, expiryDate) index, and keeps each transaction short so the
+    sweep never blocks fulfilment for long. Returns the number of units swept.
+    """
+    total = 0
+    while True:
+        swept = execute_query("""
+            UPDATE TOP (?) BloodUnit
+            SET status = 'expired', latestResult = 'Expired'
+            WHERE status = 'stored'
+              AND expiryDate <= CAST(GETDATE() AS DATE)
+        """, (batch_size,), fetch=False)
+        if not swept:
+            break
+        total += swept
+        if swept < batch_size:
+            break
+    if total:
+        dashboard_cache.invalidate()
+    return total
+
+
+register_job('expiry_sweeper', sweep_expired_units, EXPIRY_SWEEP_INTERVAL)
+register_job('last_login_flush', last_logins.flush, LAST_LOGIN_FLUSH_INTERVAL)
+
+
 # ---------------------------------------------------------
 # DASHBOARD
 # ---------------------------------------------------------
 
+def load_dashboard_data():
+    """Fetch every dashboard figure in a single batch (two result sets)"""
+    result_sets = execute_batch("""
+        SET NOCOUNT ON;
+
+        SELECT
+            (SELECT COUNT(*) FROM Donation WHERE donationDate = CAST(GETDATE() AS DATE)) AS DonationsToday,
+            (SELECT COUNT(*) FROM BloodRequest WHERE requestDate = CAST(GETDATE() AS DATE)) AS RequestsToday,
+            (SELECT COUNT(*) FROM Donor) AS donor_count,
+            (SELECT ISNULL(SUM(TotalUnits), 0) FROM v_InventorySummary WITH (NOEXPAND)) AS blood_count;
+
+        SELECT TOP 5 bu.bloodUnitID, bg.groupName, bu.expiryDate, c.bloodCenterName
+        FROM BloodUnit bu
+        JOIN BloodGroup bg ON bu.bgID = bg.bgID
+        JOIN BloodBankCenter c ON bu.centerID = c.centerID
+        WHERE bu.status = 'stored'
+          AND bu.expiryDate BETWEEN GETDATE() AND DATEADD(DAY, 7, GETDATE())
+        ORDER BY bu.expiryDate;
+    """)
+
+    if not result_sets or not result_sets[0]:
+        return None
+
+    counts = result_sets[0][0]
+    return {
+        'stats': {'DonationsToday': counts['DonationsToday'],
+                  'RequestsToday': counts['RequestsToday'],
+                  # index.html reads this name
+                  'RequestsReceivedToday': counts['RequestsToday']},
+        'd_count': counts['donor_count'],
+        'b_count': counts['blood_count'],
+        'alerts': result_sets[1] if len(result_sets) > 1 else [],
+    }
+
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
     """Main dashboard"""
     try:
-        stats = {}
-        today_stats = execute_query("""
-            SELECT
-                ISNULL((SELECT COUNT(*) FROM Donation WHERE CAST(donationDate AS DATE) = CAST(GETDATE() AS DATE)), 0) AS DonationsToday,
-                ISNULL((SELECT COUNT(*) FROM BloodRequest WHERE CAST(requestDate AS DATE) = CAST(GETDATE() AS DATE)), 0) AS RequestsToday
-        """)
-
-        if today_stats:
-            stats = today_stats[0]
-
-        donor_count = execute_query("SELECT COUNT(*) AS donor_count FROM Donor")
-        d_count = donor_count[0]['donor_count'] if donor_count else 0
-
-        blood_count = execute_query("SELECT COUNT(*) AS blood_count FROM BloodUnit WHERE status='stored'")
-        b_count = blood_count[0]['blood_count'] if blood_count else 0
-
-        alerts = execute_query("""
-            SELECT TOP 5 bu.bloodUnitID, bg.groupName, bu.expiryDate, c.bloodCenterName
-            FROM BloodUnit bu
-            JOIN BloodGroup bg ON bu.bgID = bg.bgID
-            JOIN BloodBankCenter c ON bu.centerID = c.centerID
-            WHERE bu.status = 'stored'
-              AND bu.expiryDate BETWEEN GETDATE() AND DATEADD(DAY, 7, GETDATE())
-            ORDER BY bu.expiryDate
-        """) or []
+        data = dashboard_cache.get_or_load('dashboard', load_dashboard_data)
+        if data is None:
+            data = {'stats': {}, 'd_count': 0, 'b_count': 0, 'alerts': []}
 
         return render_template('index.html',
-                               d_count=d_count,
-                               b_count=b_count,
-                               stats=stats,
-                               alerts=alerts)
+                               d_count=data['d_count'],
+                               b_count=data['b_count'],
+                               stats=data['stats'],
+                               alerts=data['alerts'])
 
     except Exception as e:
-        print(f"Dashboard error: {e}")
+        log.exception('Dashboard error')
         flash(f'Error loading dashboard: {str(e)}', 'danger')
         return render_template('index.html', d_count=0, b_count=0, stats={}, alerts=[])
 
@@ -234,12 +1578,38 @@ def dashboard():
 # INVENTORY
 # ---------------------------------------------------------
 
+def load_inventory_summary():
+    """Stored units per center and blood group from the v_InventorySummary indexed view.
+
+    The view holds one row per (center, group), so this never touches BloodUnit;
+    names come from the reference cache.
+    """
+    rows = execute_query("""
+        SELECT centerID, bgID, TotalUnits
+        FROM v_InventorySummary WITH (NOEXPAND)
+    """)
+    if rows is None:
+        return None
+
+    centers = {c['centerID']: c['bloodCenterName'] for c in reference_cache.get('BloodBankCenter')}
+    groups = {g['bgID']: g['groupName'] for g in reference_cache.get('BloodGroup')}
+    summary = [{
+        'centerID': row['centerID'],
+        'bgID': row['bgID'],
+        'bloodCenterName': centers.get(row['centerID'], f"Center {row['centerID']}"),
+        'BloodGroup': groups.get(row['bgID'], '?'),
+        'TotalUnits': int(row['TotalUnits']),
+    } for row in rows]
+    summary.sort(key=lambda row: (row['bloodCenterName'], row['BloodGroup']))
+    return summary
+
+
 @app.route('/inventory')
 @login_required
 def inventory():
     """Live blood inventory"""
     try:
-        inventory_data = execute_query("SELECT * FROM v_LiveInventory ORDER BY bloodCenterName, BloodGroup")
+        inventory_data = load_inventory_summary()
         if not inventory_data:
             inventory_data = []
         return render_template('inventory.html', inventory=inventory_data)
@@ -248,10 +1618,260 @@ def inventory():
         return render_template('inventory.html', inventory=[])
 
 
+# ---------------------------------------------------------
+# DEMAND FORECASTING
+# ---------------------------------------------------------
+# When will each center run out of each blood group? The database aggregates
+# history per (center, group, day) and returns it in one batch; the projection
+# then runs on NumPy arrays of shape (pairs, days), so every center x group
+# pair is computed in a single pass however long the history is.
+#
+# Demand is units issued (DeliveryRecord -> BloodUnit.centerID), supply is
+# units stored (BloodUnit.storageDate), and stock is the stored units not yet
+# past expiryDate, which also gives the expiry schedule of current stock.
+FORECAST_HISTORY_DAYS = 3 * 365
+FORECAST_WINDOW_DAYS = 28            # rolling window for the daily demand/supply rates
+FORECAST_HORIZON_DAYS = 30
+FORECAST_HORIZON_MAX = UNIT_SHELF_LIFE_DAYS  # new supply cannot expire inside the horizon
+FORECAST_PEAK_PERCENTILE = 90        # "busy period" demand, from the rolling-window history
+FORECAST_CRITICAL_DAYS = 7
+FORECAST_CACHE_TTL = 10 * 60  # seconds
+
+forecast_cache = TTLCache(FORECAST_CACHE_TTL)
+
+FORECAST_HISTORY_QUERY = """
+    SELECT bu.centerID, bu.bgID, dr.deliveryDate AS day, COUNT(*) AS units
+    FROM DeliveryRecord dr
+    JOIN BloodUnit bu ON dr.bloodUnitID = bu.bloodUnitID
+    WHERE dr.deliveryDate BETWEEN ? AND ?
+    GROUP BY bu.centerID, bu.bgID, dr.deliveryDate;
+
+    SELECT centerID, bgID, storageDate AS day, COUNT(*) AS units
+    FROM BloodUnit
+    WHERE storageDate BETWEEN ? AND ?
+    GROUP BY centerID, bgID, storageDate;
+
+    SELECT centerID, bgID, expiryDate AS day, COUNT(*) AS units
+    FROM BloodUnit
+    WHERE status = 'stored' AND expiryDate > ?
+    GROUP BY centerID, bgID, expiryDate;
+"""
+
+
+def project_stock(demand, supply, expiring, stock, window, horizon):
+    """Project stock for every pair at once.
+
+    demand, supply: (pairs, history_days) daily units, last column = today.
+    expiring: (pairs, horizon) units of current stock expiring on each future day.
+    stock: (pairs,) units in stock today.
+
+    Consumption follows FEFO, so current stock is used oldest-first and only
+    the part not consumed before its expiry date is lost. Returns a dict of
+    (pairs,) arrays; days-to-stockout is 0 where stock lasts the horizon.
+    """
+    pairs, history_days = demand.shape
+    window = max(1, min(window, history_days))
+    demand_rate = demand[:, -window:].mean(axis=1)
+    supply_rate = supply[:, -window:].mean(axis=1)
+
+    # Rolling window means over the whole history via one cumulative sum
+    running = np.concatenate([np.zeros((pairs, 1)), np.cumsum(demand, axis=1)], axis=1)
+    rolling = (running[:, window:] - running[:, :-window]) / window
+    peak_rate = np.maximum(np.percentile(rolling, FORECAST_PEAK_PERCENTILE, axis=1), demand_rate)
+
+    days = np.arange(1, horizon + 1)
+    expired = np.cumsum(expiring, axis=1)
+
+    def run(rate):
+        consumed = rate[:, None] * days
+        wasted = np.maximum.accumulate(np.maximum(expired - consumed, 0), axis=1)
+        projected = stock[:, None] + supply_rate[:, None] * days - consumed - wasted
+        out = projected <= 0
+        return projected, wasted, np.where(out.any(axis=1), out.argmax(axis=1) + 1, 0)
+
+    projected, wasted, stockout = run(demand_rate)
+    _, _, peak_stockout = run(peak_rate)
+    return {
+        'demand_rate': demand_rate,
+        'peak_demand_rate': peak_rate,
+        'supply_rate': supply_rate,
+        'expiring': expired[:, -1],
+        'projected_waste': wasted[:, -1],
+        'projected_stock': np.maximum(projected[:, -1], 0),
+        'days_to_stockout': stockout,
+        'days_to_stockout_peak': peak_stockout,
+    }
+
+
+def load_forecast(window=FORECAST_WINDOW_DAYS, horizon=FORECAST_HORIZON_DAYS):
+    """Stock projection per center and blood group, most urgent first"""
+    today = date.today()
+    start = today - timedelta(days=FORECAST_HISTORY_DAYS - 1)
+    result_sets = execute_batch(FORECAST_HISTORY_QUERY, (start, today, start, today, today))
+    if result_sets is None or len(result_sets) != 3:
+        return None
+    demand_rows, supply_rows, expiry_rows = result_sets
+
+    centers = reference_cache.get('BloodBankCenter')
+    groups = reference_cache.get('BloodGroup')
+    pairs = [(c, g) for c in centers for g in groups]
+    pair_index = {(c['centerID'], g['bgID']): i for i, (c, g) in enumerate(pairs)}
+
+    def cells(rows, origin):
+        """(pair, day offset from origin, units) columns for rows of known pairs"""
+        found = [(pair_index[row['centerID'], row['bgID']], (row['day'] - origin).days, row['units'])
+                 for row in rows if (row['centerID'], row['bgID']) in pair_index]
+        return np.array(found, dtype=np.int64).reshape(-1, 3).T
+
+    def scatter(rows, origin, days):
+        """Sum each row's units into a (pairs, days) matrix at (pair, day - origin)"""
+        matrix = np.zeros((len(pairs), days))
+        p, d, units = cells(rows, origin)
+        inside = (d >= 0) & (d < days)
+        np.add.at(matrix, (p[inside], d[inside]), units[inside])
+        return matrix
+
+    tomorrow = today + timedelta(days=1)
+    demand = scatter(demand_rows, start, FORECAST_HISTORY_DAYS)
+    supply = scatter(supply_rows, start, FORECAST_HISTORY_DAYS)
+    expiring = scatter(expiry_rows, tomorrow, horizon)
+    p, _, units = cells(expiry_rows, tomorrow)
+    stock = np.bincount(p, weights=units, minlength=len(pairs))
+
+    projection = project_stock(demand, supply, expiring, stock, window, horizon)
+    active = (stock > 0) | (demand.sum(axis=1) > 0) | (supply.sum(axis=1) > 0)
+
+    forecast = []
+    for i in np.flatnonzero(active):
+        center, group = pairs[i]
+        days_left = int(projection['days_to_stockout'][i]) or None
+        days_left_peak = int(projection['days_to_stockout_peak'][i]) or None
+        if days_left and days_left <= FORECAST_CRITICAL_DAYS:
+            risk = 'critical'
+        elif days_left or days_left_peak:
+            risk = 'warning'
+        else:
+            risk = 'ok'
+        forecast.append({
+            'centerID': center['centerID'],
+            'bloodCenterName': center['bloodCenterName'],
+            'bgID': group['bgID'],
+            'BloodGroup': group['groupName'],
+            'stock': int(stock[i]),
+            'demand_per_day': round(float(projection['demand_rate'][i]), 2),
+            'peak_demand_per_day': round(float(projection['peak_demand_rate'][i]), 2),
+            'supply_per_day': round(float(projection['supply_rate'][i]), 2),
+            'expiring': int(projection['expiring'][i]),
+            'projected_waste': round(float(projection['projected_waste'][i]), 1),
+            'projected_stock': round(float(projection['projected_stock'][i]), 1),
+            'days_to_stockout': days_left,
+            'stockout_date': today + timedelta(days=days_left) if days_left else None,
+            'days_to_stockout_peak': days_left_peak,
+            'risk': risk,
+        })
+    forecast.sort(key=lambda row: (row['days_to_stockout'] or horizon + 1,
+                                   row['days_to_stockout_peak'] or horizon + 1,
+                                   row['bloodCenterName'], row['BloodGroup']))
+    return forecast
+
+
+def forecast_args():
+    """?window= and ?horizon= clamped to sane bounds"""
+    window = request.args.get('window', FORECAST_WINDOW_DAYS, type=int)
+    horizon = request.args.get('horizon', FORECAST_HORIZON_DAYS, type=int)
+    return min(max(window, 7), 365), min(max(horizon, 1), FORECAST_HORIZON_MAX)
+
+
+def cached_forecast(window, horizon):
+    return forecast_cache.get_or_load((window, horizon), lambda: load_forecast(window, horizon))
+
+
+@app.route('/forecast')
+@login_required
+def forecast():
+    """Projected stockouts per center and blood group"""
+    window, horizon = forecast_args()
+    try:
+        rows = cached_forecast(window, horizon)
+        if rows is None:
+            flash('Could not load the forecast data.', 'danger')
+            rows = []
+        return render_template('forecast.html', forecast=rows, window=window, horizon=horizon,
+                               critical_days=FORECAST_CRITICAL_DAYS)
+    except Exception as e:
+        flash(f'Error building forecast: {str(e)}', 'danger')
+        return render_template('forecast.html', forecast=[], window=window, horizon=horizon,
+                               critical_days=FORECAST_CRITICAL_DAYS)
+
+
+@app.route('/api/forecast')
+@login_required
+def api_forecast():
+    window, horizon = forecast_args()
+    try:
+        rows = cached_forecast(window, horizon)
+    except Exception as e:
+        log.exception('Forecast failed')
+        return jsonify(error=f'Error building forecast: {e}'), 500
+    if rows is None:
+        return jsonify(error='Forecast data unavailable'), 503
+    return jsonify(window=window, horizon=horizon, forecast=rows)
+
+
 # ---------------------------------------------------------
 # DONOR MANAGEMENT
 # ---------------------------------------------------------
 
+DONOR_PAGE_SIZE = 50
+DONOR_PAGE_SIZE_MAX = 200
+
+
+def page_size_arg(default=DONOR_PAGE_SIZE, maximum=DONOR_PAGE_SIZE_MAX):
+    """Read ?page_size= and clamp it to 1..maximum"""
+    size = request.args.get('page_size', default, type=int) or default
+    return max(1, min(size, maximum))
+
+
+def fetch_donor_page(search_term='', after_id=None, page_size=DONOR_PAGE_SIZE):
+    """One page of donors, newest first, keyset-paginated on donorID.
+
+    Returns (rows, next_after) where next_after is the donorID to pass as
+    `after_id` for the following page, or None on the last page.
+    """
+    conditions = []
+    params = [page_size + 1]
+    if after_id:
+        conditions.append("d.donorID < ?")
+        params.append(after_id)
+    if search_term:
+        matched_ids = donor_search.search(search_term, before=after_id, limit=page_size + 1)
+        if matched_ids is not None:
+            # The index already ordered the IDs; read only this page's rows by key
+            if not matched_ids:
+                return [], None
+            conditions = [f"d.donorID IN ({', '.join('?' * len(matched_ids))})"]
+            params = [page_size + 1] + matched_ids
+        else:
+            # Index unavailable - fall back to scanning
+            conditions.append("(d.contactNo LIKE ? OR d.donorEmail LIKE ? OR d.name LIKE ?)")
+            params.extend([f'%{search_term}%'] * 3)
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+    rows = execute_query(f"""
+        SELECT TOP (?) d.donorID, d.name, d.contactNo, d.donorEmail, bg.groupName, d.address, d.lastDonationDate
+        FROM Donor d
+        JOIN BloodGroup bg ON d.bgID = bg.bgID
+        {where}
+        ORDER BY d.donorID DESC
+    """, params) or []
+
+    next_after = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_after = rows[-1]['donorID']
+    return rows, next_after
+
+
 @app.route('/donors', methods=['GET', 'POST'])
 @login_required
 def donors():
@@ -259,89 +1879,199 @@ def donors():
     try:
         if request.method == 'POST':
             search_term = request.form.get('phone', '').strip()
-            if search_term:
-                donors_data = execute_query("""
-                    SELECT d.donorID, d.name, d.contactNo, d.donorEmail, bg.groupName, d.address, d.lastDonationDate
-                    FROM Donor d
-                    JOIN BloodGroup bg ON d.bgID = bg.bgID
-                    WHERE d.contactNo LIKE ?
-                       OR d.donorEmail LIKE ?
-                       OR d.name LIKE ?
-                    ORDER BY d.donorID DESC
-                """, (f'%{search_term}%', f'%{search_term}%', f'%{search_term}%'))
-            else:
-                donors_data = execute_query("""
-                    SELECT TOP 50 d.donorID, d.name, d.contactNo, d.donorEmail, bg.groupName, d.address, d.lastDonationDate
-                    FROM Donor d
-                    JOIN BloodGroup bg ON d.bgID = bg.bgID
-                    ORDER BY d.donorID DESC
-                """)
         else:
-            donors_data = execute_query("""
-                SELECT TOP 50 d.donorID, d.name, d.contactNo, d.donorEmail, bg.groupName, d.address, d.lastDonationDate
-                FROM Donor d
-                JOIN BloodGroup bg ON d.bgID = bg.bgID
-                ORDER BY d.donorID DESC
-            """)
+            search_term = request.args.get('q', '').strip()
+        after_id = request.args.get('after', type=int)
+        page_size = page_size_arg()
 
-        if not donors_data:
-            donors_data = []
+        donors_data, next_after = fetch_donor_page(search_term, after_id, page_size)
 
-        return render_template('donors.html', donors=donors_data)
+        return render_template('donors.html',
+                               donors=donors_data,
+                               search_term=search_term,
+                               page_size=page_size,
+                               next_after=next_after)
 
     except Exception as e:
         flash(f'Error loading donors: {str(e)}', 'danger')
         return render_template('donors.html', donors=[])
 
 
+@app.route('/api/donors')
+@login_required
+def api_donors():
+    """JSON page of donors for infinite scroll: ?q=&after=&page_size="""
+    search_term = request.args.get('q', '').strip()
+    after_id = request.args.get('after', type=int)
+    page_size = page_size_arg()
+
+    donors_data, next_after = fetch_donor_page(search_term, after_id, page_size)
+    return jsonify({'donors': donors_data,
+                    'next_after': next_after,
+                    'page_size': page_size})
+
+
+DONOR_PROFILE_CACHE_SIZE = 2000
+DONOR_PROFILE_CACHE_TTL = 10 * 60  # seconds - bounds staleness from writes made outside the app
+
+ELIGIBLE_DONORS_MAX = 500
+ELIGIBILITY_BATCH_SIZE = 50000
+
+# Donor row + donation history, keyed by donorID. add_donation and the
+# donation import invalidate entries (trg_UpdateLastDonation moves
+# lastDonationDate on every Donation insert); eligibility is derived from
+# nextEligibleDate on each read, so a cached profile never serves a stale status.
+donor_profiles = LRUCache(DONOR_PROFILE_CACHE_SIZE, ttl=DONOR_PROFILE_CACHE_TTL)
+
+
+# Eligibility: Donor.nextEligibleDate (migration 0006) is lastDonationDate +
+# 90 days, or 1900-01-01 for first-time donors, so a donor is eligible on a
+# day exactly when nextEligibleDate <= that day.
+def days_until_eligible(donor, today=None):
+    return max(0, (donor['nextEligibleDate'] - (today or date.today())).days)
+
+
+def eligibility_status(donor, today=None):
+    """The 90-day rule, worded as donor_detail shows it"""
+    wait = days_until_eligible(donor, today)
+    return 'Eligible' if wait == 0 else f'Not Eligible - Wait {wait} days'
+
+
+def find_eligible_donors(bg_ids, city=None, on_date=None, limit=ELIGIBLE_DONORS_MAX, not_recalled_since=None):
+    """Donors of the given groups (optionally in one city) eligible on on_date,
+    longest-waiting first - a range scan on IX_Donor_Group_City_NextEligible.
+    not_recalled_since leaves out donors sent a recall since then."""
+    params = list(bg_ids)
+    city_filter = recall_filter = ''
+    if city:
+        city_filter = 'AND d.city = ?'
+        params.append(city)
+    params.append(on_date or date.today())
+    if not_recalled_since:
+        recall_filter = """AND NOT EXISTS (SELECT 1 FROM RecallNotification r
+                                           WHERE r.donorID = d.donorID AND r.status = 'sent'
+                                             AND r.sentAt >= ?)"""
+        params.append(not_recalled_since)
+    return execute_query(f"""
+        SELECT TOP (?) d.donorID, d.name, d.contactNo, d.donorEmail, d.city, d.bgID, bg.groupName,
+               d.lastDonationDate, d.nextEligibleDate
+        FROM Donor d
+        JOIN BloodGroup bg ON d.bgID = bg.bgID
+        WHERE d.bgID IN ({', '.join('?' * len(bg_ids))}) {city_filter}
+          AND d.nextEligibleDate <= ?
+          {recall_filter}
+        ORDER BY d.nextEligibleDate, d.donorID
+    """, [limit] + params)
+
+
+def iter_eligibility(on_date=None, bg_ids=None, batch_size=ELIGIBILITY_BATCH_SIZE):
+    """Stream eligibility for every donor (optionally of some groups) in NumPy batches.
+
+    Yields (donor_ids, bg_ids, days_until_eligible) int32 arrays per batch;
+    days <= 0 means eligible on on_date. Memory stays at one batch, so this
+    scales to millions of donors for recall campaigns.
+    """
+    group_filter = f"WHERE bgID IN ({', '.join('?' * len(bg_ids))})" if bg_ids else ''
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT donorID, bgID, DATEDIFF(DAY, ?, nextEligibleDate) AS daysUntil
+            FROM Donor {group_filter}
+        """, [on_date or date.today()] + list(bg_ids or []))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = np.array(rows, dtype=np.int32).reshape(-1, 3)
+            yield batch[:, 0], batch[:, 1], batch[:, 2]
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def eligibility_counts(on_date=None):
+    """Eligible and waiting donors per bgID, evaluated over the whole Donor table"""
+    eligible, waiting = {}, {}
+    for _, groups, days in iter_eligibility(on_date):
+        for counts, mask in ((eligible, days <= 0), (waiting, days > 0)):
+            ids, totals = np.unique(groups[mask], return_counts=True)
+            for bg_id, total in zip(ids.tolist(), totals.tolist()):
+                counts[bg_id] = counts.get(bg_id, 0) + total
+    return eligible, waiting
+
+
+def load_donor_profile(donor_id):
+    """Donor row and donation history in one round trip; None if there is no such donor"""
+    profile = donor_profiles.get(donor_id)
+    if profile is not None:
+        return profile
+
+    result_sets = execute_batch("""
+        SELECT d.*, bg.groupName, g.genderName
+        FROM Donor d
+        JOIN BloodGroup bg ON d.bgID = bg.bgID
+        JOIN GenderType g ON d.genderID = g.genderID
+        WHERE d.donorID = ?;
+
+        SELECT do.donationDate, do.amountINml, s.staffName AS CollectedBy
+        FROM Donation do
+        JOIN Staff s ON do.collectedByStaffID = s.staffID
+        WHERE do.donorID = ?
+        ORDER BY do.donationDate DESC;
+    """, (donor_id, donor_id))
+    if not result_sets or not result_sets[0]:
+        return None
+
+    profile = {'donor': result_sets[0][0], 'history': result_sets[1] if len(result_sets) > 1 else []}
+    donor_profiles.set(donor_id, profile)
+    return profile
+
+
 @app.route('/donor/<int:id>')
 @login_required
 def donor_detail(id):
     """Donor details page"""
     try:
-        donor_info = execute_query("""
-            SELECT d.*, bg.groupName, g.genderName,
-                   CASE 
-                       WHEN CHARINDEX(',', REVERSE(d.address)) > 0 
-                       THEN LTRIM(REVERSE(LEFT(REVERSE(d.address), CHARINDEX(',', REVERSE(d.address)) - 1)))
-                       ELSE d.address
-                   END AS city
-            FROM Donor d
-            JOIN BloodGroup bg ON d.bgID = bg.bgID
-            JOIN GenderType g ON d.genderID = g.genderID
-            WHERE donorID = ?
-        """, (id,))
+        profile = load_donor_profile(id)
 
-        if not donor_info:
+        if not profile:
             flash('Donor not found!', 'danger')
             return redirect(url_for('donors'))
 
-        eligibility = execute_query("""
-            SELECT
-                CASE
-                    WHEN lastDonationDate IS NULL THEN 'Eligible'
-                    WHEN DATEDIFF(DAY, lastDonationDate, GETDATE()) >= 90 THEN 'Eligible'
-                    ELSE 'Not Eligible - Wait ' + CAST(90 - DATEDIFF(DAY, lastDonationDate, GETDATE()) AS VARCHAR) + ' days'
-                END AS EligibilityStatus
-            FROM Donor
-            WHERE donorID = ?
-        """, (id,))
-
-        status = eligibility[0]['EligibilityStatus'] if eligibility else 'Unknown'
-
-        history = execute_query("""
-            SELECT do.donationDate, do.amountINml, s.staffName AS CollectedBy
-            FROM Donation do
-            JOIN Staff s ON do.collectedByStaffID = s.staffID
-            WHERE do.donorID = ?
-            ORDER BY do.donationDate DESC
-        """, (id,)) or []
-
-        return render_template('donor_detail.html', donor=donor_info[0], status=status, history=history)
+        donor = profile['donor']
+        return render_template('donor_detail.html', donor=donor,
+                               status=eligibility_status(donor),
+                               history=profile['history'])
 
     except Exception as e:
         flash(f'Error loading donor details: {str(e)}', 'danger')
         return redirect(url_for('donors'))
+
+
+@app.route('/api/eligible_donors')
+@login_required
+def api_eligible_donors():
+    """Eligible donors: ?group=A%2B (name or bgID) [&city=] [&date=YYYY-MM-DD]
+    [&compatible=1 for every group the recipient group can receive] [&limit=]"""
+    groups = reference_cache.get('BloodGroup')
+    group = request.args.get('group', '').strip()
+    bg_id = next((g['bgID'] for g in groups if group in (g['groupName'], str(g['bgID']))), None)
+    if bg_id is None:
+        return jsonify(error='Unknown blood group'), 400
+    try:
+        on_date = _parse_date(request.args['date'], 'date') if request.args.get('date') else date.today()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    bg_ids = compatible_bg_ids(bg_id) if request.args.get('compatible') == '1' else [bg_id]
+    limit = min(max(request.args.get('limit', 100, type=int), 1), ELIGIBLE_DONORS_MAX)
+    donors_data = find_eligible_donors(bg_ids, request.args.get('city', '').strip() or None, on_date, limit)
+    if donors_data is None:
+        return jsonify(error='Donor lookup failed'), 503
+    return jsonify(date=on_date, donors=donors_data)
+
+
 @app.route('/add_donor', methods=['GET', 'POST'])
 @login_required
 def add_donor():
@@ -367,8 +2097,8 @@ def add_donor():
 
     # GET request - load form data
     try:
-        bgs = execute_query("SELECT * FROM BloodGroup") or []
-        genders = execute_query("SELECT * FROM GenderType") or []
+        bgs = reference_cache.get('BloodGroup')
+        genders = reference_cache.get('GenderType')
         return render_template('add_donor.html', bgs=bgs, genders=genders)
     except Exception as e:
         flash(f'Error loading form data: {str(e)}', 'danger')
@@ -389,6 +2119,7 @@ def donor_screening():
         admit = request.form.get('admit')
 
         if admit == 'yes':
+            conn = None
             try:
                 # Register the donor
                 full_address = f"{donor['address']}, {donor['city']}"
@@ -398,16 +2129,18 @@ def donor_screening():
 
                 # Insert donor
                 cursor.execute("""
-                    INSERT INTO Donor (name, dateOfBirth, genderID, bgID, contactNo, donorEmail, address, lastDonationDate)
+                    INSERT INTO Donor (name, dateOfBirth, genderID, bgID, contactNo, donorEmail, address, city,
+                                       lastDonationDate)
                     OUTPUT INSERTED.donorID
-                    VALUES (?, ?, ?, ?, ?, ?, ?, NULL)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)
                 """, (donor['name'], donor['dob'], donor['gender'], donor['bg'],
-                      donor['contact'], donor['email'], full_address))
+                      donor['contact'], donor['email'], full_address, donor['city']))
 
                 donor_id = cursor.fetchone()[0]
                 conn.commit()
                 cursor.close()
                 conn.close()
+                donor_search.add(donor_id, donor['name'], donor['contact'], donor['email'])
 
                 # Store donor_id for donation prompt
                 session['new_donor_id'] = donor_id
@@ -426,6 +2159,9 @@ def donor_screening():
                                        donor=donor,
                                        success=False,
                                        message=f'❌ Registration failed: {str(e)}')
+            finally:
+                if conn:
+                    conn.close()
         else:
             # Clear session
             session.pop('pending_donor', None)
@@ -463,72 +2199,71 @@ def donation_prompt():
     return render_template('donation_prompt.html', donor_name=donor_name)
 
 
+def record_donations(cursor, donations):
+    """Insert donations and their blood units in one round trip through
+    sp_RecordDonations (migration 0008). `donations` are (donorID,
+    donationTypeID, donationDate, amountINml, staffID, centerID) tuples.
+    Returns [(donationID, bloodUnitID)] in the same order; the caller commits.
+    """
+    if not donations:
+        return []
+    cursor.execute("{CALL sp_RecordDonations (?, ?)}",
+                   ([(row_no, *donation) for row_no, donation in enumerate(donations)], UNIT_SHELF_LIFE_DAYS))
+    return [(donation_id, unit_id) for _, donation_id, unit_id in cursor.fetchall()]
+
+
 @app.route('/add_donation/<int:donor_id>', methods=['GET', 'POST'])
 @login_required
 def add_donation(donor_id):
     """Add donation for a donor"""
     try:
         # Get donor info
-        donor_info = execute_query("""
+        donor = first("""
             SELECT d.*, bg.groupName
             FROM Donor d
             JOIN BloodGroup bg ON d.bgID = bg.bgID
             WHERE d.donorID = ?
         """, (donor_id,))
 
-        if not donor_info:
+        if not donor:
             flash('Donor not found!', 'danger')
             return redirect(url_for('donors'))
 
-        donor = donor_info[0]
-
         if request.method == 'POST':
+            conn = None
             try:
-                amount = request.form['amount']
-                donation_type = request.form['donation_type']
-                center_id = request.form['center_id']
-                staff_id = request.form['staff_id']
-                donation_date = request.form.get('donation_date', date.today())
+                amount = float(request.form['amount'])
+                donation_type = int(request.form['donation_type'])
+                center_id = int(request.form['center_id'])
+                staff_id = int(request.form['staff_id'])
+                donation_date = request.form.get('donation_date')
+                donation_date = _parse_date(donation_date, 'donation_date') if donation_date else date.today()
 
                 conn = get_db_connection()
                 cursor = conn.cursor()
-
-                # FIXED: Insert donation WITHOUT OUTPUT clause to avoid trigger conflict
-                cursor.execute("""
-                    INSERT INTO Donation (donorID, screeningID, donationTypeID, donationDate, amountINml, collectedByStaffID)
-                    VALUES (?, NULL, ?, ?, ?, ?)
-                """, (donor_id, donation_type, donation_date, amount, staff_id))
-
-                # Get the last inserted donation ID
-                cursor.execute("SELECT @@IDENTITY AS donationID")
-                result = cursor.fetchone()
-                donation_id = int(result[0])
-
-                # Create blood unit
-                expiry_date = datetime.strptime(str(donation_date), '%Y-%m-%d') + timedelta(days=90)
-
-                cursor.execute("""
-                    INSERT INTO BloodUnit (donationID, bgID, centerID, storageDate, expiryDate, latestResult, status)
-                    VALUES (?, ?, ?, ?, ?, 'Clear', 'stored')
-                """, (donation_id, donor['bgID'], center_id, donation_date, expiry_date))
-
+                record_donations(cursor, [(donor_id, donation_type, donation_date, amount, staff_id, center_id)])
                 conn.commit()
                 cursor.close()
                 conn.close()
+                dashboard_cache.invalidate()
+                donor_profiles.invalidate(donor_id)
 
-                flash(f'✅ Donation of {amount}ml recorded successfully!', 'success')
+                flash(f'✅ Donation of {amount:g}ml recorded successfully!', 'success')
                 return redirect(url_for('donors'))
 
             except Exception as e:
                 if conn:
                     conn.rollback()
                 flash(f'Error recording donation: {str(e)}', 'danger')
-                print(f"Donation error: {e}")
+                log.exception('Donation error')
+            finally:
+                if conn:
+                    conn.close()
 
         # GET request - load form data
-        centers = execute_query("SELECT centerID, bloodCenterName FROM BloodBankCenter") or []
-        staff = execute_query("SELECT staffID, staffName FROM Staff") or []
-        donation_types = execute_query("SELECT donationTypeID, donationTypeName FROM DonationType") or []
+        centers = reference_cache.get('BloodBankCenter')
+        staff = reference_cache.get('Staff')
+        donation_types = reference_cache.get('DonationType')
 
         return render_template('add_donation.html',
                                donor=donor,
@@ -557,43 +2292,25 @@ def direct_donation():
 
         try:
             # Check if donor exists
-            donor_info = execute_query("""
+            donor = first("""
                 SELECT d.*, bg.groupName
                 FROM Donor d
                 JOIN BloodGroup bg ON d.bgID = bg.bgID
                 WHERE d.donorEmail = ?
             """, (email,))
 
-            if not donor_info:
+            if not donor:
                 flash('❌ Email not found! Please register as a new donor first.', 'danger')
                 return render_template('direct_donation.html')
-
-            donor = donor_info[0]
             donor_id = donor['donorID']
 
-            # Check eligibility (90-day rule)
-            eligibility = execute_query("""
-                SELECT
-                    lastDonationDate,
-                    CASE
-                        WHEN lastDonationDate IS NULL THEN 1
-                        WHEN DATEDIFF(DAY, lastDonationDate, GETDATE()) >= 90 THEN 1
-                        ELSE 0
-                    END AS IsEligible,
-                    CASE
-                        WHEN lastDonationDate IS NULL THEN 'Eligible - First time donation'
-                        WHEN DATEDIFF(DAY, lastDonationDate, GETDATE()) >= 90 THEN 'Eligible for donation'
-                        ELSE CAST(90 - DATEDIFF(DAY, lastDonationDate, GETDATE()) AS VARCHAR) + ' days remaining'
-                    END AS StatusMessage
-                FROM Donor
-                WHERE donorID = ?
-            """, (donor_id,))
-
-            if eligibility and eligibility[0]['IsEligible'] == 1:
+            # Check eligibility (90-day rule) from the persisted nextEligibleDate
+            wait = days_until_eligible(donor)
+            if wait == 0:
                 # Eligible - redirect to donation form
                 return redirect(url_for('add_donation', donor_id=donor_id))
             else:
-                status_msg = eligibility[0]['StatusMessage'] if eligibility else 'Unknown eligibility status'
+                status_msg = f'{wait} days remaining'
                 flash(f'❌ Not eligible for donation: {status_msg}', 'warning')
                 return render_template('direct_donation.html',
                                        donor=donor,
@@ -625,10 +2342,11 @@ def requests_list():
             JOIN BloodGroup bg ON br.bgID_Requested = bg.bgID
             ORDER BY CASE WHEN br.requestStatus = 'pending' THEN 0 ELSE 1 END, br.requestDate DESC
         """) or []
-        return render_template('requests.html', requests=requests_data)
+        return render_template('requests.html', requests=requests_data,
+                               staff_list=reference_cache.get('Staff'))
     except Exception as e:
         flash(f'Error loading requests: {str(e)}', 'danger')
-        return render_template('requests.html', requests=[])
+        return render_template('requests.html', requests=[], staff_list=[])
 
 
 @app.route('/new_request', methods=['GET', 'POST'])
@@ -651,6 +2369,7 @@ def new_request():
             """, (hospital, doctor, patient, bg, units, urgency), fetch=False)
 
             if result:
+                dashboard_cache.invalidate()
                 flash('Blood Request Submitted!', 'success')
                 return redirect(url_for('requests_list'))
             else:
@@ -660,10 +2379,10 @@ def new_request():
             flash(f'Error: {str(e)}', 'danger')
 
     try:
-        hospitals = execute_query("SELECT hospitalID, hospitalName FROM Hospital") or []
-        doctors = execute_query("SELECT doctorID, doctorName FROM Doctor") or []
-        patients = execute_query("SELECT patientID, patientName FROM Patient") or []
-        bgs = execute_query("SELECT * FROM BloodGroup") or []
+        hospitals = reference_cache.get('Hospital')
+        doctors = reference_cache.get('Doctor')
+        patients = reference_cache.get('Patient')
+        bgs = reference_cache.get('BloodGroup')
 
         return render_template('new_request.html',
                                hospitals=hospitals,
@@ -679,74 +2398,331 @@ def new_request():
                                bgs=[])
 
 
-@app.route('/fulfill/<int:req_id>', methods=['GET', 'POST'])
-@login_required
-def fulfill_request(req_id):
-    """Fulfill blood request"""
+# ---------------------------------------------------------
+# UNIT ALLOCATION
+# ---------------------------------------------------------
+# Red cell compatibility: recipient group -> donor groups it can receive,
+# identical group first so ties on expiry keep universal units in stock.
+RBC_COMPATIBILITY = {
+    'O-': ['O-'],
+    'O+': ['O+', 'O-'],
+    'A-': ['A-', 'O-'],
+    'A+': ['A+', 'A-', 'O+', 'O-'],
+    'B-': ['B-', 'O-'],
+    'B+': ['B+', 'B-', 'O+', 'O-'],
+    'AB-': ['AB-', 'A-', 'B-', 'O-'],
+    'AB+': ['AB+', 'AB-', 'A+', 'A-', 'B+', 'B-', 'O+', 'O-'],
+}
+URGENCY_ORDER = {'High': 0, 'Medium': 1, 'Low': 2}
+
+
+class AllocationError(Exception):
+    """Raised when a request cannot be fully allocated or a unit was taken concurrently"""
+
+
+def compatible_bg_ids(recipient_bg_id):
+    """bgIDs whose red cells the recipient group can receive, preferred first"""
+    groups = reference_cache.get('BloodGroup')
+    names = {g['bgID']: g['groupName'] for g in groups}
+    ids = {g['groupName']: g['bgID'] for g in groups}
+    recipient = names.get(recipient_bg_id)
+    return [ids[name] for name in RBC_COMPATIBILITY.get(recipient, [recipient]) if name in ids] \
+        or [recipient_bg_id]
+
+
+class UnitAllocator:
+    """First-expiry-first-out allocator over an in-memory snapshot of stored units.
+
+    One min-heap per blood group keyed on expiry; picking a unit for a request
+    compares at most eight heap heads, so allocation is O(units * log n).
+    """
+
+    def __init__(self, units):
+        """units: iterable of (bloodUnitID, groupName, expiryDate, centerID)"""
+        self._heaps = {}
+        for unit_id, group, expiry, center_id in units:
+            self._heaps.setdefault(group, []).append((expiry, unit_id, center_id))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+    def available(self, group=None):
+        if group is None:
+            return sum(len(heap) for heap in self._heaps.values())
+        return len(self._heaps.get(group, ()))
+
+    def allocate(self, recipient_group, count):
+        """Take `count` compatible units, soonest expiry first, or none at all"""
+        donors = RBC_COMPATIBILITY.get(recipient_group, [recipient_group])
+        picked = []
+        while len(picked) < count:
+            best = None
+            for rank, group in enumerate(donors):
+                heap = self._heaps.get(group)
+                if heap and (best is None or (heap[0][0], rank) < best[0]):
+                    best = ((heap[0][0], rank), group)
+            if best is None:
+                break
+            group = best[1]
+            picked.append((group, heapq.heappop(self._heaps[group])))
+
+        if len(picked) < count:
+            for group, entry in picked:
+                heapq.heappush(self._heaps[group], entry)
+            return []
+        return [{'bloodUnitID': unit_id, 'groupName': group, 'expiryDate': expiry, 'centerID': center_id}
+                for group, (expiry, unit_id, center_id) in picked]
+
+    def allocate_queue(self, requests):
+        """Allocate pending requests by urgency, then age.
+
+        requests: dicts with bloodRequestID, groupName, requiredUnits, urgency, requestDate.
+        Returns (allocations, unfilled) where allocations is [(request, units)].
+        """
+        ordered = sorted(requests, key=lambda r: (URGENCY_ORDER.get(r['urgency'], len(URGENCY_ORDER)),
+                                                  r['requestDate'] or date.min,
+                                                  r['bloodRequestID']))
+        allocations, unfilled = [], []
+        for req in ordered:
+            units = self.allocate(req['groupName'], req['requiredUnits'])
+            if units:
+                allocations.append((req, units))
+            else:
+                unfilled.append(req)
+        return allocations, unfilled
+
+
+def commit_allocation(conn, req_id, unit_ids, staff_id):
+    """Mark units used, record deliveries and close the request in one transaction.
+
+    The conditional updates make a concurrent allocation of the same unit or
+    request fail with AllocationError instead of issuing it twice.
+    """
+    cursor = conn.cursor()
     try:
-        req_data = execute_query("""
-            SELECT br.*, bg.groupName as BGName
-            FROM BloodRequest br
-            JOIN BloodGroup bg ON br.bgID_Requested = bg.bgID
-            WHERE bloodRequestID = ?
+        placeholders = ', '.join('?' * len(unit_ids))
+        cursor.execute(f"""
+            UPDATE BloodUnit SET status = 'used'
+            WHERE status = 'stored' AND bloodUnitID IN ({placeholders})
+        """, list(unit_ids))
+        if cursor.rowcount != len(unit_ids):
+            raise AllocationError(f"Unit{'s' if len(unit_ids) > 1 else ''} "
+                                  f"#{', #'.join(map(str, unit_ids))} already issued by another operator")
+
+        values = ', '.join("(?, ?, ?, ?, 'cold chain maintained')" for _ in unit_ids)
+        params = []
+        today = date.today()
+        for unit_id in unit_ids:
+            params.extend((req_id, unit_id, today, staff_id))
+        cursor.execute(f"""
+            INSERT INTO DeliveryRecord (bloodRequestID, bloodUnitID, deliveryDate, deliveredByStaffID, bloodCondition)
+            VALUES {values}
+        """, params)
+
+        cursor.execute("""
+            UPDATE BloodRequest SET requestStatus = 'delivered'
+            WHERE bloodRequestID = ? AND requestStatus = 'pending'
         """, (req_id,))
+        if cursor.rowcount != 1:
+            raise AllocationError(f'Request #{req_id} is no longer pending')
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
 
-        if not req_data:
-            flash('Request not found!', 'danger')
-            return redirect(url_for('requests_list'))
 
-        current_request = req_data[0]
+def allocate_request(req_id, staff_id):
+    """Reserve every unit a request needs, FEFO across centers and compatible groups.
 
-        if request.method == 'POST':
-            unit_id = request.form['unit_id']
-            staff_id = request.form['staff_id']
+    Candidate rows are read with UPDLOCK/READPAST so two operators allocating at
+    once get different units. Returns the allocated unit IDs.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT bgID_Requested, requiredUnits, requestStatus
+            FROM BloodRequest WITH (UPDLOCK)
+            WHERE bloodRequestID = ?
+        """, (req_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise AllocationError(f'Request #{req_id} not found')
+        bg_id, required, status = row
+        if status != 'pending':
+            raise AllocationError(f'Request #{req_id} is already {status}')
+
+        bg_ids = compatible_bg_ids(bg_id)
+        cursor.execute(f"""
+            SELECT TOP (?) bloodUnitID
+            FROM BloodUnit WITH (UPDLOCK, READPAST, ROWLOCK)
+            WHERE status = 'stored'
+              AND expiryDate > GETDATE()
+              AND bgID IN ({', '.join('?' * len(bg_ids))})
+            ORDER BY expiryDate, CASE WHEN bgID = ? THEN 0 ELSE 1 END
+        """, [required] + bg_ids + [bg_id])
+        unit_ids = [r[0] for r in cursor.fetchall()]
+        cursor.close()
+        if len(unit_ids) < required:
+            conn.rollback()
+            raise AllocationError(f'Only {len(unit_ids)} of {required} compatible units are available')
 
-            conn = get_db_connection()
-            if not conn:
-                flash('Database connection failed!', 'danger')
-                return redirect(url_for('requests_list'))
+        commit_allocation(conn, req_id, unit_ids, staff_id)
+        return unit_ids
+    finally:
+        conn.close()
 
-            try:
-                cursor = conn.cursor()
-                cursor.execute("BEGIN TRANSACTION")
-                cursor.execute("UPDATE BloodUnit SET status = 'used' WHERE bloodUnitID = ?", (unit_id,))
-                cursor.execute("""
-                    INSERT INTO DeliveryRecord (bloodRequestID, bloodUnitID, deliveryDate, deliveredByStaffID, bloodCondition)
-                    VALUES (?, ?, GETDATE(), ?, 'cold chain maintained')
-                """, (req_id, unit_id, staff_id))
-                cursor.execute("UPDATE BloodRequest SET requestStatus = 'delivered' WHERE bloodRequestID = ?",
-                               (req_id,))
-                conn.commit()
 
-                flash('Order Fulfilled Successfully!', 'success')
+def allocate_pending_queue(staff_id, dry_run=False):
+    """Allocate the whole pending queue from one snapshot of stored units.
+
+    Each request still commits in its own transaction, so a conflict on one
+    request leaves the others allocated. Returns a summary dict.
+    """
+    groups = {g['bgID']: g['groupName'] for g in reference_cache.get('BloodGroup')}
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT bloodUnitID, bgID, expiryDate, centerID
+            FROM BloodUnit
+            WHERE status = 'stored' AND expiryDate > CAST(GETDATE() AS DATE)
+        """)
+        allocator = UnitAllocator((unit_id, groups.get(bg_id), expiry, center_id)
+                                  for unit_id, bg_id, expiry, center_id in cursor.fetchall())
+        cursor.execute("""
+            SELECT bloodRequestID, bgID_Requested, requiredUnits, urgency, requestDate
+            FROM BloodRequest
+            WHERE requestStatus = 'pending'
+        """)
+        pending = [{'bloodRequestID': req_id, 'groupName': groups.get(bg_id), 'requiredUnits': units,
+                    'urgency': urgency, 'requestDate': requested}
+                   for req_id, bg_id, units, urgency, requested in cursor.fetchall()]
+        cursor.close()
+        conn.rollback()
+
+        allocations, unfilled = allocator.allocate_queue(pending)
+        summary = {'pending': len(pending), 'allocated': 0, 'units': 0,
+                   'unfilled': [r['bloodRequestID'] for r in unfilled], 'conflicts': []}
+        for req, units in allocations:
+            if dry_run:
+                summary['allocated'] += 1
+                summary['units'] += len(units)
+                continue
+            try:
+                commit_allocation(conn, req['bloodRequestID'], [u['bloodUnitID'] for u in units], staff_id)
+                summary['allocated'] += 1
+                summary['units'] += len(units)
+            except AllocationError:
+                summary['conflicts'].append(req['bloodRequestID'])
+    finally:
+        conn.close()
+
+    if summary['units'] and not dry_run:
+        dashboard_cache.invalidate()
+    return summary
+
+
+@app.route('/allocate_pending', methods=['POST'])
+@login_required
+@role_required('staff', 'admin')
+def allocate_pending():
+    """Allocate every pending request that current stock can fully cover"""
+    staff_id = request.form.get('staff_id', type=int)
+    if not staff_id and session['user_role'] == 'staff':
+        staff_id = session.get('linked_id')   # staff issue units under their own ID
+    try:
+        if not any(s['staffID'] == staff_id for s in reference_cache.get('Staff')):
+            flash('Select the staff member issuing the units!', 'warning')
+            return redirect(url_for('requests_list'))
+        summary = allocate_pending_queue(staff_id)
+        flash(f"✅ Allocated {summary['units']} units to {summary['allocated']} of "
+              f"{summary['pending']} pending requests.", 'success')
+        if summary['unfilled']:
+            flash(f"{len(summary['unfilled'])} requests are waiting for compatible stock.", 'warning')
+    except Exception as e:
+        flash(f'Allocation failed: {str(e)}', 'danger')
+    return redirect(url_for('requests_list'))
+
+
+@app.route('/fulfill/<int:req_id>', methods=['GET', 'POST'])
+@login_required
+def fulfill_request(req_id):
+    """Fulfill blood request"""
+    conflict = None
+    try:
+        current_request = first("""
+            SELECT br.*, bg.groupName as BGName
+            FROM BloodRequest br
+            JOIN BloodGroup bg ON br.bgID_Requested = bg.bgID
+            WHERE bloodRequestID = ?
+        """, (req_id,))
+
+        if not current_request:
+            flash('Request not found!', 'danger')
+            return redirect(url_for('requests_list'))
+
+        if request.method == 'POST' and request.form.get('allocate') == 'auto':
+            try:
+                unit_ids = allocate_request(req_id, request.form['staff_id'])
+                dashboard_cache.invalidate()
+                flash(f'Order Fulfilled Successfully! Issued units: {", ".join(map(str, unit_ids))}', 'success')
                 return redirect(url_for('requests_list'))
+            except AllocationError as e:
+                flash(f'Allocation failed: {str(e)}', 'danger')
+
+        elif request.method == 'POST':
+            unit_id = request.form['unit_id']
+            staff_id = request.form['staff_id']
 
+            conn = get_db_connection()
+            try:
+                # Only succeeds if the unit is still 'stored' and the request still pending
+                commit_allocation(conn, req_id, [unit_id], staff_id)
+                dashboard_cache.invalidate()
+
+                flash('Order Fulfilled Successfully!', 'success')
+                return redirect(url_for('requests_list'))
+
+            except AllocationError as e:
+                conflict = str(e)
             except Exception as e:
-                conn.rollback()
                 flash(f'Transaction Failed: {str(e)}', 'danger')
             finally:
-                if conn:
-                    conn.close()
+                conn.close()
 
-        matches = execute_query("""
-            SELECT TOP 5 bu.bloodUnitID, bu.expiryDate,
+        bg_ids = compatible_bg_ids(current_request['bgID_Requested'])
+        matches = execute_query(f"""
+            SELECT TOP (?) bu.bloodUnitID, bu.expiryDate, bg.groupName,
                    c.bloodCenterName,
                    DATEDIFF(day, GETDATE(), bu.expiryDate) as DaysLeft
             FROM BloodUnit bu
             JOIN BloodGroup bg ON bu.bgID = bg.bgID
             JOIN BloodBankCenter c ON bu.centerID = c.centerID
-            WHERE bg.groupName = ?
+            WHERE bu.bgID IN ({', '.join('?' * len(bg_ids))})
               AND bu.status = 'stored'
               AND bu.expiryDate > GETDATE()
-            ORDER BY bu.expiryDate ASC
-        """, (current_request['BGName'],)) or []
+            ORDER BY bu.expiryDate ASC, CASE WHEN bu.bgID = ? THEN 0 ELSE 1 END
+        """, [max(5, current_request['requiredUnits'])] + bg_ids + [current_request['bgID_Requested']]) or []
 
-        staff_list = execute_query("SELECT staffID, staffName FROM Staff") or []
+        staff_list = reference_cache.get('Staff')
+
+        suggested_unit_id = None
+        if conflict:
+            # Fail fast and point the operator at the next soonest-expiring unit
+            if matches:
+                suggested_unit_id = matches[0]['bloodUnitID']
+                flash(f'{conflict}. Next available unit: #{suggested_unit_id}', 'warning')
+            else:
+                flash(f'{conflict}. No other compatible units are in stock.', 'danger')
 
         return render_template('fulfill.html',
                                req=current_request,
                                matches=matches,
-                               staff_list=staff_list)
+                               staff_list=staff_list,
+                               suggested_unit_id=suggested_unit_id)
 
     except Exception as e:
         flash(f'Error processing request: {str(e)}', 'danger')
@@ -754,51 +2730,1241 @@ def fulfill_request(req_id):
 
 
 # ---------------------------------------------------------
-# ANALYTICS
+# DONOR RECALL
 # ---------------------------------------------------------
+# When a center's stock of a blood group drops below its threshold,
+# eligible donors who can supply that group are asked to come in.
+#
+# find_shortages() reads stock per center and group from v_InventorySummary,
+# the indexed view that v_LiveInventory has been built on since migration
+# 0002. v_LiveInventory carries the same counts but keyed by center and
+# group names and only for pairs that have stock; the recall needs the IDs
+# and the empty pairs (a center with no O- at all is the worst shortage).
+# plan_recall() picks donors for each shortage with find_eligible_donors:
+# same-group donors before compatible ones, and the center's city before
+# the rest of the country. A donor who covers several shortages gets one
+# message that lists them all.
+#
+# fan_out() delivers the messages through a pluggable sender on a worker
+# pool. Messages go in batches and are throttled by a shared token bucket.
+# Every attempt is written to RecallNotification (migration 0009), so a
+# donor is not asked again within RECALL_DONOR_COOLDOWN_DAYS and a shortage
+# is not recalled again within RECALL_SHORTAGE_COOLDOWN_HOURS.
+#
+# The donor_recall job contacts real donors, so it only runs when
+# RECALL_ENABLED is set; recall-donors runs it by hand either way.
+RECALL_ENABLED = False
+RECALL_INTERVAL = 30 * 60  # seconds
+RECALL_LOCK = 'donor-recall'
+RECALL_MIN_UNITS = 5
+RECALL_MIN_UNITS_BY_GROUP = {'O-': 10, 'O+': 10}
+RECALL_DONORS_PER_UNIT = 20  # most recalled donors do not come in
+RECALL_MAX_DONORS = 100000  # per run
+RECALL_DONOR_COOLDOWN_DAYS = 14
+RECALL_SHORTAGE_COOLDOWN_HOURS = 24
+
+RECALL_SENDER = 'file'  # or 'smtp'
+RECALL_WORKERS = 8
+RECALL_BATCH_SIZE = 100
+RECALL_RATE_PER_SECOND = 1000
+RECALL_RECORD_BATCH = 5000
+RECALL_OUTBOX_PATH = os.path.join(app.instance_path, 'recall_outbox.jsonl')
+RECALL_SMTP_HOST = 'localhost'
+RECALL_SMTP_PORT = 1025
+RECALL_SMTP_STARTTLS = False
+RECALL_SMTP_USERNAME = None
+RECALL_SMTP_PASSWORD = None
+RECALL_SMTP_FROM = 'no-reply@bloodbank.local'
+
+
+def find_shortages():
+    """Center/group pairs below their threshold and not recalled within the
+    cooldown, most severe first"""
+    since = datetime.now() - timedelta(hours=RECALL_SHORTAGE_COOLDOWN_HOURS)
+    result_sets = execute_batch("""
+        SELECT c.centerID, c.bloodCenterName, c.city, bg.bgID, bg.groupName,
+               ISNULL(CAST(s.TotalUnits AS INT), 0) AS units
+        FROM BloodBankCenter c
+        CROSS JOIN BloodGroup bg
+        LEFT JOIN dbo.v_InventorySummary s WITH (NOEXPAND)
+            ON s.centerID = c.centerID AND s.bgID = bg.bgID;
+
+        SELECT DISTINCT centerID, bgID
+        FROM RecallNotification
+        WHERE sentAt >= ?;
+    """, (since,))
+    if result_sets is None:
+        return None
+    stock, recent = result_sets
+    recalled = {(row['centerID'], row['bgID']) for row in recent}
+
+    shortages = []
+    for row in stock:
+        threshold = RECALL_MIN_UNITS_BY_GROUP.get(row['groupName'], RECALL_MIN_UNITS)
+        if row['units'] < threshold and (row['centerID'], row['bgID']) not in recalled:
+            shortages.append(dict(row, threshold=threshold, missing=threshold - row['units']))
+    shortages.sort(key=lambda s: (s['units'] / s['threshold'], -s['missing']))
+    return shortages
+
+
+def plan_recall(shortages, max_donors=RECALL_MAX_DONORS, on_date=None):
+    """{donorID: message} for the given shortages, one message per donor"""
+    group_ids = {g['groupName']: g['bgID'] for g in reference_cache.get('BloodGroup')}
+    since = datetime.now() - timedelta(days=RECALL_DONOR_COOLDOWN_DAYS)
+    messages = {}
+    for shortage in shortages:
+        quota = shortage['missing'] * RECALL_DONORS_PER_UNIT
+        # RBC_COMPATIBILITY lists the recipient's own group first
+        compatible = RBC_COMPATIBILITY.get(shortage['groupName'], [])
+        tiers = [[group_ids[g] for g in groups if g in group_ids] for groups in (compatible[:1], compatible[1:])]
+        picked = set()
+        for city in ([shortage['city']] if shortage['city'] else []) + [None]:
+            for bg_ids in tiers:
+                wanted = min(quota - len(picked), max_donors - len(messages))
+                if not bg_ids or wanted <= 0:
+                    continue
+                # Ask for len(picked) extra: the nationwide pass sees the local donors again
+                donors = find_eligible_donors(bg_ids, city, on_date, wanted + len(picked),
+                                              not_recalled_since=since) or []
+                for donor in donors:
+                    if donor['donorID'] in picked or len(picked) >= quota:
+                        continue
+                    picked.add(donor['donorID'])
+                    message = messages.get(donor['donorID'])
+                    if message is None:
+                        if len(messages) >= max_donors:
+                            continue
+                        message = messages[donor['donorID']] = {
+                            'donor_id': donor['donorID'], 'name': donor['name'],
+                            'email': donor['donorEmail'], 'contact': donor['contactNo'],
+                            'group': donor['groupName'], 'shortages': [],
+                        }
+                    message['shortages'].append(shortage)
+    for message in messages.values():
+        message['subject'], message['body'] = recall_text(message)
+    return messages
+
+
+def recall_text(message):
+    needed = ', '.join(f"{s['groupName']} at {s['bloodCenterName']}" for s in message['shortages'])
+    subject = f"Urgent: your {message['group']} blood is needed"
+    body = (f"Dear {message['name']},\n\n"
+            f"We are running low on {needed}. You are eligible to donate again, and your "
+            f"{message['group']} blood can help. Please visit us in the next few days.\n\n"
+            f"Thank you for saving lives.")
+    return subject, body
+
+
+class RecallSender(ABC):
+    """Delivers recall messages. send_batch() runs on a worker thread and
+    returns one error string (or None when delivered) per message."""
+    channel = None
+
+    def can_reach(self, message):
+        return True
+
+    @abstractmethod
+    def send_batch(self, messages):
+        ...
+
+
+class FileSender(RecallSender):
+    """Appends each message to a JSON Lines outbox - for development and tests"""
+    channel = 'file'
+
+    def __init__(self, path=None):
+        self.path = path or RECALL_OUTBOX_PATH
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        lines = ''.join(json.dumps({'donor_id': m['donor_id'], 'to': m['email'] or m['contact'],
+                                    'subject': m['subject'], 'body': m['body'],
+                                    'queued_at': datetime.now().isoformat(timespec='seconds')}) + '\n'
+                        for m in messages)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as outbox:
+            outbox.write(lines)
+        return [None] * len(messages)
+
+
+class SMTPSender(RecallSender):
+    """Emails donors who have an address. One SMTP session per batch."""
+    channel = 'email'
+
+    def __init__(self, host=RECALL_SMTP_HOST, port=RECALL_SMTP_PORT, sender=RECALL_SMTP_FROM,
+                 starttls=RECALL_SMTP_STARTTLS, username=RECALL_SMTP_USERNAME, password=RECALL_SMTP_PASSWORD):
+        self.host, self.port, self.sender = host, port, sender
+        self.starttls, self.username, self.password = starttls, username, password
+
+    def can_reach(self, message):
+        return bool(message['email'])
+
+    def send_batch(self, messages):
+        import smtplib
+        from email.message import EmailMessage
+
+        errors = []
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for m in messages:
+                email = EmailMessage()
+                email['From'], email['To'], email['Subject'] = self.sender, m['email'], m['subject']
+                email.set_content(m['body'])
+                try:
+                    smtp.send_message(email)
+                    errors.append(None)
+                except smtplib.SMTPException as e:
+                    errors.append(str(e))
+        return errors
+
+
+RECALL_SENDERS = {'file': FileSender, 'smtp': SMTPSender}
+
+
+class RateLimiter:
+    """Token bucket shared by threads: `rate` tokens a second, bursts up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def record_recalls(rows):
+    """Bulk-insert (donorID, centerID, bgID, channel, status, error) rows"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            INSERT INTO RecallNotification (donorID, centerID, bgID, channel, status, error)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
 
-@app.route('/analytics')
+
+def fan_out(messages, sender, record=None, workers=RECALL_WORKERS,
+            batch_size=RECALL_BATCH_SIZE, rate=RECALL_RATE_PER_SECOND):
+    """Deliver messages (each donor once) on a worker pool, batch_size per
+    sender call and at most `rate` messages a second overall. Outcomes are
+    passed to record() (record_recalls by default) every RECALL_RECORD_BATCH
+    messages. Returns a Counter of 'sent' / 'failed' / 'skipped'."""
+    record = record or record_recalls
+    # Burst of one batch per worker, so a large run is spread out at `rate` from the start
+    limiter = RateLimiter(rate, burst=min(rate, batch_size * workers))
+    counts = Counter()
+    outcomes = []
+
+    def note(message, status, error=None):
+        counts[status] += 1
+        outcomes.extend((message['donor_id'], s['centerID'], s['bgID'], sender.channel, status,
+                         error[:300] if error else None) for s in message['shortages'])
+
+    def deliver(batch):
+        limiter.acquire(len(batch))
+        try:
+            return batch, sender.send_batch(batch)
+        except Exception as e:
+            log.warning('Recall batch of %d failed: %s', len(batch), e)
+            return batch, [str(e)] * len(batch)
+
+    reachable = []
+    for message in messages:
+        if sender.can_reach(message):
+            reachable.append(message)
+        else:
+            note(message, 'skipped', f'no {sender.channel} address')
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recall') as pool:
+        futures = [pool.submit(deliver, reachable[i:i + batch_size])
+                   for i in range(0, len(reachable), batch_size)]
+        for future in as_completed(futures):
+            batch, errors = future.result()
+            for message, error in zip(batch, errors):
+                note(message, 'failed' if error else 'sent', error)
+            if len(outcomes) >= RECALL_RECORD_BATCH:
+                record(outcomes)
+                outcomes = []
+    if outcomes:
+        record(outcomes)
+    return counts
+
+
+def run_recall(sender=None, dry_run=False, max_donors=RECALL_MAX_DONORS):
+    """Find shortages, pick donors and notify them. Returns a summary dict,
+    or None when another process is already running a recall."""
+    conn = get_db_connection()
+    try:
+        with app_lock(conn, RECALL_LOCK) as acquired:
+            if not acquired:
+                return None
+            shortages = find_shortages()
+            if shortages is None:
+                raise RuntimeError('Could not read inventory levels')
+            messages = plan_recall(shortages, max_donors) if shortages else {}
+            summary = {'shortages': shortages, 'donors': len(messages), 'sent': 0, 'failed': 0, 'skipped': 0}
+            if messages and not dry_run:
+                sender = sender or RECALL_SENDERS[RECALL_SENDER]()
+                summary.update(fan_out(list(messages.values()), sender))
+            return summary
+    finally:
+        conn.close()
+
+
+def run_recall_job():
+    summary = run_recall()
+    return summary['sent'] if summary else 0
+
+
+if RECALL_ENABLED:
+    register_job('donor_recall', run_recall_job, RECALL_INTERVAL)
+
+
+# ---------------------------------------------------------
+# CAMPAIGNS
+# ---------------------------------------------------------
+# Donation drives run with partner NGOs, stored in the bloodBankNGO database.
+# Both pages take their per-campaign figures from one aggregate statement:
+# each child table is grouped by campaignID once (migration
+# bloodBankNGO/0001 indexes those columns) and joined back to Campaign.
+#
+# Results live in campaign_cache: the list under CAMPAIGN_LIST_KEY, each
+# detail page under its campaignID. Every write goes through
+# invalidate_campaign(), so a busy campaign day costs one aggregate per
+# page per write rather than one per view. The TTL only bounds staleness
+# for edits made outside the app.
+CAMPAIGN_CACHE_TTL = 5 * 60  # seconds
+CAMPAIGN_LIST_KEY = 'list'
+CAMPAIGN_BLOOD_GROUPS = ('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-')
+CAMPAIGN_RECENT_FEEDBACK = 10
+
+campaign_cache = TTLCache(CAMPAIGN_CACHE_TTL)
+
+CAMPAIGN_SUMMARY_QUERY = """
+    SELECT c.campaignID, c.campaignName, c.campaignDate, c.location, c.organizedBy, c.status,
+           ISNULL(r.registrations, 0) AS registrations,
+           {group_totals},
+           ISNULL(d.donors, 0) AS donors,
+           ISNULL(v.volunteers, 0) AS volunteers,
+           ISNULL(s.sponsors, 0) AS sponsors,
+           ISNULL(s.totalSponsored, 0) AS totalSponsored,
+           ISNULL(i.quantityAvailable, 0) AS quantityAvailable,
+           ISNULL(i.quantityUsed, 0) AS quantityUsed,
+           f.averageRating,
+           ISNULL(f.feedbackCount, 0) AS feedbackCount
+    FROM Campaign c
+    LEFT JOIN (SELECT campaignID, COUNT(*) AS registrations,
+                      {group_counts}
+               FROM CampaignDonorRegistration
+               GROUP BY campaignID) r ON r.campaignID = c.campaignID
+    LEFT JOIN (SELECT campaignID, COUNT(*) AS donors
+               FROM CampaignDonor
+               GROUP BY campaignID) d ON d.campaignID = c.campaignID
+    LEFT JOIN (SELECT campaignID, COUNT(*) AS volunteers
+               FROM CampaignVolunteerAssignment
+               GROUP BY campaignID) v ON v.campaignID = c.campaignID
+    LEFT JOIN (SELECT campaignID, COUNT(DISTINCT sponsorID) AS sponsors,
+                      SUM(amountSponsored) AS totalSponsored
+               FROM CampaignSponsorshipDetail
+               GROUP BY campaignID) s ON s.campaignID = c.campaignID
+    LEFT JOIN (SELECT campaignID, SUM(quantityAvailable) AS quantityAvailable,
+                      SUM(quantityUsed) AS quantityUsed
+               FROM CampaignInventory
+               GROUP BY campaignID) i ON i.campaignID = c.campaignID
+    LEFT JOIN (SELECT campaignID, CAST(AVG(CAST(rating AS DECIMAL(4,2))) AS DECIMAL(3,2)) AS averageRating,
+                      COUNT(*) AS feedbackCount
+               FROM CampaignFeedback
+               GROUP BY campaignID) f ON f.campaignID = c.campaignID
+    {where}
+""".format(
+    group_counts=',\n                      '.join(
+        f"SUM(CASE WHEN donorBloodGroup = '{group}' THEN 1 ELSE 0 END) AS [{group}]"
+        for group in CAMPAIGN_BLOOD_GROUPS),
+    group_totals=', '.join(f'ISNULL(r.[{group}], 0) AS [{group}]' for group in CAMPAIGN_BLOOD_GROUPS),
+    where='{where}',
+)
+
+CAMPAIGN_LIST_QUERY = CAMPAIGN_SUMMARY_QUERY.format(where='') + """
+    ORDER BY c.campaignDate DESC, c.campaignID DESC
+"""
+
+# The aggregate row plus the rows the detail page lists, in one round trip
+CAMPAIGN_DETAIL_QUERY = CAMPAIGN_SUMMARY_QUERY.format(where='WHERE c.campaignID = ?') + """;
+
+    SELECT sp.sponsorName, sp.sponsorType, SUM(sd.amountSponsored) AS amountSponsored
+    FROM CampaignSponsorshipDetail sd
+    JOIN CampaignSponsor sp ON sd.sponsorID = sp.sponsorID
+    WHERE sd.campaignID = ?
+    GROUP BY sp.sponsorID, sp.sponsorName, sp.sponsorType
+    ORDER BY amountSponsored DESC;
+
+    SELECT itemName, itemType, quantityAvailable, quantityUsed
+    FROM CampaignInventory
+    WHERE campaignID = ?
+    ORDER BY itemType, itemName;
+
+    SELECT v.volunteerName, v.contactNumber, a.assignedRole
+    FROM CampaignVolunteerAssignment a
+    JOIN CampaignVolunteer v ON a.volunteerID = v.volunteerID
+    WHERE a.campaignID = ?
+    ORDER BY a.assignedRole, v.volunteerName;
+
+    SELECT TOP (?) feedbackProvider, rating, comments
+    FROM CampaignFeedback
+    WHERE campaignID = ?
+    ORDER BY feedbackID DESC;
+"""
+
+
+def campaign_summary(row):
+    """Aggregate row -> dict, with the per-group registration columns under 'by_group'"""
+    summary = {name: row[name] for name in row if name not in CAMPAIGN_BLOOD_GROUPS}
+    summary['by_group'] = {group: row[group] for group in CAMPAIGN_BLOOD_GROUPS if row[group]}
+    return summary
+
+
+def load_campaigns():
+    rows = execute_query(CAMPAIGN_LIST_QUERY, database='bloodBankNGO')
+    if rows is None:
+        return None
+    return [campaign_summary(row) for row in rows]
+
+
+def load_campaign(campaign_id):
+    """Everything the detail page shows; {} when the campaign does not exist"""
+    result_sets = execute_batch(CAMPAIGN_DETAIL_QUERY,
+                                (campaign_id, campaign_id, campaign_id, campaign_id,
+                                 CAMPAIGN_RECENT_FEEDBACK, campaign_id),
+                                database='bloodBankNGO')
+    if result_sets is None:
+        return None
+    summary, sponsors, inventory, volunteers, feedback = result_sets
+    if not summary:
+        return {}
+    return {
+        'campaign': campaign_summary(summary[0]),
+        'sponsors': sponsors,
+        'inventory': inventory,
+        'volunteers': volunteers,
+        'feedback': feedback,
+    }
+
+
+def cached_campaigns():
+    return campaign_cache.get_or_load(CAMPAIGN_LIST_KEY, load_campaigns)
+
+
+def cached_campaign(campaign_id):
+    return campaign_cache.get_or_load(campaign_id, lambda: load_campaign(campaign_id))
+
+
+def invalidate_campaign(campaign_id):
+    """Call after any write touching a campaign - its figures also show on the list"""
+    campaign_cache.invalidate(campaign_id)
+    campaign_cache.invalidate(CAMPAIGN_LIST_KEY)
+
+
+@app.route('/campaigns')
 @login_required
-def analytics():
-    """System analytics"""
+def campaigns():
+    """All campaigns with their registration, sponsorship, inventory and rating totals"""
     try:
-        demand = execute_query("""
-            SELECT TOP 5 bg.groupName, COUNT(br.bloodRequestID) AS TotalRequests
-            FROM BloodRequest br
-            JOIN BloodGroup bg ON br.bgID_Requested = bg.bgID
-            GROUP BY bg.groupName
-            ORDER BY TotalRequests DESC
-        """) or []
+        rows = cached_campaigns()
+        if rows is None:
+            flash('Could not load campaigns.', 'danger')
+            rows = []
+        return render_template('campaigns.html', campaigns=rows)
+    except Exception as e:
+        flash(f'Error loading campaigns: {str(e)}', 'danger')
+        return render_template('campaigns.html', campaigns=[])
 
-        donors = execute_query("""
-            SELECT TOP 10 d.name, d.contactNo, COUNT(do.donationID) AS TotalDonations
-            FROM Donor d
-            JOIN Donation do ON d.donorID = do.donorID
-            GROUP BY d.name, d.contactNo
+
+@app.route('/campaigns/<int:campaign_id>')
+@login_required
+def campaign_detail(campaign_id):
+    """One campaign: totals, sponsors, inventory, volunteers, feedback and the registration form"""
+    data = cached_campaign(campaign_id)
+    if data is None:
+        flash('Could not load the campaign.', 'danger')
+        return redirect(url_for('campaigns'))
+    if not data:
+        flash('Campaign not found!', 'warning')
+        return redirect(url_for('campaigns'))
+    return render_template('campaign_detail.html', blood_groups=CAMPAIGN_BLOOD_GROUPS,
+                           genders=reference_cache.get('GenderType'), **data)
+
+
+@app.route('/campaigns/<int:campaign_id>/register', methods=['POST'])
+@login_required
+def campaign_register(campaign_id):
+    """Register a walk-in donor for an upcoming campaign"""
+    data = cached_campaign(campaign_id)
+    if not data:
+        flash('Campaign not found!', 'warning')
+        return redirect(url_for('campaigns'))
+    if data['campaign']['status'] != 'upcoming':
+        flash('Registrations are only open for upcoming campaigns.', 'warning')
+        return redirect(url_for('campaign_detail', campaign_id=campaign_id))
+
+    name = request.form.get('donorName', '').strip()
+    age = request.form.get('donorAge', type=int)
+    group = request.form.get('donorBloodGroup')
+    if not name or age is None or not 18 <= age <= 60 or group not in CAMPAIGN_BLOOD_GROUPS:
+        flash('Please enter a name, an age between 18 and 60 and a blood group.', 'danger')
+        return redirect(url_for('campaign_detail', campaign_id=campaign_id))
+
+    inserted = execute_query("""
+        INSERT INTO CampaignDonorRegistration
+            (campaignID, donorName, donorAge, donorGender, donorBloodGroup, contactNumber)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (campaign_id, name, age, request.form.get('donorGender') or None, group,
+          request.form.get('contactNumber', '').strip() or None),
+        fetch=False, database='bloodBankNGO')
+    if not inserted:
+        flash('Could not save the registration.', 'danger')
+    else:
+        invalidate_campaign(campaign_id)
+        flash(f'✅ {name} registered for {data["campaign"]["campaignName"]}.', 'success')
+    return redirect(url_for('campaign_detail', campaign_id=campaign_id))
+
+
+# ---------------------------------------------------------
+# CAMPAIGN DONOR RECONCILIATION
+# ---------------------------------------------------------
+# Campaign donors and registrations in bloodBankNGO are free text. This job
+# links each one to a bloodBankSystem Donor, and creates the Donor when
+# nobody matches, so campaign donors get lastDonationDate and eligibility
+# tracking.
+#
+# It is an in-memory hash join. One pass over Donor builds
+# {(phone, name): donor}, then each NGO source is streamed in ID order from
+# its checkpoint and probed against that map. Both passes are linear. Every
+# source row gets a CampaignDonorLink row (migration bloodBankNGO/0002), and
+# the checkpoint advances in the same NGO transaction as the links.
+#
+# The two databases cannot share a transaction, so new donors are committed
+# first. If a run dies before its links commit, the next run rebuilds the
+# map from Donor. It then finds those donors and links them instead of
+# creating them a second time.
+RECONCILE_INTERVAL = 60 * 60  # seconds
+RECONCILE_BATCH_SIZE = 5000
+RECONCILE_LOCK = 'reconcile-campaign-donors'
+
+# Source table -> its rows after a checkpoint ID, in ID order. seenOn is the
+# day the donor gave their age; donationDate is only known for donations.
+RECONCILE_SOURCES = {
+    'CampaignDonor': """
+        SELECT cd.donorID AS sourceID, cd.donorName, cd.donorAge, cd.donorGender,
+               cd.donorBloodGroup, cd.contactNumber, c.location,
+               ISNULL(cd.donationDate, c.campaignDate) AS seenOn, cd.donationDate
+        FROM CampaignDonor cd
+        JOIN Campaign c ON cd.campaignID = c.campaignID
+        WHERE cd.donorID > ?
+        ORDER BY cd.donorID
+    """,
+    'CampaignDonorRegistration': """
+        SELECT r.registrationID AS sourceID, r.donorName, r.donorAge, r.donorGender,
+               r.donorBloodGroup, r.contactNumber, c.location,
+               c.campaignDate AS seenOn, CAST(NULL AS DATE) AS donationDate
+        FROM CampaignDonorRegistration r
+        JOIN Campaign c ON r.campaignID = c.campaignID
+        WHERE r.registrationID > ?
+        ORDER BY r.registrationID
+    """,
+}
+
+
+def normalize_phone(value):
+    """Last 10 digits, so 0300-1234567, +92 300 1234567 and 923001234567 agree"""
+    digits = re.sub(r'\D', '', value or '')
+    return digits[-10:] if len(digits) >= 10 else None
+
+
+def normalize_name(value):
+    """Case-folded words without punctuation: 'M. Ali  KHAN' -> 'm ali khan'"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', value or '').casefold().split()) or None
+
+
+def load_donor_index(batch_size=RECONCILE_BATCH_SIZE):
+    """{(phone, name): (donorID, bgID)} over all donors; the oldest donor wins a tie"""
+    index = {}
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT donorID, name, contactNo, bgID FROM Donor ORDER BY donorID")
+        for row in iter_rows(cursor, batch_size):
+            key = (normalize_phone(row['contactNo']), normalize_name(row['name']))
+            if all(key):
+                index.setdefault(key, (row['donorID'], row['bgID']))
+        cursor.close()
+    finally:
+        conn.close()
+    return index
+
+
+class DonorReconciler:
+    """Links batches of campaign rows against the Donor index.
+
+    Rows with the same normalised phone and name are the same person, but
+    only when the blood group also agrees. A disagreement is recorded as a
+    'conflict' for staff to resolve rather than guessed at.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.genders = _lookup('GenderType', 'genderID', 'genderName')
+        self.groups = _lookup('BloodGroup', 'bgID', 'groupName')
+        self.counts = Counter()
+
+    def new_donor(self, row, bg_id):
+        """Donor insert parameters, or None when a required column can't be filled"""
+        gender_id = self.genders.get((row['donorGender'] or '').strip().lower())
+        if gender_id is None or row['donorAge'] is None:
+            return None
+        # Donor.dateOfBirth is required; estimate it from the age given on seenOn
+        dob = date(row['seenOn'].year - row['donorAge'], 7, 1)
+        city = (row['location'] or '').split(',')[0].strip() or None
+        return (row['donorName'].strip(), dob, gender_id, bg_id, row['contactNumber'].strip(), city)
+
+    def plan(self, rows):
+        """Probe the index for each row. Returns (links, new donors by key,
+        latest donation date by key); a link's key is None when unlinked."""
+        today = date.today()
+        links, new_donors, donated = [], {}, {}
+        for row in rows:
+            key = (normalize_phone(row['contactNumber']), normalize_name(row['donorName']))
+            bg_id = self.groups.get((row['donorBloodGroup'] or '').strip().lower())
+            known = self.index.get(key)
+            if known is None and key in new_donors:
+                known = (None, new_donors[key][3])
+
+            if not all(key) or bg_id is None:
+                status = 'skipped'
+            elif known is not None:
+                status = 'matched' if known[1] == bg_id else 'conflict'
+            else:
+                params = self.new_donor(row, bg_id)
+                status = 'created' if params else 'skipped'
+                if params:
+                    new_donors[key] = params
+
+            linked = status in ('matched', 'created')
+            links.append((row['sourceID'], key if linked else None, status))
+            donation_date = row['donationDate']
+            if linked and donation_date and donation_date <= today:
+                donated[key] = max(donated.get(key, donation_date), donation_date)
+        return links, new_donors, donated
+
+    def apply(self, conn, new_donors, donated):
+        """Insert new_donors (adding them to the index) and move lastDonationDate
+        forward for donors seen donating, in one bloodBankSystem transaction"""
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        if new_donors:
+            keys = list(new_donors)
+            cursor.execute("""
+                IF OBJECT_ID('tempdb..#ReconcileDonor') IS NOT NULL DROP TABLE #ReconcileDonor;
+                IF OBJECT_ID('tempdb..#ReconcileDonorMap') IS NOT NULL DROP TABLE #ReconcileDonorMap;
+                CREATE TABLE #ReconcileDonor (
+                    rowNo INT PRIMARY KEY, name VARCHAR(100), dateOfBirth DATE, genderID INT,
+                    bgID INT, contactNo VARCHAR(50), city VARCHAR(50)
+                );
+                CREATE TABLE #ReconcileDonorMap (rowNo INT PRIMARY KEY, donorID INT);
+            """)
+            cursor.executemany("INSERT INTO #ReconcileDonor VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               [(row_no, *new_donors[key]) for row_no, key in enumerate(keys)])
+            cursor.execute("""
+                SET NOCOUNT ON;
+                MERGE Donor AS target
+                USING #ReconcileDonor AS src ON 1 = 0
+                WHEN NOT MATCHED THEN
+                    INSERT (name, dateOfBirth, genderID, bgID, contactNo, city, lastDonationDate)
+                    VALUES (src.name, src.dateOfBirth, src.genderID, src.bgID, src.contactNo, src.city, NULL)
+                OUTPUT src.rowNo, INSERTED.donorID INTO #ReconcileDonorMap (rowNo, donorID);
+
+                SELECT rowNo, donorID FROM #ReconcileDonorMap;
+            """)
+            for row_no, donor_id in cursor.fetchall():
+                key = keys[row_no]
+                self.index[key] = (donor_id, new_donors[key][3])
+            cursor.execute("DROP TABLE #ReconcileDonor; DROP TABLE #ReconcileDonorMap;")
+
+        if donated:
+            cursor.execute("""
+                IF OBJECT_ID('tempdb..#ReconcileDonated') IS NOT NULL DROP TABLE #ReconcileDonated;
+                CREATE TABLE #ReconcileDonated (donorID INT PRIMARY KEY, donationDate DATE);
+            """)
+            cursor.executemany("INSERT INTO #ReconcileDonated VALUES (?, ?)",
+                               [(self.index[key][0], day) for key, day in donated.items()])
+            cursor.execute("""
+                UPDATE d
+                SET lastDonationDate = s.donationDate
+                FROM Donor d
+                JOIN #ReconcileDonated s ON d.donorID = s.donorID
+                WHERE d.lastDonationDate IS NULL OR d.lastDonationDate < s.donationDate;
+
+                DROP TABLE #ReconcileDonated;
+            """)
+        conn.commit()
+        cursor.close()
+
+    def record(self, conn, source, links):
+        """Write the batch's links and advance the source checkpoint, atomically"""
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            INSERT INTO CampaignDonorLink (sourceTable, sourceID, donorID, matchStatus)
+            VALUES (?, ?, ?, ?)
+        """, [(source, source_id, self.index[key][0] if key else None, status)
+              for source_id, key, status in links])
+        cursor.execute("""
+            UPDATE ReconcileCheckpoint
+            SET lastSourceID = ?, updatedAt = SYSDATETIME()
+            WHERE sourceTable = ?
+        """, (links[-1][0], source))
+        conn.commit()
+        cursor.close()
+
+    def reconcile_batch(self, source, rows, system_conn, ngo_conn):
+        links, new_donors, donated = self.plan(rows)
+        if new_donors or donated:
+            self.apply(system_conn, new_donors, donated)
+        self.record(ngo_conn, source, links)
+        batch_counts = Counter(status for _, _, status in links)
+        self.counts.update(batch_counts)
+        log.info('Reconciled %s %s..%s: %s', source, links[0][0], links[-1][0], dict(batch_counts))
+
+
+def reconcile_campaign_donors(batch_size=RECONCILE_BATCH_SIZE):
+    """Link every campaign donor and registration added since the last run.
+
+    Returns a Counter of outcomes, or None when another process holds the
+    reconciliation lock.
+    """
+    reader = get_db_connection_ngo()
+    writer = get_db_connection_ngo()
+    system = get_db_connection()
+    try:
+        # Keeps the web job and the CLI from both creating the same donors
+        with app_lock(writer, RECONCILE_LOCK) as acquired:
+            if not acquired:
+                return None
+            cursor = writer.cursor()
+            cursor.execute("SELECT sourceTable, lastSourceID FROM ReconcileCheckpoint")
+            checkpoints = dict(cursor.fetchall())
+            cursor.close()
+            reconciler = None
+            for source, query in RECONCILE_SOURCES.items():
+                source_cursor = reader.cursor()
+                source_cursor.execute(query, (checkpoints.get(source, 0),))
+                rows = iter_rows(source_cursor, batch_size)
+                batch = list(islice(rows, batch_size))
+                while batch:
+                    if reconciler is None:
+                        # Only scan Donor once there is something new to link
+                        reconciler = DonorReconciler(load_donor_index(batch_size))
+                    reconciler.reconcile_batch(source, batch, system, writer)
+                    batch = list(islice(rows, batch_size))
+                source_cursor.close()
+    finally:
+        reader.close()
+        writer.close()
+        system.close()
+
+    counts = reconciler.counts if reconciler else Counter()
+    if counts['created'] or counts['matched']:
+        dashboard_cache.invalidate()
+        donor_profiles.invalidate()
+    return counts
+
+
+def run_reconcile_job():
+    return sum((reconcile_campaign_donors() or {}).values())
+
+
+register_job('campaign_reconcile', run_reconcile_job, RECONCILE_INTERVAL)
+
+
+# ---------------------------------------------------------
+# CAMPAIGN INTAKE
+# ---------------------------------------------------------
+# A single-page check-in form for donation drives. The regular flow
+# (add_donor -> donor_screening -> donation_prompt -> add_donation) keeps
+# its state in the session and makes about six round trips per donor.
+#
+# /intake is rendered once with every lookup from reference_cache. It posts
+# each donor to /api/intake as JSON. Submissions are validated against the
+# same lookups, written to a local SQLite spool and acknowledged at once.
+# The intake_flush job then commits them to Donor, Donation and BloodUnit
+# in micro-batches. A slow or dropped link to the central database delays
+# the flush, not the queue at the table.
+#
+# Every submission carries a client_id. IntakeReceipt (migration 0007)
+# records the IDs committed centrally, in the same transaction as the rows.
+# A batch retried after a lost commit acknowledgement therefore skips the
+# submissions that already made it.
+#
+# The spool holds donor details and unsent donations, so it lives in the
+# Flask instance folder (outside version control), not next to the code.
+INTAKE_SPOOL_PATH = os.path.join(app.instance_path, 'intake_spool.db')
+INTAKE_FLUSH_INTERVAL = 5  # seconds
+INTAKE_BATCH_SIZE = 50
+INTAKE_MAX_ATTEMPTS = 5
+INTAKE_FAILED_SHOWN = 20
+
+# Errors that mean "the central database is unreachable right now"; the
+# flush stops and retries later without counting an attempt against rows
+INTAKE_TRANSIENT_ERRORS = (pyodbc.OperationalError, pyodbc.InterfaceError)
+
+# Rows the flush refuses for good, with the reason shown to staff
+INTAKE_REJECTIONS = {
+    'unknown_donor': 'No donor with this ID',
+    'not_eligible': 'Donor is not yet eligible to donate again',
+}
+
+
+class IntakeSpool:
+    """Durable local queue of intake submissions, one SQLite row each.
+
+    queued rows wait for the flush; failed rows were rejected or kept
+    failing and stay until staff look at them. Committed rows are deleted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        # Opened lazily so importing the app never creates the file
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS intake (
+                    spoolID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clientID TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    queuedAt TEXT NOT NULL
+                )
+            """)
+        return self._conn
+
+    def enqueue(self, client_id, payload):
+        """Queue a validated submission. Returns (spoolID, False), or the
+        existing row's (spoolID, True) when client_id was already queued."""
+        with self._lock:
+            db = self._db()
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO intake (clientID, payload, queuedAt) VALUES (?, ?, ?)",
+                (client_id, json.dumps(payload), datetime.now().isoformat(timespec='seconds')))
+            if cursor.rowcount:
+                return cursor.lastrowid, False
+            return db.execute("SELECT spoolID FROM intake WHERE clientID = ?", (client_id,)).fetchone()[0], True
+
+    def claim(self, limit):
+        """Oldest queued submissions as (spoolID, clientID, payload)"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT spoolID, clientID, payload FROM intake WHERE status = 'queued' ORDER BY spoolID LIMIT ?",
+                (limit,)).fetchall()
+        return [(spool_id, client_id, json.loads(payload)) for spool_id, client_id, payload in rows]
+
+    def complete(self, spool_ids):
+        with self._lock:
+            self._db().executemany("DELETE FROM intake WHERE spoolID = ?", [(i,) for i in spool_ids])
+
+    def fail(self, spool_id, error, permanent=False):
+        """Record a failed attempt; the row is parked after INTAKE_MAX_ATTEMPTS"""
+        with self._lock:
+            self._db().execute("""
+                UPDATE intake
+                SET attempts = attempts + 1, error = ?,
+                    status = CASE WHEN ? OR attempts + 1 >= ? THEN 'failed' ELSE 'queued' END
+                WHERE spoolID = ?
+            """, (error, permanent, INTAKE_MAX_ATTEMPTS, spool_id))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._db().execute("SELECT status, COUNT(*) FROM intake GROUP BY status").fetchall())
+        return {'queued': counts.get('queued', 0), 'failed': counts.get('failed', 0)}
+
+    def failed(self, limit=INTAKE_FAILED_SHOWN):
+        with self._lock:
+            rows = self._db().execute("""
+                SELECT spoolID, clientID, payload, attempts, error, queuedAt
+                FROM intake WHERE status = 'failed' ORDER BY spoolID DESC LIMIT ?
+            """, (limit,)).fetchall()
+        return [{'spool_id': spool_id, 'client_id': client_id, 'name': json.loads(payload)['name'],
+                 'attempts': attempts, 'error': error, 'queued_at': queued_at}
+                for spool_id, client_id, payload, attempts, error, queued_at in rows]
+
+
+intake_spool = IntakeSpool(INTAKE_SPOOL_PATH)
+
+
+def validate_intake(data):
+    """Resolve a submission against the reference lookups. Takes the bulk
+    import's column names; a donor_id means a returning donor. Returns a
+    JSON-ready payload; raises ValueError."""
+    if str(data.get('screened', '')).lower() not in ('1', 'true', 'yes', 'on'):
+        raise ValueError('The donor must pass health screening first')
+    data = dict(data)
+    data.setdefault('donation_date', date.today().isoformat())
+    type_id, donation_date, amount, staff_id, center_id = DonationImporter().validate_donation(data)
+    payload = {'donation_type_id': type_id, 'donation_date': donation_date.isoformat(),
+               'amount_ml': amount, 'staff_id': staff_id, 'center_id': center_id}
+
+    if str(data.get('donor_id') or '').strip():
+        try:
+            payload['donor_id'] = int(data['donor_id'])
+        except (TypeError, ValueError):
+            raise ValueError(f"donor_id must be a number, got {data['donor_id']!r}")
+        payload['name'] = f"Donor #{payload['donor_id']}"
+        return payload
+
+    name, dob, gender_id, bg_id, contact, email, address, city = DonorImporter().validate(data)
+    payload.update(donor_id=None, name=name, dob=dob.isoformat(), gender_id=gender_id, bg_id=bg_id,
+                   contact=contact, email=email, address=address, city=city)
+    return payload
+
+
+def commit_intake(conn, entries):
+    """Insert one micro-batch in one transaction.
+
+    Returns {spoolID: (outcome, donorID, donationID)}, where outcome is None
+    for rows inserted now, 'duplicate' for rows an earlier flush committed,
+    or a key of INTAKE_REJECTIONS.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        IF OBJECT_ID('tempdb..#Intake') IS NOT NULL DROP TABLE #Intake;
+        IF OBJECT_ID('tempdb..#IntakeDonor') IS NOT NULL DROP TABLE #IntakeDonor;
+        IF OBJECT_ID('tempdb..#IntakeDonation') IS NOT NULL DROP TABLE #IntakeDonation;
+        CREATE TABLE #Intake (
+            rowNo INT PRIMARY KEY, clientID VARCHAR(64), donorID INT NULL, name VARCHAR(100),
+            dateOfBirth DATE, genderID INT, bgID INT, contactNo VARCHAR(50), donorEmail VARCHAR(50),
+            address VARCHAR(100), city VARCHAR(50), donationTypeID INT, donationDate DATE,
+            amountINml DECIMAL(10,2), staffID INT, centerID INT, outcome VARCHAR(20) NULL
+        );
+        CREATE TABLE #IntakeDonor (rowNo INT PRIMARY KEY, donorID INT);
+        CREATE TABLE #IntakeDonation (rowNo INT PRIMARY KEY, donationID INT, bloodUnitID INT);
+    """)
+    cursor.fast_executemany = True
+    cursor.executemany("INSERT INTO #Intake VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)", [
+        (row_no, client_id, p['donor_id'], p.get('name'), p.get('dob'), p.get('gender_id'), p.get('bg_id'),
+         p.get('contact'), p.get('email'), p.get('address'), p.get('city'), p['donation_type_id'],
+         p['donation_date'], p['amount_ml'], p['staff_id'], p['center_id'])
+        for row_no, (_, client_id, p) in enumerate(entries)
+    ])
+    cursor.execute("""
+        SET NOCOUNT ON;
+
+        UPDATE i SET outcome = 'duplicate'
+        FROM #Intake i
+        JOIN IntakeReceipt r ON r.clientID = i.clientID;
+
+        -- Returning donors: take their group, and check they may donate
+        UPDATE i
+        SET bgID = d.bgID,
+            outcome = CASE WHEN d.nextEligibleDate > i.donationDate THEN 'not_eligible' END
+        FROM #Intake i
+        JOIN Donor d ON d.donorID = i.donorID
+        WHERE i.outcome IS NULL;
+
+        UPDATE #Intake SET outcome = 'unknown_donor'
+        WHERE donorID IS NOT NULL AND bgID IS NULL AND outcome IS NULL;
+
+        MERGE Donor AS target
+        USING (SELECT * FROM #Intake WHERE donorID IS NULL AND outcome IS NULL) AS src ON 1 = 0
+        WHEN NOT MATCHED THEN
+            INSERT (name, dateOfBirth, genderID, bgID, contactNo, donorEmail, address, city, lastDonationDate)
+            VALUES (src.name, src.dateOfBirth, src.genderID, src.bgID, src.contactNo, src.donorEmail,
+                    src.address, src.city, NULL)
+        OUTPUT src.rowNo, INSERTED.donorID INTO #IntakeDonor (rowNo, donorID);
+
+        UPDATE i SET donorID = m.donorID
+        FROM #Intake i
+        JOIN #IntakeDonor m ON m.rowNo = i.rowNo;
+
+        -- Donations and blood units go through the shared write path (migration 0008)
+        DECLARE @donations dbo.DonationBatch;
+        INSERT INTO @donations (rowNo, donorID, donationTypeID, donationDate, amountINml, staffID, centerID)
+        SELECT rowNo, donorID, donationTypeID, donationDate, amountINml, staffID, centerID
+        FROM #Intake
+        WHERE outcome IS NULL;
+
+        INSERT INTO #IntakeDonation (rowNo, donationID, bloodUnitID)
+        EXEC sp_RecordDonations @donations, ?;
+
+        INSERT INTO IntakeReceipt (clientID, donorID, donationID)
+        SELECT i.clientID, i.donorID, m.donationID
+        FROM #IntakeDonation m
+        JOIN #Intake i ON i.rowNo = m.rowNo;
+
+        SELECT i.rowNo, i.outcome, i.donorID, m.donationID
+        FROM #Intake i
+        LEFT JOIN #IntakeDonation m ON m.rowNo = i.rowNo;
+    """, (UNIT_SHELF_LIFE_DAYS,))
+    results = {entries[row_no][0]: (outcome, donor_id, donation_id)
+               for row_no, outcome, donor_id, donation_id in cursor.fetchall()}
+    cursor.execute("DROP TABLE #Intake; DROP TABLE #IntakeDonor; DROP TABLE #IntakeDonation;")
+    conn.commit()
+    cursor.close()
+    return results
+
+
+def _settle_intake(entries, results):
+    """Apply commit_intake results to the spool and the in-process caches"""
+    by_id = {entry[0]: entry for entry in entries}
+    done = []
+    for spool_id, (outcome, donor_id, donation_id) in results.items():
+        if outcome in INTAKE_REJECTIONS:
+            intake_spool.fail(spool_id, INTAKE_REJECTIONS[outcome], permanent=True)
+            continue
+        done.append(spool_id)
+        if outcome is None:
+            payload = by_id[spool_id][2]
+            if payload['donor_id'] is None:
+                donor_search.add(donor_id, payload['name'], payload['contact'], payload['email'])
+            else:
+                donor_profiles.invalidate(donor_id)
+    intake_spool.complete(done)
+    return sum(1 for outcome, _, _ in results.values() if outcome is None)
+
+
+def flush_intake(batch_size=INTAKE_BATCH_SIZE):
+    """Commit queued intake submissions batch_size at a time. Returns the
+    number of donations committed.
+
+    A batch that fails is retried row by row so one bad submission cannot
+    hold up the rest; rows that still fail wait for the next run.
+    """
+    committed = 0
+    while True:
+        entries = intake_spool.claim(batch_size)
+        if not entries:
+            break
+        try:
+            conn = get_db_connection()
+        except pyodbc.Error as e:
+            log.warning('Intake flush postponed, %d queued: %s', intake_spool.stats()['queued'], e)
+            break
+        isolated = False
+        try:
+            try:
+                committed += _settle_intake(entries, commit_intake(conn, entries))
+            except INTAKE_TRANSIENT_ERRORS:
+                raise
+            except Exception:
+                conn.rollback()
+                isolated = True
+                for entry in entries:
+                    try:
+                        committed += _settle_intake([entry], commit_intake(conn, [entry]))
+                    except INTAKE_TRANSIENT_ERRORS:
+                        raise
+                    except Exception as e:
+                        conn.rollback()
+                        intake_spool.fail(entry[0], str(e))
+        except INTAKE_TRANSIENT_ERRORS as e:
+            log.warning('Intake flush interrupted, %d queued: %s', intake_spool.stats()['queued'], e)
+            break
+        finally:
+            conn.close()
+
+        if isolated or len(entries) < batch_size:
+            break
+
+    if committed:
+        dashboard_cache.invalidate()
+    return committed
+
+
+register_job('intake_flush', flush_intake, INTAKE_FLUSH_INTERVAL)
+
+
+@app.route('/intake')
+@login_required
+def intake():
+    """Campaign check-in: one page, one POST per donor"""
+    return render_template('intake.html',
+                           bgs=reference_cache.get('BloodGroup'),
+                           genders=reference_cache.get('GenderType'),
+                           centers=reference_cache.get('BloodBankCenter'),
+                           staff=reference_cache.get('Staff'),
+                           donation_types=reference_cache.get('DonationType'),
+                           today=date.today(),
+                           queue=intake_spool.stats(),
+                           failed=intake_spool.failed())
+
+
+@app.route('/api/intake', methods=['GET', 'POST'])
+@login_required
+def api_intake():
+    """POST queues one donor (JSON or form fields); GET reports the queue"""
+    if request.method == 'GET':
+        return jsonify(queue=intake_spool.stats(), failed=intake_spool.failed())
+
+    data = request.get_json(silent=True) or request.form.to_dict()
+    client_id = str(data.get('client_id') or '').strip() or secrets.token_hex(16)
+    if len(client_id) > 64:
+        return jsonify(error='client_id must be at most 64 characters'), 400
+    try:
+        payload = validate_intake(data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    spool_id, duplicate = intake_spool.enqueue(client_id, payload)
+    return jsonify(client_id=client_id, spool_id=spool_id, duplicate=duplicate,
+                   name=payload['name'], queue=intake_spool.stats()), 202
+
+
+# ---------------------------------------------------------
+# ANALYTICS
+# ---------------------------------------------------------
+# The page reads the daily rollup tables maintained by sp_RefreshAnalyticsRollups
+# (migration 0004), so its cost scales with groups x days, not with the size
+# of BloodRequest/Donation. Figures lag by at most ANALYTICS_REFRESH_INTERVAL;
+# back-dated donations and imported history are picked up by the next refresh
+# like any other new row.
+ANALYTICS_REFRESH_INTERVAL = 5 * 60  # seconds
+ANALYTICS_WINDOWS = (7, 30, 365)     # ?days= choices; anything else means all time
+ANALYTICS_ALL_TIME = date(1900, 1, 1)
+
+
+def refresh_analytics_rollups(rebuild=False):
+    """Bring the analytics rollups up to date; returns the rollup rows rewritten"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("{CALL sp_RefreshAnalyticsRollups (?)}", (rebuild,))
+        rollup_rows = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+        return rollup_rows
+    finally:
+        conn.close()
+
+
+register_job('analytics_rollup', refresh_analytics_rollups, ANALYTICS_REFRESH_INTERVAL)
+
+
+def analytics_window_arg():
+    """?days= as one of ANALYTICS_WINDOWS, or None for all time"""
+    days = request.args.get('days', type=int)
+    return days if days in ANALYTICS_WINDOWS else None
+
+
+def analytics_since(days):
+    return date.today() - timedelta(days=days - 1) if days else ANALYTICS_ALL_TIME
+
+
+async def load_analytics(days, trend=False):
+    """Top groups, donors and hospitals (and optionally per-center totals and a daily
+    trend) for the last `days` days, all read from the rollups concurrently"""
+    since = analytics_since(days)
+    queries = [execute_query_async("""
+        SELECT TOP 5 bg.groupName, SUM(r.requestCount) AS TotalRequests
+        FROM RequestDailyByGroup r
+        JOIN BloodGroup bg ON r.bgID = bg.bgID
+        WHERE r.rollupDate >= ?
+        GROUP BY bg.groupName
+        ORDER BY TotalRequests DESC
+    """, (since,)), execute_query_async("""
+        SELECT TOP 10 d.name, d.contactNo, SUM(r.donationCount) AS TotalDonations
+        FROM DonationDailyByDonor r
+        JOIN Donor d ON r.donorID = d.donorID
+        WHERE r.rollupDate >= ?
+        GROUP BY d.name, d.contactNo
+        ORDER BY TotalDonations DESC
+    """, (since,)), execute_query_async("""
+        SELECT TOP 5 h.hospitalName, h.city, SUM(r.requestCount) AS TotalOrders
+        FROM RequestDailyByHospital r
+        JOIN Hospital h ON r.hospitalID = h.hospitalID
+        WHERE r.rollupDate >= ?
+        GROUP BY h.hospitalName, h.city
+        ORDER BY TotalOrders DESC
+    """, (since,))]
+    if trend:
+        # A daily series over all time is unbounded; trends use the widest window
+        trend_since = analytics_since(days or ANALYTICS_WINDOWS[-1])
+        queries += [execute_query_async("""
+            SELECT c.bloodCenterName, SUM(r.donationCount) AS TotalDonations, SUM(r.amountINml) AS TotalAmountINml
+            FROM DonationDailyByCenter r
+            JOIN BloodBankCenter c ON r.centerID = c.centerID
+            WHERE r.rollupDate >= ?
+            GROUP BY c.bloodCenterName
             ORDER BY TotalDonations DESC
-        """) or []
+        """, (since,)), execute_query_async("""
+            SELECT COALESCE(rq.rollupDate, dn.rollupDate) AS day,
+                   ISNULL(rq.Requests, 0) AS Requests, ISNULL(dn.Donations, 0) AS Donations
+            FROM (SELECT rollupDate, SUM(requestCount) AS Requests
+                  FROM RequestDailyByGroup WHERE rollupDate >= ? GROUP BY rollupDate) rq
+            FULL JOIN (SELECT rollupDate, SUM(donationCount) AS Donations
+                       FROM DonationDailyByCenter WHERE rollupDate >= ? GROUP BY rollupDate) dn
+                ON rq.rollupDate = dn.rollupDate
+            ORDER BY day
+        """, (trend_since, trend_since))]
+
+    results = await asyncio.gather(*queries)
+    names = ('demand', 'donors', 'hospitals', 'centers', 'trend')
+    return {name: rows or [] for name, rows in zip(names, results)}
 
-        hospitals = execute_query("""
-            SELECT TOP 5 h.hospitalName, h.city, COUNT(br.bloodRequestID) AS TotalOrders
-            FROM BloodRequest br
-            JOIN Hospital h ON br.hospitalID = h.hospitalID
-            GROUP BY h.hospitalName, h.city
-            ORDER BY TotalOrders DESC
-        """) or []
 
-        return render_template('analytics.html',
-                               demand=demand,
-                               donors=donors,
-                               hospitals=hospitals)
+@app.route('/analytics')
+@login_required
+async def analytics():
+    """System analytics - ?days=7/30/365 narrows the window, default is all time"""
+    days = analytics_window_arg()
+    try:
+        data = await load_analytics(days)
+        return render_template('analytics.html', days=days, windows=ANALYTICS_WINDOWS, **data)
 
     except Exception as e:
         flash(f'Error loading analytics: {str(e)}', 'danger')
         return render_template('analytics.html',
+                               days=days,
+                               windows=ANALYTICS_WINDOWS,
                                demand=[],
                                donors=[],
                                hospitals=[])
 
 
+@app.route('/api/analytics')
+@login_required
+async def api_analytics():
+    """Analytics as JSON, with per-center totals and the daily request/donation trend"""
+    days = analytics_window_arg()
+    data = await load_analytics(days, trend=True)
+    return jsonify(days=days, since=analytics_since(days), **data)
+
+
 @app.route('/add_hospital', methods=['GET', 'POST'])
 @login_required
 @role_required('admin')
@@ -816,6 +3982,7 @@ def add_hospital():
                           INSERT INTO Hospital (hospitalName, hospitalAddress, city, contactNumber, emailAddress)
                           VALUES (?, ?, ?, ?, ?)
                           """, (name, address, city, contact, email), fetch=False)
+            reference_cache.invalidate('Hospital')
 
             flash(f'✅ Hospital "{name}" added successfully!', 'success')
             return redirect(url_for('dashboard'))
@@ -832,8 +3999,9 @@ def add_hospital():
 def add_doctor():
     """Admin: Add a new doctor and create login"""
     if request.method == 'POST':
-        conn = get_db_connection()
-        if not conn:
+        try:
+            conn = get_db_connection()
+        except (PoolTimeout, pyodbc.Error):
             flash('Database connection error', 'danger')
             return redirect(url_for('dashboard'))
 
@@ -859,27 +4027,28 @@ def add_doctor():
             new_doctor_id = cursor.fetchone()[0]
 
             # 2. Insert into UserLogin table (Auto-create account)
-            # Using simple SHA2_256 hash logic as per your SQL schema patterns
             cursor.execute("""
-                           INSERT INTO UserLogin (doctorID, username, passwordHash, plainPassword, userRole, isActive)
-                           VALUES (?, ?, CONVERT(VARCHAR (255), HASHBYTES('SHA2_256', ?)), ?, 'doctor', 1)
-                           """, (new_doctor_id, email, default_pass, default_pass))
+                           INSERT INTO UserLogin (doctorID, username, passwordHash, userRole, isActive)
+                           VALUES (?, ?, ?, 'doctor', 1)
+                           """, (new_doctor_id, email, hash_password(default_pass)))
 
             conn.commit()
             cursor.close()
             conn.close()
+            reference_cache.invalidate('Doctor')
 
             flash(f'✅ Doctor "{name}" registered! Login: {email} / {default_pass}', 'success')
             return redirect(url_for('dashboard'))
 
         except Exception as e:
-            if conn:
-                conn.rollback()
+            conn.rollback()
             flash(f'Error adding doctor: {str(e)}', 'danger')
-            print(e)
+            log.exception('Error adding doctor')
+        finally:
+            conn.close()
 
     # GET: Fetch hospitals for dropdown
-    hospitals = execute_query("SELECT hospitalID, hospitalName, city FROM Hospital") or []
+    hospitals = reference_cache.get('Hospital')
     return render_template('add_doctor.html', hospitals=hospitals)
 
 
@@ -889,8 +4058,9 @@ def add_doctor():
 def add_staff():
     """Admin: Add new staff member and create login"""
     if request.method == 'POST':
-        conn = get_db_connection()
-        if not conn:
+        try:
+            conn = get_db_connection()
+        except (PoolTimeout, pyodbc.Error):
             flash('Database connection error', 'danger')
             return redirect(url_for('dashboard'))
 
@@ -916,25 +4086,495 @@ def add_staff():
 
             # 2. Insert into UserLogin table
             cursor.execute("""
-                           INSERT INTO UserLogin (staffID, username, passwordHash, plainPassword, userRole, isActive)
-                           VALUES (?, ?, CONVERT(VARCHAR (255), HASHBYTES('SHA2_256', ?)), ?, 'staff', 1)
-                           """, (new_staff_id, email, default_pass, default_pass))
+                           INSERT INTO UserLogin (staffID, username, passwordHash, userRole, isActive)
+                           VALUES (?, ?, ?, 'staff', 1)
+                           """, (new_staff_id, email, hash_password(default_pass)))
 
             conn.commit()
             cursor.close()
             conn.close()
+            reference_cache.invalidate('Staff')
 
             flash(f'✅ Staff "{name}" registered! Login: {email} / {default_pass}', 'success')
             return redirect(url_for('dashboard'))
 
         except Exception as e:
-            if conn:
-                conn.rollback()
+            conn.rollback()
             flash(f'Error adding staff: {str(e)}', 'danger')
+        finally:
+            conn.close()
 
     # GET: Fetch centers for dropdown
-    centers = execute_query("SELECT centerID, bloodCenterName, city FROM BloodBankCenter") or []
+    centers = reference_cache.get('BloodBankCenter')
     return render_template('add_staff.html', centers=centers)
+
+
+@app.route('/admin/stats')
+@login_required
+@role_required('admin')
+def admin_stats():
+    """Admin: connection pool and background job metrics as JSON"""
+    return jsonify({'pools': [pool.metrics() for pool in db_pools.values()],
+                    'jobs': [job.metrics() for job in background_jobs.values()]})
+
+
+def prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_metrics():
+    """Request, pool and job metrics in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{prometheus_label(val)}"' for key, val in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+    totals, histograms, slow_queries = request_metrics.snapshot()
+    for field, kind, help_text in (
+            ('requests', 'counter', 'Requests served'),
+            ('queries', 'counter', 'SQL statements executed while serving requests'),
+            ('query_seconds', 'counter', 'Time spent executing SQL while serving requests'),
+            ('rows', 'counter', 'Rows returned by SQL while serving requests'),
+            ('acquire_seconds', 'counter', 'Time spent waiting for a pooled connection'),
+            ('render_seconds', 'counter', 'Time spent rendering templates')):
+        metric(f'bloodbank_request_{field}_total', kind, help_text,
+               [({'endpoint': endpoint}, values[field]) for endpoint, values in totals.items()])
+
+    lines.append('# HELP bloodbank_request_duration_seconds Request duration')
+    lines.append('# TYPE bloodbank_request_duration_seconds histogram')
+    for endpoint, counts in histograms.items():
+        label = prometheus_label(endpoint)
+        cumulative = 0
+        for bound, count in zip(request_metrics.buckets, counts):
+            cumulative += count
+            lines.append(f'bloodbank_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'bloodbank_request_duration_seconds_bucket{{endpoint="{label}",le="+Inf"}} '
+                     f'{totals[endpoint]["requests"]}')
+        lines.append(f'bloodbank_request_duration_seconds_sum{{endpoint="{label}"}} {totals[endpoint]["seconds"]}')
+        lines.append(f'bloodbank_request_duration_seconds_count{{endpoint="{label}"}} '
+                     f'{totals[endpoint]["requests"]}')
+
+    metric('bloodbank_slow_queries_total', 'counter',
+           f'SQL statements slower than {SLOW_QUERY_SECONDS}s', [({}, slow_queries)])
+
+    pools = [pool.metrics() for pool in db_pools.values()]
+    for field in ('created', 'closed', 'acquired', 'waits', 'timeouts', 'evicted_idle', 'health_check_failures'):
+        metric(f'bloodbank_pool_{field}_total', 'counter', f'Connection pool {field.replace("_", " ")}',
+               [({'pool': stats['name']}, stats[field]) for stats in pools])
+    metric('bloodbank_pool_wait_seconds_total', 'counter', 'Time callers waited for a connection',
+           [({'pool': stats['name']}, stats['wait_seconds']) for stats in pools])
+    for field in ('max_size', 'size', 'idle', 'in_use'):
+        metric(f'bloodbank_pool_{field}', 'gauge', f'Connection pool {field.replace("_", " ")}',
+               [({'pool': stats['name']}, stats[field]) for stats in pools])
+
+    jobs = [job.metrics() for job in background_jobs.values()]
+    for field, name, kind in (('runs', 'runs_total', 'counter'), ('errors', 'errors_total', 'counter'),
+                              ('total_duration_seconds', 'duration_seconds_total', 'counter'),
+                              ('total_processed', 'processed_total', 'counter'),
+                              ('last_duration_seconds', 'last_duration_seconds', 'gauge'),
+                              ('running', 'running', 'gauge')):
+        metric(f'bloodbank_job_{name}', kind, f'Background job {field.replace("_", " ")}',
+               [({'job': stats['name']}, int(stats[field]) if isinstance(stats[field], bool) else stats[field])
+                for stats in jobs if stats[field] is not None])
+    return '\n'.join(lines) + '\n'
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (no login, so scrapers can reach it - restrict at the proxy)"""
+    return Response(prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# ---------------------------------------------------------
+# BULK IMPORT
+# ---------------------------------------------------------
+# Streams CSV or JSON Lines files row by row, validates each row and inserts
+# valid rows IMPORT_BATCH_SIZE at a time, so memory stays flat however long
+# the file is. A bad row is reported with its line number and skipped.
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 500
+IMPORT_DONOR_COLUMNS = ['name', 'dob', 'gender', 'blood_group', 'contact', 'email', 'address', 'city']
+IMPORT_DONATION_COLUMNS = ['donor_id', 'donation_type', 'donation_date', 'amount_ml', 'center_id', 'staff_id']
+
+
+class ImportReport:
+    """Counts for one import run; keeps only the first few errors in memory"""
+
+    def __init__(self, error_sink=None):
+        self.read = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.error_sink = error_sink   # optional callable(line, message) that sees every error
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+        if self.error_sink:
+            self.error_sink(line, message)
+
+
+def read_import_rows(stream, filename):
+    """Yield (line number, row dict) from a text stream holding CSV or JSON Lines"""
+    if filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line_no == 1 and line.startswith('['):
+                raise ValueError('JSON arrays cannot be streamed - upload JSON Lines (one object per line)')
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f'Invalid JSON: {e}')
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _lookup(table, id_column, name_column):
+    """Map both IDs and lower-cased names of a reference table to IDs"""
+    mapping = {}
+    for row in reference_cache.get(table):
+        mapping[str(row[id_column])] = row[id_column]
+        mapping[str(row[name_column]).strip().lower()] = row[id_column]
+    return mapping
+
+
+def _required(row, column):
+    value = row.get(column)
+    value = value.strip() if isinstance(value, str) else value
+    if value in (None, ''):
+        raise ValueError(f'{column} is required')
+    return value
+
+
+def _parse_date(value, column):
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{column} must be YYYY-MM-DD, got {value!r}')
+
+
+def _resolve(mapping, value, column):
+    resolved = mapping.get(str(value).strip().lower())
+    if resolved is None:
+        raise ValueError(f'Unknown {column} {value!r}')
+    return resolved
+
+
+class DonorImporter:
+    columns = IMPORT_DONOR_COLUMNS
+    insert_sql = """
+        INSERT INTO Donor (name, dateOfBirth, genderID, bgID, contactNo, donorEmail, address, city, lastDonationDate)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)
+    """
+
+    def __init__(self):
+        self.genders = _lookup('GenderType', 'genderID', 'genderName')
+        self.groups = _lookup('BloodGroup', 'bgID', 'groupName')
+
+    def validate(self, row):
+        name = _required(row, 'name')
+        dob = _parse_date(_required(row, 'dob'), 'dob')
+        if not date(1900, 1, 1) < dob < date.today():
+            raise ValueError(f'dob {dob} is out of range')
+        gender_id = _resolve(self.genders, _required(row, 'gender'), 'gender')
+        bg_id = _resolve(self.groups, _required(row, 'blood_group'), 'blood_group')
+        contact = str(_required(row, 'contact'))
+        email = (row.get('email') or '').strip() or None
+        city = (row.get('city') or '').strip() or None
+        address = ', '.join(part for part in ((row.get('address') or '').strip(), city or '') if part) or None
+        return (name, dob, gender_id, bg_id, contact, email, address, city)
+
+    def insert_batch(self, cursor, batch):
+        cursor.fast_executemany = True
+        cursor.executemany(self.insert_sql, [params for _, params in batch])
+
+
+class DonationImporter:
+    """Inserts Donation rows and their BloodUnit rows together.
+
+    Each batch is one sp_RecordDonations call (see record_donations), which
+    rejects the whole batch if any donor_id is unknown; the row-by-row retry
+    in _flush_import_batch then pins the error on the right line.
+    """
+    columns = IMPORT_DONATION_COLUMNS
+
+    def __init__(self):
+        self.types = _lookup('DonationType', 'donationTypeID', 'donationTypeName')
+        self.centers = _lookup('BloodBankCenter', 'centerID', 'bloodCenterName')
+        self.staff = {str(s['staffID']): s['staffID'] for s in reference_cache.get('Staff')}
+
+    def validate(self, row):
+        try:
+            donor_id = int(_required(row, 'donor_id'))
+        except (TypeError, ValueError):
+            raise ValueError(f"donor_id must be a number, got {row.get('donor_id')!r}")
+        return (donor_id, *self.validate_donation(row))
+
+    def validate_donation(self, row):
+        """(type, date, amount, staff, center) - everything but the donor"""
+        type_id = _resolve(self.types, _required(row, 'donation_type'), 'donation_type')
+        donation_date = _parse_date(_required(row, 'donation_date'), 'donation_date')
+        if donation_date > date.today():
+            raise ValueError(f'donation_date {donation_date} is in the future')
+        try:
+            amount = float(_required(row, 'amount_ml'))
+        except (TypeError, ValueError):
+            raise ValueError(f"amount_ml must be a number, got {row.get('amount_ml')!r}")
+        if not 0 < amount <= 1000:
+            raise ValueError(f'amount_ml {amount} is out of range')
+        center_id = _resolve(self.centers, _required(row, 'center_id'), 'center_id')
+        staff_id = _resolve(self.staff, _required(row, 'staff_id'), 'staff_id')
+        return (type_id, donation_date, amount, staff_id, center_id)
+
+    def insert_batch(self, cursor, batch):
+        record_donations(cursor, [params for _, params in batch])
+
+
+IMPORTERS = {'donors': DonorImporter, 'donations': DonationImporter}
+
+
+def _flush_import_batch(conn, importer, batch, report):
+    """Insert one batch; if it fails, retry row by row to isolate the bad rows"""
+    cursor = conn.cursor()
+    try:
+        importer.insert_batch(cursor, batch)
+        conn.commit()
+        report.inserted += len(batch)
+        return
+    except Exception:
+        conn.rollback()
+    finally:
+        cursor.close()
+
+    for line, params in batch:
+        cursor = conn.cursor()
+        try:
+            importer.insert_batch(cursor, [(line, params)])
+            conn.commit()
+            report.inserted += 1
+        except Exception as e:
+            conn.rollback()
+            report.error(line, str(e))
+        finally:
+            cursor.close()
+
+
+def run_import(kind, stream, filename, batch_size=IMPORT_BATCH_SIZE, error_sink=None):
+    """Validate and insert every row of `stream`. Returns an ImportReport."""
+    importer = IMPORTERS[kind]()
+    report = ImportReport(error_sink)
+    batch = []
+    conn = get_db_connection()
+    try:
+        for line, row in read_import_rows(stream, filename):
+            report.read += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                batch.append((line, importer.validate(row)))
+            except ValueError as e:
+                report.error(line, str(e))
+                continue
+            if len(batch) >= batch_size:
+                _flush_import_batch(conn, importer, batch, report)
+                batch = []
+        if batch:
+            _flush_import_batch(conn, importer, batch, report)
+    finally:
+        conn.close()
+
+    if report.inserted:
+        dashboard_cache.invalidate()
+        if kind == 'donations':
+            # The donation trigger moved lastDonationDate for an unknown set of donors
+            donor_profiles.invalidate()
+    return report
+
+
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+@role_required('admin')
+def bulk_import():
+    """Admin: upload a CSV / JSON Lines file of donors or donations"""
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        kind = request.form.get('kind', 'donors')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import!', 'warning')
+        elif kind not in IMPORTERS:
+            flash('Unknown import type!', 'danger')
+        else:
+            try:
+                # Werkzeug spools large uploads to disk; read it as a text stream
+                stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+                report = run_import(kind, stream, upload.filename)
+                flash(f'✅ Imported {report.inserted} of {report.read} {kind}.',
+                      'success' if not report.failed else 'warning')
+            except Exception as e:
+                flash(f'Import failed: {str(e)}', 'danger')
+
+    return render_template('import.html',
+                           report=report,
+                           donor_columns=IMPORT_DONOR_COLUMNS,
+                           donation_columns=IMPORT_DONATION_COLUMNS)
+
+
+# ---------------------------------------------------------
+# DATA EXPORT
+# ---------------------------------------------------------
+# Exports stream straight from the cursor with fetchmany, so memory use does
+# not depend on the size of the table. `date_column` is what ?from=&to= filter on.
+EXPORT_BATCH_SIZE = 1000
+EXPORT_DATASETS = {
+    'donors': {
+        'label': 'Donors (by last donation date)',
+        'database': 'bloodBankSystem',
+        'date_column': 'd.lastDonationDate',
+        'query': """
+            SELECT d.donorID, d.name, d.dateOfBirth, g.genderName, bg.groupName, d.contactNo,
+                   d.donorEmail, d.address, d.lastDonationDate
+            FROM Donor d
+            JOIN BloodGroup bg ON d.bgID = bg.bgID
+            JOIN GenderType g ON d.genderID = g.genderID
+            {where}
+            ORDER BY d.donorID
+        """,
+    },
+    'requests': {
+        'label': 'Blood requests',
+        'database': 'bloodBankSystem',
+        'date_column': 'br.requestDate',
+        'query': """
+            SELECT br.bloodRequestID, h.hospitalName, p.patientName, bg.groupName AS BloodRequired,
+                   br.requiredUnits, br.urgency, br.requestStatus, br.requestDate
+            FROM BloodRequest br
+            LEFT JOIN Hospital h ON br.hospitalID = h.hospitalID
+            LEFT JOIN Patient p ON br.patientID = p.patientID
+            JOIN BloodGroup bg ON br.bgID_Requested = bg.bgID
+            {where}
+            ORDER BY br.bloodRequestID
+        """,
+    },
+    'deliveries': {
+        'label': 'Deliveries',
+        'database': 'bloodBankSystem',
+        'date_column': 'dr.deliveryDate',
+        'query': """
+            SELECT dr.deliveryID, dr.bloodRequestID, dr.bloodUnitID, bg.groupName, c.bloodCenterName,
+                   h.hospitalName, dr.deliveryDate, s.staffName AS DeliveredBy, dr.bloodCondition
+            FROM DeliveryRecord dr
+            LEFT JOIN BloodUnit bu ON dr.bloodUnitID = bu.bloodUnitID
+            LEFT JOIN BloodGroup bg ON bu.bgID = bg.bgID
+            LEFT JOIN BloodBankCenter c ON bu.centerID = c.centerID
+            LEFT JOIN BloodRequest br ON dr.bloodRequestID = br.bloodRequestID
+            LEFT JOIN Hospital h ON br.hospitalID = h.hospitalID
+            LEFT JOIN Staff s ON dr.deliveredByStaffID = s.staffID
+            {where}
+            ORDER BY dr.deliveryID
+        """,
+    },
+    'donations': {
+        'label': 'Donation history',
+        'database': 'bloodBankSystem',
+        'date_column': 'donationDate',
+        'query': """
+            SELECT donorID, name, donationDate, amountINml, donationTypeName, collectedBy
+            FROM v_DonorDonationHistory
+            {where}
+            ORDER BY donationDate, donorID
+        """,
+    },
+    'campaigns': {
+        'label': 'Campaign registrations',
+        'database': 'bloodBankNGO',
+        'date_column': 'c.campaignDate',
+        'query': """
+            SELECT c.campaignID, c.campaignName, c.campaignDate, c.location, c.organizedBy, c.status,
+                   r.registrationID, r.donorName, r.donorAge, r.donorGender, r.donorBloodGroup, r.contactNumber
+            FROM Campaign c
+            LEFT JOIN CampaignDonorRegistration r ON r.campaignID = c.campaignID
+            {where}
+            ORDER BY c.campaignID, r.registrationID
+        """,
+    },
+}
+
+
+def export_rows_as_csv(database, query, params, batch_size=EXPORT_BATCH_SIZE):
+    """Yield CSV text chunks for a query, one fetchmany batch at a time"""
+    conn = borrow_connection(database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        writer.writerow([column[0] for column in cursor.description])
+        yield '\ufeff' + buffer.getvalue()   # BOM so Excel reads the file as UTF-8
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+@app.route('/export')
+@login_required
+@role_required('admin')
+def export_page():
+    """Admin: export form"""
+    return render_template('export.html', datasets=EXPORT_DATASETS)
+
+
+@app.route('/export/<dataset>')
+@login_required
+@role_required('admin')
+def export_dataset(dataset):
+    """Admin: stream a dataset as CSV, optionally limited to ?from=YYYY-MM-DD&to=YYYY-MM-DD"""
+    spec = EXPORT_DATASETS.get(dataset)
+    if spec is None:
+        flash('Unknown export!', 'danger')
+        return redirect(url_for('export_page'))
+
+    conditions, params = [], []
+    try:
+        if request.args.get('from'):
+            conditions.append(f"{spec['date_column']} >= ?")
+            params.append(_parse_date(request.args['from'], 'from'))
+        if request.args.get('to'):
+            conditions.append(f"{spec['date_column']} < ?")
+            params.append(_parse_date(request.args['to'], 'to') + timedelta(days=1))
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('export_page'))
+
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    query = spec['query'].format(where=where)
+    suffix = '_'.join(request.args.get(key) for key in ('from', 'to') if request.args.get(key))
+    filename = f"{dataset}{'_' + suffix if suffix else ''}.csv"
+
+    return Response(stream_with_context(export_rows_as_csv(spec['database'], query, params)),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
 # ---------------------------------------------------------
 # ERROR HANDLERS
 # ---------------------------------------------------------
@@ -949,6 +4589,622 @@ def internal_server_error(e):
     return render_template('500.html'), 500
 
 
+# ---------------------------------------------------------
+# DATABASE MIGRATIONS
+# ---------------------------------------------------------
+# migrations/<database>/NNNN_name.sql, applied in file-name order. Batches are
+# separated by GO lines, as in the setup scripts.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+_GO_LINE = re.compile(r'^\s*GO\s*;?\s*$', re.IGNORECASE | re.MULTILINE)
+
+
+def split_sql_batches(script):
+    """Split a T-SQL script on GO separators, dropping empty batches"""
+    return [batch.strip() for batch in _GO_LINE.split(script) if batch.strip()]
+
+
+def pending_migrations(database, applied):
+    folder = os.path.join(MIGRATIONS_DIR, database)
+    if not os.path.isdir(folder):
+        return []
+    return [(name[:-4], os.path.join(folder, name))
+            for name in sorted(os.listdir(folder))
+            if name.endswith('.sql') and name[:-4] not in applied]
+
+
+def run_migrations(database='bloodBankSystem'):
+    """Apply unapplied migrations, each in its own transaction. Returns the versions applied."""
+    conn = db_pools[database].acquire()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            IF OBJECT_ID('SchemaMigration', 'U') IS NULL
+                CREATE TABLE SchemaMigration (
+                    version VARCHAR(100) PRIMARY KEY,
+                    appliedAt DATETIME NOT NULL DEFAULT GETDATE()
+                )
+        """)
+        conn.commit()
+
+        cursor.execute("SELECT version FROM SchemaMigration")
+        applied = {row[0] for row in cursor.fetchall()}
+
+        done = []
+        for version, path in pending_migrations(database, applied):
+            with open(path, encoding='utf-8') as f:
+                batches = split_sql_batches(f.read())
+            try:
+                for batch in batches:
+                    cursor.execute(batch)
+                cursor.execute("INSERT INTO SchemaMigration (version) VALUES (?)", (version,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            done.append(version)
+        cursor.close()
+        return done
+    finally:
+        conn.close()
+
+
+@app.cli.command('migrate')
+@click.option('--database', default='bloodBankSystem', type=click.Choice(sorted(db_pools)))
+def migrate_command(database):
+    """Apply pending SQL migrations."""
+    applied = run_migrations(database)
+    if applied:
+        for version in applied:
+            click.echo(f'✅ Applied {version}')
+    else:
+        click.echo('Database is up to date.')
+
+
+# ---------------------------------------------------------
+# MAINTENANCE & BENCHMARK COMMANDS
+# ---------------------------------------------------------
+# Queries behind the hot pages, with representative parameters. Used by the
+# benchmark-queries command to capture plans before and after migrations.
+HOT_QUERIES = {
+    'dashboard_counts': ("""
+        SELECT
+            (SELECT COUNT(*) FROM Donation WHERE donationDate = CAST(GETDATE() AS DATE)) AS DonationsToday,
+            (SELECT COUNT(*) FROM BloodRequest WHERE requestDate = CAST(GETDATE() AS DATE)) AS RequestsToday,
+            (SELECT SUM(TotalUnits) FROM v_InventorySummary WITH (NOEXPAND)) AS blood_count
+    """, ()),
+    'expiry_alerts': ("""
+        SELECT TOP 5 bu.bloodUnitID, bu.bgID, bu.expiryDate, bu.centerID
+        FROM BloodUnit bu
+        WHERE bu.status = 'stored'
+          AND bu.expiryDate BETWEEN GETDATE() AND DATEADD(DAY, 7, GETDATE())
+        ORDER BY bu.expiryDate
+    """, ()),
+    'fulfill_matches': ("""
+        SELECT TOP 5 bu.bloodUnitID, bu.expiryDate, bu.centerID
+        FROM BloodUnit bu
+        WHERE bu.bgID = ? AND bu.status = 'stored' AND bu.expiryDate > GETDATE()
+        ORDER BY bu.expiryDate
+    """, (1,)),
+    'live_inventory': ("SELECT centerID, bgID, TotalUnits FROM v_InventorySummary WITH (NOEXPAND)", ()),
+    'donor_history': ("""
+        SELECT do.donationDate, do.amountINml, do.collectedByStaffID
+        FROM Donation do
+        WHERE do.donorID = ?
+        ORDER BY do.donationDate DESC
+    """, (1,)),
+    'requests_list': ("""
+        SELECT br.bloodRequestID, br.requiredUnits, br.urgency, br.requestStatus, br.requestDate
+        FROM BloodRequest br
+        ORDER BY CASE WHEN br.requestStatus = 'pending' THEN 0 ELSE 1 END, br.requestDate DESC
+    """, ()),
+    'pending_queue': ("""
+        SELECT bloodRequestID, bgID_Requested, requiredUnits, urgency
+        FROM BloodRequest
+        WHERE requestStatus = 'pending'
+        ORDER BY urgency, requestDate
+    """, ()),
+    'analytics_demand': ("""
+        SELECT TOP 5 r.bgID, SUM(r.requestCount) AS TotalRequests
+        FROM RequestDailyByGroup r
+        WHERE r.rollupDate >= DATEADD(DAY, -30, CAST(GETDATE() AS DATE))
+        GROUP BY r.bgID
+        ORDER BY TotalRequests DESC
+    """, ()),
+    'eligible_donors': ("""
+        SELECT TOP 100 d.donorID, d.name, d.contactNo, d.nextEligibleDate
+        FROM Donor d
+        WHERE d.bgID = ? AND d.city = ? AND d.nextEligibleDate <= CAST(GETDATE() AS DATE)
+        ORDER BY d.nextEligibleDate, d.donorID
+    """, (1, 'Lahore')),
+    'login': ("SELECT userID, userRole, staffID, doctorID FROM UserLogin WHERE username = ?",
+              ('superadmin@bloodbank.org',)),
+}
+
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option('--errors', 'errors_path', default=None, help='Write every rejected row to this CSV file.')
+def import_data_command(kind, path, batch_size, errors_path):
+    """Bulk import donors or donations from a CSV / JSON Lines file."""
+    errors_file = open(errors_path, 'w', newline='', encoding='utf-8') if errors_path else None
+    try:
+        error_writer = csv.writer(errors_file) if errors_file else None
+        if error_writer:
+            error_writer.writerow(['line', 'error'])
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            report = run_import(kind, stream, path, batch_size,
+                                error_sink=(lambda line, message: error_writer.writerow([line, message]))
+                                if error_writer else None)
+    finally:
+        if errors_file:
+            errors_file.close()
+
+    click.echo(f'Read {report.read}, inserted {report.inserted}, failed {report.failed}.')
+    if not errors_path:
+        for line, message in report.errors[:20]:
+            click.echo(f'  line {line}: {message}')
+
+
+@app.cli.command('sweep-expired')
+def sweep_expired_command():
+    """Mark expired blood units once (for cron instead of the in-process job)."""
+    swept = background_jobs['expiry_sweeper'].run_once()
+    click.echo(f'Swept {swept or 0} expired units.')
+
+
+@app.cli.command('refresh-analytics')
+@click.option('--rebuild', is_flag=True, help='Recompute every day instead of the changed ones.')
+def refresh_analytics_command(rebuild):
+    """Refresh the analytics rollups once (--rebuild after deleting or re-dating rows)."""
+    started = time.perf_counter()
+    rollup_rows = refresh_analytics_rollups(rebuild=rebuild)
+    click.echo(f'Rewrote {rollup_rows} rollup rows in {time.perf_counter() - started:.2f}s.')
+
+
+@app.cli.command('hash-passwords')
+def hash_passwords_command():
+    """Replace every remaining plainPassword with a salted hash (instead of waiting for logins)."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT userID, plainPassword FROM UserLogin WHERE plainPassword IS NOT NULL")
+        accounts = cursor.fetchall()
+        if accounts:
+            cursor.fast_executemany = True
+            cursor.executemany("UPDATE UserLogin SET passwordHash = ?, plainPassword = NULL WHERE userID = ?",
+                               [(hash_password(plain), user_id) for user_id, plain in accounts])
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    click.echo(f'Hashed {len(accounts)} passwords.')
+
+
+@app.cli.command('eligibility-report')
+@click.option('--date', 'on_date', default=None, help='Evaluate eligibility on this day (YYYY-MM-DD).')
+def eligibility_report_command(on_date):
+    """Count eligible donors per blood group across the whole Donor table."""
+    on_date = _parse_date(on_date, 'date') if on_date else date.today()
+    started = time.perf_counter()
+    eligible, waiting = eligibility_counts(on_date)
+    elapsed = time.perf_counter() - started
+    names = {g['bgID']: g['groupName'] for g in reference_cache.get('BloodGroup')}
+    for bg_id in sorted(set(eligible) | set(waiting), key=lambda i: names.get(i, '')):
+        click.echo(f'{names.get(bg_id, bg_id):<4} {eligible.get(bg_id, 0):>10,} eligible '
+                   f'{waiting.get(bg_id, 0):>10,} waiting')
+    click.echo(f'{sum(eligible.values()) + sum(waiting.values()):,} donors evaluated for {on_date} '
+               f'in {elapsed:.2f}s')
+
+
+@app.cli.command('reconcile-campaign-donors')
+@click.option('--batch-size', default=RECONCILE_BATCH_SIZE, show_default=True)
+def reconcile_campaign_donors_command(batch_size):
+    """Link NGO campaign donors and registrations to Donor, resuming from the last checkpoint."""
+    started = time.perf_counter()
+    counts = reconcile_campaign_donors(batch_size)
+    if counts is None:
+        click.echo('Another reconciliation is already running.')
+        return
+    click.echo(f"{sum(counts.values()):,} campaign rows in {time.perf_counter() - started:.2f}s: "
+               f"{counts['matched']:,} matched, {counts['created']:,} created, "
+               f"{counts['conflict']:,} conflicts, {counts['skipped']:,} skipped")
+
+
+@app.cli.command('allocate-pending')
+@click.option('--staff-id', required=True, type=int, help='Staff member recorded on the deliveries.')
+@click.option('--dry-run', is_flag=True, help='Plan allocations without writing them.')
+def allocate_pending_command(staff_id, dry_run):
+    """Allocate the pending request queue by urgency, FEFO across centers."""
+    summary = allocate_pending_queue(staff_id, dry_run=dry_run)
+    click.echo(f"Allocated {summary['units']} units to {summary['allocated']} of {summary['pending']} requests"
+               f"{' (dry run)' if dry_run else ''}.")
+    if summary['unfilled']:
+        click.echo(f"Unfilled: {summary['unfilled']}")
+    if summary['conflicts']:
+        click.echo(f"Conflicts (retry): {summary['conflicts']}")
+
+
+def stress_fulfilment(db_path, threads=16, unit_count=2000, request_count=3000):
+    """Many threads fulfil requests against a SQLite file through commit_allocation.
+
+    Every operator grabs the soonest-expiring stored unit, so they constantly
+    collide; a collision must fail through commit_allocation and move on to
+    the next candidate. Returns counters and the elapsed time; the database
+    is left in place for the caller to check.
+    """
+    setup = sqlite3.connect(db_path)
+    setup.executescript("""
+        DROP TABLE IF EXISTS BloodUnit;
+        DROP TABLE IF EXISTS BloodRequest;
+        DROP TABLE IF EXISTS DeliveryRecord;
+        CREATE TABLE BloodUnit (bloodUnitID INTEGER PRIMARY KEY, status TEXT NOT NULL, expiryDate TEXT NOT NULL);
+        CREATE TABLE BloodRequest (bloodRequestID INTEGER PRIMARY KEY, requestStatus TEXT NOT NULL);
+        CREATE TABLE DeliveryRecord (deliveryID INTEGER PRIMARY KEY AUTOINCREMENT, bloodRequestID INT,
+                                     bloodUnitID INT, deliveryDate TEXT, deliveredByStaffID INT,
+                                     bloodCondition TEXT);
+    """)
+    today = date.today()
+    setup.executemany("INSERT INTO BloodUnit VALUES (?, 'stored', ?)",
+                      [(i, (today + timedelta(days=1 + i % 40)).isoformat()) for i in range(1, unit_count + 1)])
+    setup.executemany("INSERT INTO BloodRequest VALUES (?, 'pending')", [(i,) for i in range(1, request_count + 1)])
+    setup.commit()
+    setup.close()
+
+    pool = ConnectionPool(lambda: sqlite3.connect(db_path, timeout=30, check_same_thread=False),
+                          name='stress', max_size=threads)
+    queue = deque(range(1, request_count + 1))
+    queue_lock = threading.Lock()
+    counters = {'fulfilled': 0, 'conflicts': 0, 'unfilled': 0}
+    counters_lock = threading.Lock()
+
+    def operator():
+        while True:
+            with queue_lock:
+                if not queue:
+                    return
+                req_id = queue.popleft()
+            conn = pool.acquire()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT bloodUnitID FROM BloodUnit WHERE status = 'stored' "
+                               "ORDER BY expiryDate, bloodUnitID LIMIT 5")
+                candidates = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+                conflicts = 0
+                for unit_id in candidates:
+                    try:
+                        commit_allocation(conn, req_id, [unit_id], staff_id=1)
+                        break
+                    except AllocationError:
+                        conflicts += 1
+                else:
+                    unit_id = None
+                with counters_lock:
+                    counters['conflicts'] += conflicts
+                    counters['fulfilled' if unit_id else 'unfilled'] += 1
+            finally:
+                conn.close()
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=operator) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    counters['elapsed'] = time.perf_counter() - started
+    pool.close()
+    return counters
+
+
+@app.cli.command('stress-fulfill')
+@click.option('--threads', default=16, show_default=True)
+@click.option('--units', 'unit_count', default=2000, show_default=True)
+@click.option('--requests', 'request_count', default=3000, show_default=True)
+@click.option('--database', 'db_path', default=None, help='SQLite file to use (default: a temp file).')
+def stress_fulfill_command(threads, unit_count, request_count, db_path):
+    """Fulfilment throughput with many threads against a local SQLite stand-in.
+
+    Correctness (no unit issued twice) is checked by tests/test_fulfilment.py.
+    """
+    import tempfile
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='bloodbank-stress-'), 'stress.db')
+    counters = stress_fulfilment(db_path, threads, unit_count, request_count)
+    elapsed = counters['elapsed']
+    click.echo(f"{threads} threads: {counters['fulfilled']} fulfilled, {counters['conflicts']} conflicts retried, "
+               f"{counters['unfilled']} unfilled in {elapsed:.2f}s "
+               f"({counters['fulfilled'] / elapsed:,.0f} fulfilments/s)")
+
+
+@app.cli.command('benchmark-allocation')
+@click.option('--requests', 'request_count', default=20000, show_default=True)
+@click.option('--units', 'unit_count', default=60000, show_default=True)
+@click.option('--seed', default=7, show_default=True)
+def benchmark_allocation_command(request_count, unit_count, seed):
+    """Time UnitAllocator on a synthetic queue (no database needed)."""
+    import random
+    rng = random.Random(seed)
+    groups = list(RBC_COMPATIBILITY)
+    today = date.today()
+    units = [(i, rng.choice(groups), today + timedelta(days=rng.randint(1, 42)), rng.randint(1, 10))
+             for i in range(1, unit_count + 1)]
+    pending = [{'bloodRequestID': i, 'groupName': rng.choice(groups), 'requiredUnits': rng.randint(1, 4),
+                'urgency': rng.choice(list(URGENCY_ORDER)), 'requestDate': today - timedelta(days=rng.randint(0, 30))}
+               for i in range(1, request_count + 1)]
+
+    started = time.perf_counter()
+    allocator = UnitAllocator(units)
+    allocations, unfilled = allocator.allocate_queue(pending)
+    elapsed = time.perf_counter() - started
+    click.echo(f'{request_count} requests against {unit_count} units in {elapsed * 1000:.1f} ms '
+               f'({request_count / elapsed:,.0f} requests/s); '
+               f'{len(allocations)} filled, {len(unfilled)} unfilled, {allocator.available()} units left')
+
+
+@app.cli.command('benchmark-forecast')
+@click.option('--centers', default=20, show_default=True)
+@click.option('--years', default=5, show_default=True)
+@click.option('--seed', default=7, show_default=True)
+def benchmark_forecast_command(centers, years, seed):
+    """Time project_stock on synthetic history (no database needed)."""
+    rng = np.random.default_rng(seed)
+    pairs, history_days = centers * len(RBC_COMPATIBILITY), years * 365
+    demand = rng.poisson(rng.uniform(0.2, 4, (pairs, 1)), (pairs, history_days)).astype(float)
+    supply = rng.poisson(rng.uniform(0.2, 4, (pairs, 1)), (pairs, history_days)).astype(float)
+    expiring = rng.poisson(1.0, (pairs, FORECAST_HORIZON_DAYS)).astype(float)
+    stock = rng.integers(0, 120, pairs).astype(float)
+
+    started = time.perf_counter()
+    projection = project_stock(demand, supply, expiring, stock, FORECAST_WINDOW_DAYS, FORECAST_HORIZON_DAYS)
+    elapsed = time.perf_counter() - started
+    click.echo(f'{pairs} pairs x {history_days} days projected in {elapsed * 1000:.1f} ms; '
+               f'{int((projection["days_to_stockout"] > 0).sum())} run out within {FORECAST_HORIZON_DAYS} days')
+
+
+@app.cli.command('benchmark-donations')
+@click.option('--sizes', default='1,10,1000', show_default=True, help='Donations per sp_RecordDonations call.')
+@click.option('--total', default=1000, show_default=True, help='Donations written per batch size.')
+def benchmark_donations_command(sizes, total):
+    """Donation write throughput per batch size, against the old three-statement path.
+
+    Everything runs in one transaction that is rolled back after each run, so
+    no rows are kept; per-batch commits (log flushes) are not included.
+    """
+    sizes = [int(size) for size in sizes.split(',')]
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT TOP (?) donorID FROM Donor ORDER BY donorID", (total,))
+        donor_ids = [row[0] for row in cursor.fetchall()]
+        if not donor_ids:
+            click.echo('No donors to record donations for.')
+            return
+        type_id = reference_cache.get('DonationType')[0]['donationTypeID']
+        staff = reference_cache.get('Staff')[0]
+        donations = [(donor_ids[i % len(donor_ids)], type_id, date.today(), 450.0, staff['staffID'], staff['centerID'])
+                     for i in range(total)]
+
+        def legacy(batch):
+            # add_donation before sp_RecordDonations: insert, read @@IDENTITY, insert the unit
+            for donor_id, type_id, donated, amount, staff_id, center_id in batch:
+                cursor.execute("""
+                    INSERT INTO Donation (donorID, screeningID, donationTypeID, donationDate, amountINml, collectedByStaffID)
+                    VALUES (?, NULL, ?, ?, ?, ?)
+                """, (donor_id, type_id, donated, amount, staff_id))
+                cursor.execute("SELECT @@IDENTITY AS donationID")
+                donation_id = int(cursor.fetchone()[0])
+                cursor.execute("""
+                    INSERT INTO BloodUnit (donationID, bgID, centerID, storageDate, expiryDate, latestResult, status)
+                    SELECT ?, bgID, ?, ?, ?, 'Clear', 'stored' FROM Donor WHERE donorID = ?
+                """, (donation_id, center_id, donated, donated + timedelta(days=UNIT_SHELF_LIFE_DAYS), donor_id))
+
+        runs = [('3 statements per donation', 1, legacy)]
+        runs += [(f'sp_RecordDonations x {size}', size, partial(record_donations, cursor)) for size in sizes]
+        for label, size, write in runs:
+            calls = math.ceil(total / size)
+            started = time.perf_counter()
+            for i in range(0, total, size):
+                write(donations[i:i + size])
+            elapsed = time.perf_counter() - started
+            conn.rollback()
+            click.echo(f'{label:<28} {total / elapsed:>10,.0f} donations/s  {elapsed / calls * 1000:>8.2f} ms per call')
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@app.cli.command('recall-donors')
+@click.option('--sender', type=click.Choice(sorted(RECALL_SENDERS)), default=RECALL_SENDER, show_default=True)
+@click.option('--max-donors', default=RECALL_MAX_DONORS, show_default=True)
+@click.option('--dry-run', is_flag=True, help='List shortages and count donors without notifying anyone.')
+def recall_donors_command(sender, max_donors, dry_run):
+    """Notify eligible donors about centers running short of their blood group."""
+    started = time.perf_counter()
+    summary = run_recall(RECALL_SENDERS[sender](), dry_run=dry_run, max_donors=max_donors)
+    if summary is None:
+        click.echo('Another recall is already running.')
+        return
+    for s in summary['shortages']:
+        click.echo(f"{s['bloodCenterName']:<30} {s['groupName']:<4} {s['units']:>4} of {s['threshold']} units")
+    click.echo(f"{len(summary['shortages'])} shortages, {summary['donors']:,} donors"
+               f"{' (dry run)' if dry_run else ''} in {time.perf_counter() - started:.2f}s: "
+               f"{summary['sent']:,} sent, {summary['failed']:,} failed, {summary['skipped']:,} skipped")
+
+
+@app.cli.command('benchmark-recall')
+@click.option('--donors', default=100000, show_default=True)
+@click.option('--workers', default=RECALL_WORKERS, show_default=True)
+@click.option('--batch-size', default=RECALL_BATCH_SIZE, show_default=True)
+@click.option('--rate', default=RECALL_RATE_PER_SECOND, show_default=True, help='Messages per second.')
+def benchmark_recall_command(donors, workers, batch_size, rate):
+    """Fan synthetic recall messages out to a temporary file outbox.
+
+    Measures the worker pool and rate limiter only: no database access, and
+    outcomes are counted instead of written to RecallNotification.
+    """
+    import tempfile
+
+    shortage = {'centerID': 1, 'bgID': 1, 'groupName': 'O-', 'bloodCenterName': 'Benchmark Center'}
+    messages = []
+    for donor_id in range(1, donors + 1):
+        message = {'donor_id': donor_id, 'name': f'Donor {donor_id}', 'email': f'donor{donor_id}@example.com',
+                   'contact': None, 'group': 'O-', 'shortages': [shortage]}
+        message['subject'], message['body'] = recall_text(message)
+        messages.append(message)
+
+    recorded = Counter()
+    with tempfile.TemporaryDirectory() as folder:
+        sender = FileSender(os.path.join(folder, 'outbox.jsonl'))
+        started = time.perf_counter()
+        counts = fan_out(messages, sender, record=lambda rows: recorded.update(r[4] for r in rows),
+                         workers=workers, batch_size=batch_size, rate=rate)
+        elapsed = time.perf_counter() - started
+    click.echo(f"{donors:,} donors in {elapsed:.2f}s ({donors / elapsed:,.0f}/s, limit {rate:,}/s): "
+               f"{counts['sent']:,} sent, {counts['failed']:,} failed, {sum(recorded.values()):,} recorded")
+
+
+@app.cli.command('benchmark-search')
+@click.option('--donors', default=1_000_000, show_default=True)
+@click.option('--queries', default=200, show_default=True)
+@click.option('--seed', default=7, show_default=True)
+def benchmark_search_command(donors, queries, seed):
+    """Time DonorSearchIndex lookups on synthetic donors (no database needed)."""
+    import random
+    rng = random.Random(seed)
+    first = ['Ayesha', 'Bilal', 'Fatima', 'Hamza', 'Iqra', 'Usman', 'Zainab', 'Ali', 'Sana', 'Omar',
+             'Maryam', 'Hassan', 'Noor', 'Ahmed', 'Hira', 'Saad', 'Amna', 'Tariq', 'Rabia', 'Faisal']
+    last = ['Khan', 'Ahmed', 'Malik', 'Hussain', 'Qureshi', 'Sheikh', 'Butt', 'Chaudhry', 'Raza', 'Iqbal',
+            'Siddiqui', 'Mirza', 'Javed', 'Aslam', 'Nawaz', 'Rehman', 'Abbasi', 'Baig', 'Shah', 'Zafar']
+    rows = [(i, f'{rng.choice(first)} {rng.choice(last)}{i % 997}', f'03{rng.randint(0, 999999999):09d}',
+             f'donor{i}@example.com') for i in range(1, donors + 1)]
+
+    index = DonorSearchIndex()
+    started = time.perf_counter()
+    index._bulk_load(rows)
+    index.last_refresh = time.monotonic()
+    click.echo(f'{donors:,} donors indexed in {time.perf_counter() - started:.1f}s')
+
+    samples = [rows[rng.randrange(donors)] for _ in range(queries)]
+    kinds = {
+        'phone prefix': [phone[:7] for _, _, phone, _ in samples],
+        'email': [email.upper() for _, _, _, email in samples],
+        'name': [name.lower() for _, name, _, _ in samples],
+    }
+    for kind, terms in kinds.items():
+        timings = []
+        for term in terms:
+            started = time.perf_counter()
+            index.search(term, limit=DONOR_PAGE_SIZE + 1)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        click.echo(f'{kind:>12}: mean {sum(timings) / len(timings):.2f} ms, '
+                   f'p99 {timings[int(len(timings) * 0.99) - 1]:.2f} ms, max {timings[-1]:.2f} ms (target 10 ms)')
+
+
+@app.cli.command('benchmark-queries')
+@click.argument('label')
+@click.option('--runs', default=20, show_default=True, help='Timed executions per query.')
+@click.option('--output', default='plans', show_default=True, help='Directory for the .sqlplan files.')
+def benchmark_queries_command(label, runs, output):
+    """Time the hot queries and save their estimated plans under OUTPUT/LABEL."""
+    folder = os.path.join(output, label)
+    os.makedirs(folder, exist_ok=True)
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for name, (query, params) in HOT_QUERIES.items():
+            cursor.execute("SET SHOWPLAN_XML ON")
+            try:
+                cursor.execute(query, params)
+                plan = cursor.fetchone()[0]
+            except pyodbc.Error as e:
+                # e.g. the query reads an object a later migration creates
+                click.echo(f'{name:<20} skipped: {e}')
+                continue
+            finally:
+                cursor.execute("SET SHOWPLAN_XML OFF")
+            with open(os.path.join(folder, f'{name}.sqlplan'), 'w', encoding='utf-8') as f:
+                f.write(plan)
+
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                cursor.execute(query, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            click.echo(f'{name:<20} median {timings[len(timings) // 2]:8.2f} ms   '
+                       f'max {timings[-1]:8.2f} ms')
+        cursor.close()
+    finally:
+        conn.close()
+    click.echo(f'Plans written to {folder}')
+
+
+@app.cli.command('benchmark-rows')
+@click.option('--rows', 'row_count', default=200000, show_default=True)
+@click.option('--columns', 'column_count', default=12, show_default=True)
+def benchmark_rows_command(row_count, column_count):
+    """Compare rows_to_dict_list with Row materialisation (SQLite stand-in, no server needed)."""
+    import tracemalloc
+    conn = sqlite3.connect(':memory:')
+    columns = [f'col{i}' for i in range(column_count)]
+    conn.execute(f"CREATE TABLE t ({', '.join(columns)})")
+    conn.executemany(f"INSERT INTO t VALUES ({', '.join('?' * column_count)})",
+                     ((i, f'value {i}', *range(column_count - 2)) for i in range(row_count)))
+    readers = {
+        'rows_to_dict_list': rows_to_dict_list,
+        'fetch_rows': fetch_rows,
+        'iter_rows (lazy)': lambda cursor: sum(1 for _ in iter_rows(cursor)),
+    }
+    for name, read in readers.items():
+        cursor = conn.execute('SELECT * FROM t')
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = read(cursor)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        click.echo(f'{name:<18} {elapsed * 1000:8.1f} ms   peak {peak / 2 ** 20:7.1f} MiB')
+    conn.close()
+
+
+@app.cli.command('benchmark-async')
+@click.option('--latency', default='40,60,90', show_default=True,
+              help='Simulated per-query latencies in ms, one query per value.')
+@click.option('--pages', default=20, show_default=True, help='Page loads to time.')
+@click.option('--live', is_flag=True, help='Time HOT_QUERIES against the database instead of simulated queries.')
+def benchmark_async_command(latency, pages, live):
+    """Compare serial page queries with the gathered async data layer."""
+    if live:
+        calls = [partial(execute_query, query, params) for query, params in HOT_QUERIES.values()]
+    else:
+        calls = [partial(time.sleep, int(ms) / 1000) for ms in latency.split(',')]
+
+    async def gathered():
+        await asyncio.gather(*(run_in_db_thread(call) for call in calls))
+
+    def serial():
+        for call in calls:
+            call()
+
+    for name, load in (('serial', serial), ('gathered', lambda: asyncio.run(gathered()))):
+        timings = []
+        for _ in range(pages):
+            started = time.perf_counter()
+            load()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        click.echo(f'{name:<10} median {timings[len(timings) // 2]:8.1f} ms   max {timings[-1]:8.1f} ms')
+    if not live:
+        click.echo(f'sum of queries {sum(map(int, latency.split(",")))} ms, '
+                   f'slowest query {max(map(int, latency.split(",")))} ms')
+
+
 # ---------------------------------------------------------
 # RUN APPLICATION
 # ---------------------------------------------------------
@@ -961,17 +5217,28 @@ if __name__ == '__main__':
     print("   Admin: superadmin@bloodbank.org / Admin@123")
     print("=" * 60)
     print("🚀 Starting application...")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
 
     try:
         conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1")
-            cursor.fetchone()
-            cursor.close()
-            conn.close()
-            print("✅ Database connection test successful!")
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+        conn.close()
+        print("✅ Database connection test successful!")
+
+        if REFERENCE_CACHE_WARM_ON_STARTUP and reference_cache.warm():
+            print("✅ Reference data cache warmed")
+        if SEARCH_WARM_ON_STARTUP:
+            donor_search.ensure_fresh()
+            print(f"✅ Donor search index built up to donorID {donor_search.high_water}")
     except Exception as e:
         print(f"⚠️ Database warning: {e}")
 
+    # Start the jobs now rather than on the first request - but with the debug
+    # reloader, only in the serving child, not the parent that watches files
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
+
     app.run(debug=True, port=5000)
\ No newline at end of file
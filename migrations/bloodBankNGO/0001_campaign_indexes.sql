@@ -0,0 +1,36 @@
+-- The campaign pages aggregate every child table per campaignID. The
+-- FOREIGN KEYs in bloodBankNGO.sql are not indexed, so each aggregate was a
+-- full scan. Index campaignID on each child table and INCLUDE the columns
+-- being summed, so every aggregate reads only its index.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_CampaignDonorRegistration_Campaign')
+    CREATE NONCLUSTERED INDEX IX_CampaignDonorRegistration_Campaign
+        ON CampaignDonorRegistration (campaignID, donorBloodGroup);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_CampaignDonor_Campaign')
+    CREATE NONCLUSTERED INDEX IX_CampaignDonor_Campaign
+        ON CampaignDonor (campaignID, donorBloodGroup);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_CampaignSponsorshipDetail_Campaign')
+    CREATE NONCLUSTERED INDEX IX_CampaignSponsorshipDetail_Campaign
+        ON CampaignSponsorshipDetail (campaignID)
+        INCLUDE (sponsorID, amountSponsored);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_CampaignInventory_Campaign')
+    CREATE NONCLUSTERED INDEX IX_CampaignInventory_Campaign
+        ON CampaignInventory (campaignID)
+        INCLUDE (quantityAvailable, quantityUsed);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_CampaignFeedback_Campaign')
+    CREATE NONCLUSTERED INDEX IX_CampaignFeedback_Campaign
+        ON CampaignFeedback (campaignID)
+        INCLUDE (rating);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_CampaignVolunteerAssignment_Campaign')
+    CREATE NONCLUSTERED INDEX IX_CampaignVolunteerAssignment_Campaign
+        ON CampaignVolunteerAssignment (campaignID);
+GO
@@ -0,0 +1,38 @@
+-- Links campaign donors and registrations to bloodBankSystem.Donor, written
+-- by the reconcile-campaign-donors job. One row per source row, including
+-- those that could not be linked, so the job never revisits them and staff
+-- can review the conflicts. donorID points into the other database, so it
+-- has no FOREIGN KEY.
+IF OBJECT_ID('dbo.CampaignDonorLink', 'U') IS NULL
+    CREATE TABLE CampaignDonorLink (
+        sourceTable VARCHAR(30) NOT NULL,
+        sourceID INT NOT NULL,
+        donorID INT NULL,
+        matchStatus VARCHAR(10) NOT NULL
+            CHECK (matchStatus IN ('matched', 'created', 'conflict', 'skipped')),
+        linkedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+        CONSTRAINT PK_CampaignDonorLink PRIMARY KEY (sourceTable, sourceID)
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_CampaignDonorLink_Donor')
+    CREATE NONCLUSTERED INDEX IX_CampaignDonorLink_Donor
+        ON CampaignDonorLink (donorID)
+        WHERE donorID IS NOT NULL;
+GO
+
+-- Highest source ID the job has processed, per source table. Source IDs are
+-- IDENTITY values, so everything after the checkpoint is new.
+IF OBJECT_ID('dbo.ReconcileCheckpoint', 'U') IS NULL
+    CREATE TABLE ReconcileCheckpoint (
+        sourceTable VARCHAR(30) PRIMARY KEY,
+        lastSourceID INT NOT NULL DEFAULT 0,
+        updatedAt DATETIME2 NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM ReconcileCheckpoint WHERE sourceTable = 'CampaignDonor')
+    INSERT INTO ReconcileCheckpoint (sourceTable) VALUES ('CampaignDonor');
+IF NOT EXISTS (SELECT 1 FROM ReconcileCheckpoint WHERE sourceTable = 'CampaignDonorRegistration')
+    INSERT INTO ReconcileCheckpoint (sourceTable) VALUES ('CampaignDonorRegistration');
+GO
@@ -0,0 +1,66 @@
+-- Indexes for the access paths the Flask app hits on every page load.
+-- Each statement is guarded so the script can also be run by hand.
+
+-- BloodUnit: dashboard count + expiry alerts, fulfill matches. Stock per
+-- center and group comes from the v_InventorySummary indexed view (0002).
+-- Filtered on status = 'stored' so used/expired units never enter the index.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodUnit_Stored_Expiry')
+    CREATE NONCLUSTERED INDEX IX_BloodUnit_Stored_Expiry
+        ON BloodUnit (expiryDate)
+        INCLUDE (bgID, centerID)
+        WHERE status = 'stored';
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodUnit_Stored_Group_Expiry')
+    CREATE NONCLUSTERED INDEX IX_BloodUnit_Stored_Group_Expiry
+        ON BloodUnit (bgID, expiryDate)
+        INCLUDE (centerID)
+        WHERE status = 'stored';
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodUnit_Status_Expiry')
+    CREATE NONCLUSTERED INDEX IX_BloodUnit_Status_Expiry
+        ON BloodUnit (status, expiryDate);
+GO
+
+-- Donation: donor history (donor_detail) and today's count (dashboard).
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Donation_Donor_Date')
+    CREATE NONCLUSTERED INDEX IX_Donation_Donor_Date
+        ON Donation (donorID, donationDate DESC)
+        INCLUDE (amountINml, collectedByStaffID, donationTypeID);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Donation_Date')
+    CREATE NONCLUSTERED INDEX IX_Donation_Date
+        ON Donation (donationDate)
+        INCLUDE (donorID);
+GO
+
+-- BloodRequest: requests list (pending first, newest first), today's count,
+-- and the pending queue.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodRequest_Status_Date')
+    CREATE NONCLUSTERED INDEX IX_BloodRequest_Status_Date
+        ON BloodRequest (requestStatus, requestDate DESC)
+        INCLUDE (hospitalID, patientID, bgID_Requested, requiredUnits, urgency);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodRequest_Date')
+    CREATE NONCLUSTERED INDEX IX_BloodRequest_Date
+        ON BloodRequest (requestDate);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodRequest_Pending')
+    CREATE NONCLUSTERED INDEX IX_BloodRequest_Pending
+        ON BloodRequest (urgency, requestDate)
+        INCLUDE (bgID_Requested, requiredUnits)
+        WHERE requestStatus = 'pending';
+GO
+
+-- UserLogin: login looks up by username; cover the columns it reads so the
+-- lookup is a single seek instead of seek + key lookup. Uniqueness is already
+-- enforced by the table's UNIQUE constraint, so this index is not unique.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_UserLogin_Username')
+    CREATE NONCLUSTERED INDEX IX_UserLogin_Username
+        ON UserLogin (username)
+        INCLUDE (userRole, staffID, doctorID, passwordHash, plainPassword, isActive);
+GO
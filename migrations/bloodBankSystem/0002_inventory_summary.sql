@@ -0,0 +1,35 @@
+-- Materialized stock per center and blood group. SQL Server maintains the
+-- indexed view inside every BloodUnit insert/update, so add_donation,
+-- fulfill_request and expiry all keep it current.
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+IF OBJECT_ID('dbo.v_InventorySummary', 'V') IS NOT NULL
+    DROP VIEW dbo.v_InventorySummary;
+GO
+
+CREATE VIEW dbo.v_InventorySummary
+WITH SCHEMABINDING
+AS
+SELECT bu.centerID,
+       bu.bgID,
+       COUNT_BIG(*) AS TotalUnits
+FROM dbo.BloodUnit bu
+WHERE bu.status = 'stored'
+GROUP BY bu.centerID, bu.bgID;
+GO
+
+CREATE UNIQUE CLUSTERED INDEX UX_v_InventorySummary
+    ON dbo.v_InventorySummary (centerID, bgID);
+GO
+
+-- Keep v_LiveInventory's name and columns for other readers, served from the summary.
+ALTER VIEW v_LiveInventory AS
+SELECT c.bloodCenterName,
+       bg.groupName AS BloodGroup,
+       CAST(s.TotalUnits AS INT) AS TotalUnits
+FROM dbo.v_InventorySummary s WITH (NOEXPAND)
+JOIN BloodGroup bg ON s.bgID = bg.bgID
+JOIN BloodBankCenter c ON s.centerID = c.centerID;
+GO
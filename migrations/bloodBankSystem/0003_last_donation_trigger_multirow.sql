@@ -0,0 +1,20 @@
+-- trg_UpdateLastDonation joined Donor to every inserted row, so a multi-row
+-- insert with several donations for one donor set an arbitrary date, and a
+-- back-dated donation could move lastDonationDate backwards. Take the latest
+-- date per donor and only ever move forward.
+ALTER TRIGGER trg_UpdateLastDonation
+ON Donation
+AFTER INSERT
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    UPDATE d
+    SET lastDonationDate = i.lastDate
+    FROM Donor d
+    JOIN (SELECT donorID, MAX(donationDate) AS lastDate
+          FROM inserted
+          GROUP BY donorID) i ON d.donorID = i.donorID
+    WHERE d.lastDonationDate IS NULL OR d.lastDonationDate < i.lastDate;
+END;
+GO
@@ -0,0 +1,196 @@
+-- Daily rollups behind /analytics. The page used to GROUP BY all of
+-- BloodRequest and Donation on every view; it now sums these tables over a
+-- date window instead.
+--
+-- sp_RefreshAnalyticsRollups keeps them current from a per-source rowversion
+-- high-water mark, not from the business date: a donation entered today for
+-- last month, a historical import or a late intake flush all get a new
+-- rowversion, so their day is re-aggregated on the next run whatever its
+-- date. Each run re-aggregates only the days touched since the last one and
+-- replaces those days wholesale. Rows still being written when a run starts
+-- are at or above MIN_ACTIVE_ROWVERSION() and are left for the next run.
+--
+-- Deleting a row, or moving it to another day, leaves the old day's figures
+-- as they were; run the refresh with @rebuild = 1 after such corrections.
+
+IF COL_LENGTH('dbo.Donation', 'rowVer') IS NULL
+    ALTER TABLE Donation ADD rowVer ROWVERSION;
+GO
+
+IF COL_LENGTH('dbo.BloodRequest', 'rowVer') IS NULL
+    ALTER TABLE BloodRequest ADD rowVer ROWVERSION;
+GO
+
+-- "Which days changed since the mark?" as a range seek
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Donation_RowVer')
+    CREATE NONCLUSTERED INDEX IX_Donation_RowVer
+        ON Donation (rowVer)
+        INCLUDE (donationDate);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodRequest_RowVer')
+    CREATE NONCLUSTERED INDEX IX_BloodRequest_RowVer
+        ON BloodRequest (rowVer)
+        INCLUDE (requestDate);
+GO
+
+-- DonationDailyByCenter finds each donation's unit by donationID
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_BloodUnit_Donation')
+    CREATE NONCLUSTERED INDEX IX_BloodUnit_Donation
+        ON BloodUnit (donationID)
+        INCLUDE (centerID);
+GO
+
+IF OBJECT_ID('dbo.AnalyticsWatermark', 'U') IS NULL
+    CREATE TABLE AnalyticsWatermark (
+        sourceTable VARCHAR(50) PRIMARY KEY,
+        highWaterVersion BINARY(8) NULL,
+        refreshedAt DATETIME2 NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM AnalyticsWatermark WHERE sourceTable = 'BloodRequest')
+    INSERT INTO AnalyticsWatermark (sourceTable) VALUES ('BloodRequest');
+IF NOT EXISTS (SELECT 1 FROM AnalyticsWatermark WHERE sourceTable = 'Donation')
+    INSERT INTO AnalyticsWatermark (sourceTable) VALUES ('Donation');
+GO
+
+IF OBJECT_ID('dbo.RequestDailyByGroup', 'U') IS NULL
+    CREATE TABLE RequestDailyByGroup (
+        rollupDate DATE NOT NULL,
+        bgID INT NOT NULL,
+        requestCount INT NOT NULL,
+        unitsRequested INT NOT NULL,
+        CONSTRAINT PK_RequestDailyByGroup PRIMARY KEY (rollupDate, bgID)
+    );
+GO
+
+IF OBJECT_ID('dbo.RequestDailyByHospital', 'U') IS NULL
+    CREATE TABLE RequestDailyByHospital (
+        rollupDate DATE NOT NULL,
+        hospitalID INT NOT NULL,
+        requestCount INT NOT NULL,
+        unitsRequested INT NOT NULL,
+        CONSTRAINT PK_RequestDailyByHospital PRIMARY KEY (rollupDate, hospitalID)
+    );
+GO
+
+IF OBJECT_ID('dbo.DonationDailyByDonor', 'U') IS NULL
+    CREATE TABLE DonationDailyByDonor (
+        rollupDate DATE NOT NULL,
+        donorID INT NOT NULL,
+        donationCount INT NOT NULL,
+        amountINml DECIMAL(12,2) NOT NULL,
+        CONSTRAINT PK_DonationDailyByDonor PRIMARY KEY (rollupDate, donorID)
+    );
+GO
+
+IF OBJECT_ID('dbo.DonationDailyByCenter', 'U') IS NULL
+    CREATE TABLE DonationDailyByCenter (
+        rollupDate DATE NOT NULL,
+        centerID INT NOT NULL,
+        donationCount INT NOT NULL,
+        amountINml DECIMAL(12,2) NOT NULL,
+        CONSTRAINT PK_DonationDailyByCenter PRIMARY KEY (rollupDate, centerID)
+    );
+GO
+
+CREATE OR ALTER PROCEDURE sp_RefreshAnalyticsRollups
+    @rebuild BIT = 0
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @requestFrom BINARY(8), @donationFrom BINARY(8), @rollupRows INT = 0;
+    -- Every row below this is committed; the next run starts here
+    DECLARE @upTo BINARY(8) = CAST(MIN_ACTIVE_ROWVERSION() AS BINARY(8));
+    DECLARE @requestDays TABLE (rollupDate DATE PRIMARY KEY);
+    DECLARE @donationDays TABLE (rollupDate DATE PRIMARY KEY);
+
+    BEGIN TRANSACTION;
+
+    -- UPDLOCK serialises concurrent refreshes (one per app instance)
+    SELECT @requestFrom = CASE WHEN @rebuild = 1 THEN NULL ELSE highWaterVersion END
+    FROM AnalyticsWatermark WITH (UPDLOCK, HOLDLOCK)
+    WHERE sourceTable = 'BloodRequest';
+
+    SELECT @donationFrom = CASE WHEN @rebuild = 1 THEN NULL ELSE highWaterVersion END
+    FROM AnalyticsWatermark WITH (UPDLOCK, HOLDLOCK)
+    WHERE sourceTable = 'Donation';
+
+    SET @requestFrom = ISNULL(@requestFrom, 0x0000000000000000);
+    SET @donationFrom = ISNULL(@donationFrom, 0x0000000000000000);
+
+    IF @rebuild = 1
+    BEGIN
+        -- Also drops days whose rows have all been deleted since
+        DELETE FROM RequestDailyByGroup;
+        DELETE FROM RequestDailyByHospital;
+        DELETE FROM DonationDailyByDonor;
+        DELETE FROM DonationDailyByCenter;
+    END;
+
+    INSERT INTO @requestDays (rollupDate)
+    SELECT DISTINCT requestDate
+    FROM BloodRequest
+    WHERE rowVer >= @requestFrom AND rowVer < @upTo AND requestDate IS NOT NULL;
+
+    INSERT INTO @donationDays (rollupDate)
+    SELECT DISTINCT donationDate
+    FROM Donation
+    WHERE rowVer >= @donationFrom AND rowVer < @upTo AND donationDate IS NOT NULL;
+
+    DELETE r FROM RequestDailyByGroup r JOIN @requestDays d ON r.rollupDate = d.rollupDate;
+    INSERT INTO RequestDailyByGroup (rollupDate, bgID, requestCount, unitsRequested)
+    SELECT br.requestDate, br.bgID_Requested, COUNT(*), SUM(br.requiredUnits)
+    FROM BloodRequest br
+    JOIN @requestDays d ON br.requestDate = d.rollupDate
+    GROUP BY br.requestDate, br.bgID_Requested;
+    SET @rollupRows += @@ROWCOUNT;
+
+    DELETE r FROM RequestDailyByHospital r JOIN @requestDays d ON r.rollupDate = d.rollupDate;
+    INSERT INTO RequestDailyByHospital (rollupDate, hospitalID, requestCount, unitsRequested)
+    SELECT br.requestDate, br.hospitalID, COUNT(*), SUM(br.requiredUnits)
+    FROM BloodRequest br
+    JOIN @requestDays d ON br.requestDate = d.rollupDate
+    WHERE br.hospitalID IS NOT NULL
+    GROUP BY br.requestDate, br.hospitalID;
+    SET @rollupRows += @@ROWCOUNT;
+
+    DELETE r FROM DonationDailyByDonor r JOIN @donationDays d ON r.rollupDate = d.rollupDate;
+    INSERT INTO DonationDailyByDonor (rollupDate, donorID, donationCount, amountINml)
+    SELECT do.donationDate, do.donorID, COUNT(*), SUM(do.amountINml)
+    FROM Donation do
+    JOIN @donationDays d ON do.donationDate = d.rollupDate
+    GROUP BY do.donationDate, do.donorID;
+    SET @rollupRows += @@ROWCOUNT;
+
+    -- The collecting center is the one the donation's unit was stored at
+    -- (sp_RecordDonations sets it per donation); the collector's home center
+    -- only stands in for donations that have no unit.
+    DELETE r FROM DonationDailyByCenter r JOIN @donationDays d ON r.rollupDate = d.rollupDate;
+    INSERT INTO DonationDailyByCenter (rollupDate, centerID, donationCount, amountINml)
+    SELECT do.donationDate, COALESCE(bu.centerID, s.centerID), COUNT(*), SUM(do.amountINml)
+    FROM Donation do
+    JOIN @donationDays d ON do.donationDate = d.rollupDate
+    OUTER APPLY (SELECT TOP (1) u.centerID FROM BloodUnit u
+                 WHERE u.donationID = do.donationID ORDER BY u.bloodUnitID) bu
+    LEFT JOIN Staff s ON do.collectedByStaffID = s.staffID
+    WHERE COALESCE(bu.centerID, s.centerID) IS NOT NULL
+    GROUP BY do.donationDate, COALESCE(bu.centerID, s.centerID);
+    SET @rollupRows += @@ROWCOUNT;
+
+    UPDATE AnalyticsWatermark
+    SET highWaterVersion = @upTo, refreshedAt = SYSDATETIME()
+    WHERE sourceTable IN ('BloodRequest', 'Donation');
+
+    COMMIT TRANSACTION;
+
+    SELECT @rollupRows AS RollupRows;
+END;
+GO
+
+-- Initial fill
+EXEC sp_RefreshAnalyticsRollups @rebuild = 1;
+GO
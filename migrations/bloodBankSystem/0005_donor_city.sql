@@ -0,0 +1,16 @@
+-- Donor.city: the app used to recover the city on every donor_detail view by
+-- reversing the address string around its last comma. Store it once when
+-- the donor is written instead.
+IF COL_LENGTH('dbo.Donor', 'city') IS NULL
+    ALTER TABLE Donor ADD city VARCHAR(50) NULL;
+GO
+
+-- Backfill existing donors with the expression donor_detail used.
+UPDATE Donor
+SET city = LEFT(LTRIM(CASE
+               WHEN CHARINDEX(',', REVERSE(address)) > 0
+               THEN REVERSE(LEFT(REVERSE(address), CHARINDEX(',', REVERSE(address)) - 1))
+               ELSE address
+           END), 50)
+WHERE city IS NULL AND address IS NOT NULL;
+GO
@@ -0,0 +1,19 @@
+-- Donor.nextEligibleDate: the first day a donor may give blood again (90
+-- days after lastDonationDate; 1900-01-01 for donors who never donated, so
+-- "eligible on @day" is always the single range nextEligibleDate <= @day).
+--
+-- A persisted computed column rather than a second trigger write: it is
+-- maintained by every write to lastDonationDate, which trg_UpdateLastDonation
+-- already does on each Donation insert (migration 0003), and can never drift.
+IF COL_LENGTH('dbo.Donor', 'nextEligibleDate') IS NULL
+    ALTER TABLE Donor ADD nextEligibleDate AS
+        ISNULL(DATEADD(DAY, 90, lastDonationDate), CONVERT(DATE, '19000101', 112)) PERSISTED;
+GO
+
+-- "Eligible donors of group X in city Y" is a seek on (bgID, city) plus a
+-- range scan on nextEligibleDate, longest-waiting donors first.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Donor_Group_City_NextEligible')
+    CREATE NONCLUSTERED INDEX IX_Donor_Group_City_NextEligible
+        ON Donor (bgID, city, nextEligibleDate)
+        INCLUDE (name, contactNo, donorEmail);
+GO
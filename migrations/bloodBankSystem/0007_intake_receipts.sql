@@ -0,0 +1,13 @@
+-- Campaign intake queues submissions locally and commits them in batches.
+-- Each submission carries a client-generated ID; recording it here in the
+-- same transaction as the Donor/Donation/BloodUnit rows makes a retried
+-- batch (e.g. after a commit whose acknowledgement was lost on a flaky
+-- link) skip the submissions that already made it.
+IF OBJECT_ID('dbo.IntakeReceipt', 'U') IS NULL
+    CREATE TABLE IntakeReceipt (
+        clientID VARCHAR(64) PRIMARY KEY,
+        donorID INT NOT NULL REFERENCES Donor(donorID),
+        donationID INT NOT NULL REFERENCES Donation(donationID),
+        receivedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+    );
+GO
@@ -0,0 +1,73 @@
+-- sp_RecordDonations: the one write path for donations. Takes any number of
+-- donations as a table-valued parameter and inserts the Donation rows and
+-- their BloodUnit rows in one call, returning the new IDs per input row.
+--
+-- IDs come back through OUTPUT ... INTO table variables. SELECT @@IDENTITY
+-- after the insert (what add_donation did) returns the last identity made
+-- in the session, which trg_UpdateLastDonation's writes can change, and
+-- a plain OUTPUT clause is not allowed on a table with triggers.
+--
+-- Needs SQL Server 2017+ (STRING_AGG, CREATE OR ALTER). Clients must pass
+-- the table-valued parameter through Microsoft ODBC Driver 17/18; the
+-- legacy {SQL Server} driver cannot send one.
+IF TYPE_ID('dbo.DonationBatch') IS NULL
+    CREATE TYPE dbo.DonationBatch AS TABLE (
+        rowNo INT NOT NULL PRIMARY KEY,
+        donorID INT NOT NULL,
+        donationTypeID INT NOT NULL,
+        donationDate DATE NOT NULL,
+        amountINml DECIMAL(10,2) NOT NULL,
+        staffID INT NOT NULL,
+        centerID INT NOT NULL
+    );
+GO
+
+CREATE OR ALTER PROCEDURE sp_RecordDonations
+    @donations dbo.DonationBatch READONLY,
+    @shelfLifeDays INT = 90
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @missing NVARCHAR(2000) = (
+        SELECT STRING_AGG(CAST(s.donorID AS NVARCHAR(12)), ', ')
+        FROM @donations s
+        LEFT JOIN Donor d ON d.donorID = s.donorID
+        WHERE d.donorID IS NULL
+    );
+    IF @missing IS NOT NULL
+    BEGIN
+        DECLARE @message NVARCHAR(2048) = CONCAT(N'Unknown donorID: ', @missing);
+        THROW 50001, @message, 1;
+    END;
+
+    DECLARE @donationIDs TABLE (rowNo INT PRIMARY KEY, donationID INT NOT NULL);
+    DECLARE @unitIDs TABLE (donationID INT PRIMARY KEY, bloodUnitID INT NOT NULL);
+
+    BEGIN TRANSACTION;
+
+    -- MERGE rather than INSERT so OUTPUT can return the source rowNo
+    MERGE Donation AS target
+    USING @donations AS src ON 1 = 0
+    WHEN NOT MATCHED THEN
+        INSERT (donorID, screeningID, donationTypeID, donationDate, amountINml, collectedByStaffID)
+        VALUES (src.donorID, NULL, src.donationTypeID, src.donationDate, src.amountINml, src.staffID)
+    OUTPUT src.rowNo, INSERTED.donationID INTO @donationIDs (rowNo, donationID);
+
+    INSERT INTO BloodUnit (donationID, bgID, centerID, storageDate, expiryDate, latestResult, status)
+    OUTPUT INSERTED.donationID, INSERTED.bloodUnitID INTO @unitIDs (donationID, bloodUnitID)
+    SELECT m.donationID, d.bgID, s.centerID, s.donationDate,
+           DATEADD(DAY, @shelfLifeDays, s.donationDate), 'Clear', 'stored'
+    FROM @donationIDs m
+    JOIN @donations s ON s.rowNo = m.rowNo
+    JOIN Donor d ON d.donorID = s.donorID;
+
+    COMMIT TRANSACTION;
+
+    SELECT m.rowNo, m.donationID, u.bloodUnitID
+    FROM @donationIDs m
+    JOIN @unitIDs u ON u.donationID = m.donationID
+    ORDER BY m.rowNo;
+END;
+GO
@@ -0,0 +1,30 @@
+-- One row per donor contacted (or attempted) about a shortage of one blood
+-- group at one center, written by the donor recall engine. The recall
+-- reads it back to avoid repeats. A donor who was sent a recall within the
+-- cooldown is not selected again, and a shortage that was recalled
+-- recently is left alone until its cooldown ends.
+IF OBJECT_ID('dbo.RecallNotification', 'U') IS NULL
+    CREATE TABLE RecallNotification (
+        recallID BIGINT IDENTITY(1,1) PRIMARY KEY,
+        donorID INT NOT NULL REFERENCES Donor(donorID),
+        centerID INT NOT NULL REFERENCES BloodBankCenter(centerID),
+        bgID INT NOT NULL REFERENCES BloodGroup(bgID),
+        channel VARCHAR(20) NOT NULL,
+        status VARCHAR(10) NOT NULL CHECK (status IN ('sent', 'failed', 'skipped')),
+        error VARCHAR(300) NULL,
+        sentAt DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+    );
+GO
+
+-- find_eligible_donors' NOT EXISTS probe: "sent to this donor since @day?"
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RecallNotification_Donor_Sent')
+    CREATE NONCLUSTERED INDEX IX_RecallNotification_Donor_Sent
+        ON RecallNotification (donorID, sentAt)
+        WHERE status = 'sent';
+GO
+
+-- Shortages recalled within the cooldown
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RecallNotification_Sent_Center_Group')
+    CREATE NONCLUSTERED INDEX IX_RecallNotification_Sent_Center_Group
+        ON RecallNotification (sentAt, centerID, bgID);
+GO
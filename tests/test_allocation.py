@@ -0,0 +1,117 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app import RBC_COMPATIBILITY, UnitAllocator
+
+GROUPS = ['O-', 'O+', 'A-', 'A+', 'B-', 'B+', 'AB-', 'AB+']
+
+# Red cells a recipient can receive, written out from the ABO/Rh rules rather
+# than derived from RBC_COMPATIBILITY: donor antigens must be a subset of the
+# recipient's, and Rh+ cells only go to Rh+ recipients.
+ACCEPTS = {
+    'O-': {'O-'},
+    'O+': {'O-', 'O+'},
+    'A-': {'O-', 'A-'},
+    'A+': {'O-', 'O+', 'A-', 'A+'},
+    'B-': {'O-', 'B-'},
+    'B+': {'O-', 'O+', 'B-', 'B+'},
+    'AB-': {'O-', 'A-', 'B-', 'AB-'},
+    'AB+': set(GROUPS),
+}
+
+TODAY = date(2025, 1, 1)
+
+
+def day(n):
+    return TODAY + timedelta(days=n)
+
+
+def test_table_covers_every_group():
+    assert set(RBC_COMPATIBILITY) == set(GROUPS)
+    assert {group: set(donors) for group, donors in RBC_COMPATIBILITY.items()} == ACCEPTS
+    assert all(donors[0] == group for group, donors in RBC_COMPATIBILITY.items())
+
+
+@pytest.mark.parametrize('recipient', GROUPS)
+@pytest.mark.parametrize('donor', GROUPS)
+def test_recipient_accepts_only_compatible_units(recipient, donor):
+    allocator = UnitAllocator([(1, donor, day(5), 1)])
+    units = allocator.allocate(recipient, 1)
+    if donor in ACCEPTS[recipient]:
+        assert [u['bloodUnitID'] for u in units] == [1]
+        assert allocator.available() == 0
+    else:
+        assert units == []
+        assert allocator.available() == 1
+
+
+@pytest.mark.parametrize('recipient', GROUPS)
+def test_recipient_drains_exactly_its_compatible_stock(recipient):
+    allocator = UnitAllocator([(i, group, day(i), 1) for i, group in enumerate(GROUPS, start=1)])
+    units = allocator.allocate(recipient, len(ACCEPTS[recipient]))
+    assert {u['groupName'] for u in units} == ACCEPTS[recipient]
+    assert allocator.allocate(recipient, 1) == []
+    assert allocator.available() == len(GROUPS) - len(ACCEPTS[recipient])
+
+
+def test_earliest_expiry_first_across_groups():
+    allocator = UnitAllocator([
+        (1, 'A+', day(9), 1),
+        (2, 'O-', day(2), 1),
+        (3, 'A-', day(5), 2),
+        (4, 'O+', day(1), 3),
+        (5, 'B+', day(0), 1),   # incompatible with A+, however soon it expires
+    ])
+    units = allocator.allocate('A+', 4)
+    assert [u['bloodUnitID'] for u in units] == [4, 2, 3, 1]
+    assert [u['expiryDate'] for u in units] == [day(1), day(2), day(5), day(9)]
+    assert units[0] == {'bloodUnitID': 4, 'groupName': 'O+', 'expiryDate': day(1), 'centerID': 3}
+
+
+def test_same_expiry_prefers_identical_group():
+    allocator = UnitAllocator([(1, 'O-', day(3), 1), (2, 'A+', day(3), 1), (3, 'O+', day(3), 1)])
+    assert [u['bloodUnitID'] for u in allocator.allocate('A+', 3)] == [2, 3, 1]
+
+
+def test_partial_fill_takes_nothing():
+    allocator = UnitAllocator([(1, 'B-', day(1), 1), (2, 'O-', day(2), 1), (3, 'B+', day(3), 1)])
+    assert allocator.allocate('B-', 3) == []
+    assert allocator.available() == 3
+    # The units put back are still handed out in expiry order
+    assert [u['bloodUnitID'] for u in allocator.allocate('B-', 2)] == [1, 2]
+
+
+def test_unknown_group_only_matches_itself():
+    allocator = UnitAllocator([(1, 'O-', day(1), 1), (2, 'Bombay', day(2), 1)])
+    assert [u['bloodUnitID'] for u in allocator.allocate('Bombay', 1)] == [2]
+    assert allocator.allocate('Bombay', 1) == []
+
+
+def make_request(req_id, group, units, urgency, age):
+    return {'bloodRequestID': req_id, 'groupName': group, 'requiredUnits': units,
+            'urgency': urgency, 'requestDate': TODAY - timedelta(days=age)}
+
+
+def test_queue_serves_urgency_then_age():
+    allocator = UnitAllocator([(i, 'O-', day(i), 1) for i in range(1, 5)])
+    pending = [
+        make_request(1, 'A+', 2, 'Low', 10),
+        make_request(2, 'B+', 2, 'High', 0),
+        make_request(3, 'O-', 1, 'Medium', 1),
+        make_request(4, 'AB+', 1, 'Medium', 5),
+        make_request(5, 'O+', 1, None, 30),
+    ]
+    allocations, unfilled = allocator.allocate_queue(pending)
+    assert [(req['bloodRequestID'], [u['bloodUnitID'] for u in units]) for req, units in allocations] == \
+        [(2, [1, 2]), (4, [3]), (3, [4])]
+    assert [req['bloodRequestID'] for req in unfilled] == [1, 5]
+
+
+def test_queue_skips_unfillable_request_without_blocking_smaller_ones():
+    allocator = UnitAllocator([(1, 'A+', day(1), 1), (2, 'A+', day(2), 1)])
+    pending = [make_request(1, 'A+', 3, 'High', 0), make_request(2, 'A+', 2, 'Low', 0)]
+    allocations, unfilled = allocator.allocate_queue(pending)
+    assert [req['bloodRequestID'] for req, _ in allocations] == [2]
+    assert [req['bloodRequestID'] for req in unfilled] == [1]
+    assert allocator.available() == 0
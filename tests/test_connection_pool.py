@@ -0,0 +1,185 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def opened():
+    """Every raw sqlite3 connection the pool's factory created, in order"""
+    return []
+
+
+@pytest.fixture
+def make_pool(opened):
+    pools = []
+
+    def factory():
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        opened.append(conn)
+        return conn
+
+    def make(**options):
+        options.setdefault('acquire_timeout', 1)
+        pool = ConnectionPool(factory, name='test', **options)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def query_one(conn, sql):
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    value = cursor.fetchone()[0]
+    cursor.close()
+    return value
+
+
+def test_released_connection_is_reused(make_pool, opened):
+    pool = make_pool(max_size=2)
+    with pool.acquire() as conn:
+        assert query_one(conn, 'SELECT 1') == 1
+    with pool.acquire() as conn:
+        assert query_one(conn, 'SELECT 2') == 2
+
+    assert len(opened) == 1
+    metrics = pool.metrics()
+    assert metrics['created'] == 1
+    assert metrics['acquired'] == 2
+
+
+def test_close_twice_returns_connection_once(make_pool):
+    pool = make_pool(max_size=2)
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    assert pool.metrics()['idle'] == 1
+
+
+def test_release_rolls_back_open_transaction(make_pool):
+    pool = make_pool(max_size=1)
+    with pool.acquire() as conn:
+        conn.execute('CREATE TABLE t (x INT)')
+        conn.commit()
+        conn.execute('INSERT INTO t VALUES (1)')
+    with pool.acquire() as conn:
+        assert query_one(conn, 'SELECT COUNT(*) FROM t') == 0
+
+
+def test_failed_health_check_replaces_connection(make_pool, opened):
+    pool = make_pool(max_size=2, health_check_after=0)
+    pool.acquire().close()
+    opened[0].close()  # the server dropped it while it sat idle
+
+    with pool.acquire() as conn:
+        assert query_one(conn, 'SELECT 1') == 1
+
+    assert len(opened) == 2
+    metrics = pool.metrics()
+    assert metrics['health_check_failures'] == 1
+    assert metrics['created'] == 2
+    assert metrics['size'] == 1
+
+
+def test_recently_used_connection_is_not_pinged(make_pool, opened):
+    pool = make_pool(max_size=1, health_check_after=60)
+    pool.acquire().close()
+    pool.acquire().close()
+    assert pool.metrics()['health_check_failures'] == 0
+    assert len(opened) == 1
+
+
+def test_idle_connections_are_evicted(make_pool, opened):
+    pool = make_pool(max_size=3, idle_timeout=0.05)
+    conns = [pool.acquire() for _ in range(3)]
+    for conn in conns:
+        conn.close()
+    assert pool.metrics()['idle'] == 3
+
+    time.sleep(0.1)
+    pool.acquire().close()
+
+    metrics = pool.metrics()
+    assert metrics['evicted_idle'] == 3
+    assert metrics['size'] == 1
+    assert metrics['idle'] == 1
+    assert len(opened) == 4
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute('SELECT 1')
+
+
+def test_acquire_times_out_at_max_size(make_pool):
+    pool = make_pool(max_size=2)
+    held = [pool.acquire(), pool.acquire()]
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+
+    metrics = pool.metrics()
+    assert metrics['timeouts'] == 1
+    assert metrics['size'] == 2
+    assert metrics['in_use'] == 2
+    for conn in held:
+        conn.close()
+
+
+def test_waiter_gets_released_connection(make_pool):
+    pool = make_pool(max_size=1)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=2)))
+    waiter.start()
+
+    time.sleep(0.05)
+    assert not got
+    held.close()
+    waiter.join(2)
+
+    assert len(got) == 1
+    metrics = pool.metrics()
+    assert metrics['waits'] >= 1
+    assert metrics['created'] == 1
+    assert metrics['wait_seconds'] > 0
+    got[0].close()
+
+
+def test_concurrent_use_never_exceeds_max_size(make_pool, opened):
+    pool = make_pool(max_size=4, acquire_timeout=5)
+    peak = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(50):
+            with pool.acquire() as conn:
+                with lock:
+                    peak.append(pool.metrics()['in_use'])
+                query_one(conn, 'SELECT 1')
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    metrics = pool.metrics()
+    assert max(peak) <= 4
+    assert len(opened) <= 4
+    assert metrics['acquired'] == 400
+    assert metrics['in_use'] == 0
+    assert metrics['timeouts'] == 0
+
+
+def test_closed_pool_refuses_checkouts(make_pool):
+    pool = make_pool(max_size=1)
+    pool.acquire().close()
+    pool.close()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.metrics()['size'] == 0
@@ -0,0 +1,112 @@
+import time
+from unittest import mock
+
+import pytest
+
+import app
+from app import DonorSearchIndex, fetch_donor_page
+
+DONORS = [
+    (1, 'Ayesha Khan', '0300-1234567', 'ayesha@example.com'),
+    (2, 'Bilal Ahmed', '0301 7654321', 'bilal@example.com'),
+    (3, 'Ayesha Malik', '(0300) 1239999', 'AYESHA.M@example.com'),
+    (4, 'Hamza Qureshi', '0321-5550000', None),
+    (5, 'Ayesha Khan', '0300-1234000', 'ak2@example.com'),
+    (6, 'Al', '0333-0000001', 'al@example.com'),
+]
+
+
+@pytest.fixture
+def index():
+    index = DonorSearchIndex()
+    index._bulk_load(DONORS)
+    index.last_refresh = time.monotonic()   # keep ensure_fresh off the database
+    return index
+
+
+@pytest.mark.parametrize('term, expected', [
+    ('0300', [5, 3, 1]),
+    ('0300-123', [5, 3, 1]),
+    ('(0300) 12345', [1]),
+    ('03001234567', [1]),
+    ('0399', []),
+])
+def test_phone_prefix_bisect(index, term, expected):
+    assert index.search(term) == expected
+
+
+@pytest.mark.parametrize('term, expected', [
+    ('ayesha@example.com', [1]),
+    ('Ayesha.M@Example.com', [3]),
+    ('  bilal@example.com ', [2]),
+    ('ayesha@example', []),
+])
+def test_email_is_exact_and_case_insensitive(index, term, expected):
+    assert index.search(term) == expected
+
+
+def test_name_trigrams_tolerate_typos(index):
+    assert index.search('ayesha khan') == [5, 1]
+    assert index.search('Aysha Khan') == [5, 1]
+    assert index.search('hamza qureshy') == [4]
+    assert index.search('zzzz') == []
+
+
+@pytest.mark.parametrize('term, expected', [
+    ('al', [6, 2]),     # Al, and Bilal Ahmed: a word starting 'a' and one ending 'al'
+    ('A', []),
+    ('03', []),     # too few digits for a phone prefix, searched as a name
+])
+def test_one_and_two_character_queries(index, term, expected):
+    assert index.search(term) == expected
+
+
+def test_blank_query_matches_nothing(index):
+    assert index.search('') == []
+    assert index.search('   ') == []
+
+
+def test_before_and_limit_page_newest_first(index):
+    assert index.search('0300', limit=2) == [5, 3]
+    assert index.search('0300', before=5) == [3, 1]
+    assert index.search('ayesha', before=5, limit=1) == [3]
+
+
+def test_add_is_searchable_after_lookups(index):
+    index.search('ayesha khan')
+    index.add(7, 'Ayesha Khanum', '0300-1230000', 'New@Example.com')
+    assert index.search('ayesha khan')[0] == 7
+    assert index.search('0300-123') == [7, 5, 3, 1]
+    assert index.search('new@example.com') == [7]
+
+
+def test_add_is_ignored_until_built():
+    index = DonorSearchIndex()
+    index.add(1, 'Ayesha Khan', '0300-1234567', 'ayesha@example.com')
+    assert not index.built and index.high_water == 0
+
+
+def test_unbuilt_index_reports_unavailable():
+    index = DonorSearchIndex()
+    with mock.patch.object(index, '_stream_donors', side_effect=RuntimeError('no database')):
+        assert index.search('ayesha') is None
+
+
+def test_fetch_donor_page_uses_index_ids():
+    with mock.patch.object(app.donor_search, 'search', return_value=[5, 1]), \
+            mock.patch.object(app, 'execute_query', return_value=[]) as execute:
+        fetch_donor_page('ayesha khan', page_size=10)
+    sql, params = execute.call_args[0]
+    assert 'd.donorID IN (?, ?)' in sql and 'LIKE' not in sql
+    assert params == [11, 5, 1]
+
+
+def test_fetch_donor_page_falls_back_to_like():
+    rows = [{'donorID': donor_id} for donor_id in (9, 8, 7)]
+    with mock.patch.object(app.donor_search, 'search', return_value=None), \
+            mock.patch.object(app, 'execute_query', return_value=rows) as execute:
+        page, next_after = fetch_donor_page('khan', after_id=10, page_size=2)
+    sql, params = execute.call_args[0]
+    assert 'd.contactNo LIKE ? OR d.donorEmail LIKE ? OR d.name LIKE ?' in sql
+    assert params == [3, 10, '%khan%', '%khan%', '%khan%']
+    assert page == rows[:2] and next_after == 8
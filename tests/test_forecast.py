@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from app import project_stock
+
+
+def project(demand, supply=None, expiring=None, stock=0, window=7, horizon=30):
+    """project_stock for a single pair, returned as plain scalars"""
+    demand = np.array([demand], dtype=float)
+    supply = np.zeros_like(demand) if supply is None else np.array([supply], dtype=float)
+    expiring = np.zeros((1, horizon)) if expiring is None else np.array([expiring], dtype=float)
+    result = project_stock(demand, supply, expiring, np.array([stock], dtype=float), window, horizon)
+    return {key: value[0].item() for key, value in result.items()}
+
+
+def test_constant_demand_runs_out():
+    result = project([2] * 28, stock=10)
+    assert result['demand_rate'] == 2 and result['supply_rate'] == 0
+    assert result['days_to_stockout'] == 5
+    assert result['days_to_stockout_peak'] == 5
+    assert result['projected_stock'] == 0
+
+
+def test_supply_keeping_pace_never_runs_out():
+    result = project([1] * 28, supply=[1] * 28, stock=5)
+    assert result['days_to_stockout'] == 0
+    assert result['projected_stock'] == 5
+
+
+def test_rates_use_only_the_trailing_window():
+    result = project([0] * 21 + [4] * 7, supply=[3] * 21 + [1] * 7, stock=100, window=7)
+    assert result['demand_rate'] == 4 and result['supply_rate'] == 1
+
+
+def test_window_longer_than_history_is_clamped():
+    result = project([1, 3], stock=10, window=28)
+    assert result['demand_rate'] == 2
+
+
+def test_only_stock_not_consumed_before_expiry_is_wasted():
+    expiring = [0] * 30
+    expiring[1] = 6                 # six units expire at the end of day 2
+    result = project([1] * 28, expiring=expiring, stock=10)
+    # Two of the six are used first (FEFO), four are lost: 10 - 4 lasts 6 days
+    assert result['expiring'] == 6
+    assert result['projected_waste'] == 4
+    assert result['days_to_stockout'] == 6
+
+
+def test_stock_consumed_before_expiry_wastes_nothing():
+    expiring = [0] * 30
+    expiring[9] = 5
+    result = project([1] * 28, expiring=expiring, stock=20)
+    assert result['projected_waste'] == 0
+    assert result['days_to_stockout'] == 20
+
+
+def test_peak_rate_comes_from_busy_windows():
+    # Two-day rolling means: 1, 1, 1, 3, 5, 3, 1, 1, 1 -> 90th percentile 3.4
+    result = project([1, 1, 1, 1, 5, 5, 1, 1, 1, 1], stock=10, window=2)
+    assert result['demand_rate'] == 1
+    assert result['peak_demand_rate'] == pytest.approx(3.4)
+    assert result['days_to_stockout'] == 10
+    assert result['days_to_stockout_peak'] == 3
+
+
+def test_peak_rate_is_never_below_the_current_rate():
+    result = project([0] * 8 + [5, 5], stock=100, window=2)
+    assert result['peak_demand_rate'] == result['demand_rate'] == 5
+
+
+def test_pairs_are_projected_independently():
+    rng = np.random.default_rng(7)
+    demand = rng.poisson(3, (5, 60)).astype(float)
+    supply = rng.poisson(2, (5, 60)).astype(float)
+    expiring = rng.poisson(0.5, (5, 14)).astype(float)
+    stock = rng.integers(0, 50, 5).astype(float)
+
+    together = project_stock(demand, supply, expiring, stock, 14, 14)
+    for i in range(5):
+        alone = project_stock(demand[i:i + 1], supply[i:i + 1], expiring[i:i + 1], stock[i:i + 1], 14, 14)
+        for key, values in alone.items():
+            assert together[key][i] == pytest.approx(values[0]), key
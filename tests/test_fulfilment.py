@@ -0,0 +1,78 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from app import AllocationError, commit_allocation, stress_fulfilment
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'fulfil.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE BloodUnit (bloodUnitID INTEGER PRIMARY KEY, status TEXT NOT NULL, expiryDate TEXT NOT NULL);
+        CREATE TABLE BloodRequest (bloodRequestID INTEGER PRIMARY KEY, requestStatus TEXT NOT NULL);
+        CREATE TABLE DeliveryRecord (deliveryID INTEGER PRIMARY KEY AUTOINCREMENT, bloodRequestID INT,
+                                     bloodUnitID INT, deliveryDate TEXT, deliveredByStaffID INT,
+                                     bloodCondition TEXT);
+        INSERT INTO BloodUnit VALUES (1, 'stored', '2099-01-01'), (2, 'stored', '2099-01-02');
+        INSERT INTO BloodRequest VALUES (1, 'pending'), (2, 'pending');
+    """)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def scalar(conn, sql):
+    return conn.execute(sql).fetchone()[0]
+
+
+def test_commit_allocation_issues_unit(db):
+    commit_allocation(db, 1, [1], staff_id=7)
+
+    assert scalar(db, "SELECT status FROM BloodUnit WHERE bloodUnitID = 1") == 'used'
+    assert scalar(db, "SELECT requestStatus FROM BloodRequest WHERE bloodRequestID = 1") == 'delivered'
+    assert db.execute("SELECT bloodRequestID, bloodUnitID, deliveryDate, deliveredByStaffID "
+                      "FROM DeliveryRecord").fetchall() == [(1, 1, date.today().isoformat(), 7)]
+
+
+def test_unit_already_issued_is_rejected_and_rolled_back(db):
+    commit_allocation(db, 1, [1], staff_id=7)
+
+    with pytest.raises(AllocationError):
+        commit_allocation(db, 2, [1, 2], staff_id=7)
+
+    assert scalar(db, "SELECT status FROM BloodUnit WHERE bloodUnitID = 2") == 'stored'
+    assert scalar(db, "SELECT requestStatus FROM BloodRequest WHERE bloodRequestID = 2") == 'pending'
+    assert scalar(db, "SELECT COUNT(*) FROM DeliveryRecord") == 1
+
+
+def test_request_no_longer_pending_is_rejected_and_rolled_back(db):
+    commit_allocation(db, 1, [1], staff_id=7)
+
+    with pytest.raises(AllocationError):
+        commit_allocation(db, 1, [2], staff_id=7)
+
+    assert scalar(db, "SELECT status FROM BloodUnit WHERE bloodUnitID = 2") == 'stored'
+    assert scalar(db, "SELECT COUNT(*) FROM DeliveryRecord") == 1
+
+
+def test_concurrent_fulfilment_never_issues_a_unit_twice(tmp_path):
+    path = str(tmp_path / 'stress.db')
+    counters = stress_fulfilment(path, threads=12, unit_count=300, request_count=400)
+
+    conn = sqlite3.connect(path)
+    try:
+        duplicates = conn.execute("SELECT bloodUnitID FROM DeliveryRecord "
+                                  "GROUP BY bloodUnitID HAVING COUNT(*) > 1").fetchall()
+        deliveries = scalar(conn, "SELECT COUNT(*) FROM DeliveryRecord")
+        used = scalar(conn, "SELECT COUNT(*) FROM BloodUnit WHERE status = 'used'")
+        delivered = scalar(conn, "SELECT COUNT(*) FROM BloodRequest WHERE requestStatus = 'delivered'")
+    finally:
+        conn.close()
+
+    assert duplicates == []
+    assert deliveries == used == delivered == counters['fulfilled']
+    assert counters['fulfilled'] + counters['unfilled'] == 400
+    assert 0 < counters['fulfilled'] <= 300
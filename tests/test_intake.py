@@ -0,0 +1,155 @@
+from unittest import mock
+
+import pytest
+
+import app
+from app import INTAKE_MAX_ATTEMPTS, INTAKE_REJECTIONS, IntakeSpool, flush_intake
+
+
+def payload(name, donor_id=None):
+    return {'donor_id': donor_id, 'name': name, 'contact': '0300-1234567', 'email': None,
+            'donation_type_id': 1, 'donation_date': '2025-01-01', 'amount_ml': 450,
+            'staff_id': 1, 'center_id': 1}
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return IntakeSpool(str(tmp_path / 'instance' / 'intake_spool.db'))
+
+
+class FakeCentral:
+    """commit_intake against an in-memory IntakeReceipt. `lose_ack` commits
+    the batch and then raises, as when the connection drops before the
+    acknowledgement arrives; `reject` maps clientIDs to outcomes."""
+
+    def __init__(self):
+        self.receipts = {}
+        self.lose_ack = False
+        self.reject = {}
+        self.broken = set()
+        self.calls = []
+
+    def commit_intake(self, conn, entries):
+        self.calls.append([client_id for _, client_id, _ in entries])
+        if any(client_id in self.broken for _, client_id, _ in entries):
+            raise ValueError('bad row')
+        results = {}
+        for spool_id, client_id, _ in entries:
+            if client_id in self.receipts:
+                results[spool_id] = ('duplicate', *self.receipts[client_id])
+            elif client_id in self.reject:
+                results[spool_id] = (self.reject[client_id], None, None)
+            else:
+                self.receipts[client_id] = (len(self.receipts) + 1, len(self.receipts) + 101)
+                results[spool_id] = (None, *self.receipts[client_id])
+        if self.lose_ack:
+            self.lose_ack = False
+            raise app.INTAKE_TRANSIENT_ERRORS[0]('08S01', 'Communication link failure')
+        return results
+
+
+@pytest.fixture
+def central(spool):
+    central = FakeCentral()
+    with mock.patch.object(app, 'intake_spool', spool), \
+            mock.patch.object(app, 'get_db_connection', return_value=mock.Mock()), \
+            mock.patch.object(app, 'commit_intake', side_effect=central.commit_intake):
+        yield central
+
+
+def test_file_is_created_on_first_use(spool, tmp_path):
+    assert not (tmp_path / 'instance').exists()
+    spool.enqueue('a', payload('Ayesha'))
+    assert (tmp_path / 'instance' / 'intake_spool.db').exists()
+
+
+def test_enqueue_is_idempotent_per_client_id(spool):
+    first = spool.enqueue('a', payload('Ayesha'))
+    assert first[1] is False
+    assert spool.enqueue('a', payload('Someone else')) == (first[0], True)
+    assert spool.enqueue('b', payload('Bilal'))[1] is False
+    assert [(client_id, p['name']) for _, client_id, p in spool.claim(10)] == [('a', 'Ayesha'), ('b', 'Bilal')]
+
+
+def test_queue_survives_a_restart(spool):
+    spool.enqueue('a', payload('Ayesha'))
+    reopened = IntakeSpool(spool.path)
+    assert reopened.stats() == {'queued': 1, 'failed': 0}
+    assert reopened.enqueue('a', payload('Ayesha'))[1] is True
+
+
+def test_claim_is_oldest_first_and_complete_deletes(spool):
+    ids = [spool.enqueue(str(i), payload(f'Donor {i}'))[0] for i in range(5)]
+    assert [entry[0] for entry in spool.claim(3)] == ids[:3]
+    spool.complete(ids[:2])
+    assert [entry[0] for entry in spool.claim(10)] == ids[2:]
+
+
+def test_failed_rows_are_parked_after_max_attempts(spool):
+    retried = spool.enqueue('a', payload('Ayesha'))[0]
+    rejected = spool.enqueue('b', payload('Bilal'))[0]
+    spool.fail(rejected, 'No donor with this ID', permanent=True)
+    for _ in range(INTAKE_MAX_ATTEMPTS - 1):
+        spool.fail(retried, 'deadlock')
+    assert spool.stats() == {'queued': 1, 'failed': 1}
+    spool.fail(retried, 'deadlock')
+    assert spool.stats() == {'queued': 0, 'failed': 2}
+    assert [(row['client_id'], row['attempts'], row['error']) for row in spool.failed()] == \
+        [('b', 1, 'No donor with this ID'), ('a', INTAKE_MAX_ATTEMPTS, 'deadlock')]
+
+
+def test_flush_commits_in_batches(spool, central):
+    for i in range(5):
+        spool.enqueue(str(i), payload(f'Donor {i}'))
+    assert flush_intake(batch_size=2) == 5
+    assert central.calls == [['0', '1'], ['2', '3'], ['4']]
+    assert spool.stats() == {'queued': 0, 'failed': 0}
+
+
+def test_lost_acknowledgement_is_not_committed_twice(spool, central):
+    spool.enqueue('a', payload('Ayesha'))
+    spool.enqueue('b', payload('Bilal'))
+    central.lose_ack = True
+    assert flush_intake() == 0
+    assert spool.stats() == {'queued': 2, 'failed': 0}   # kept, without an attempt counted
+
+    # The retry finds both receipts and only clears the spool
+    spool.enqueue('c', payload('Sana'))
+    assert flush_intake() == 1
+    assert list(central.receipts) == ['a', 'b', 'c']
+    assert spool.stats() == {'queued': 0, 'failed': 0}
+
+
+def test_resubmission_after_flush_is_a_duplicate(spool, central):
+    spool.enqueue('a', payload('Ayesha'))
+    assert flush_intake() == 1
+    spool.enqueue('a', payload('Ayesha'))       # the spool row is gone, the receipt is not
+    assert flush_intake() == 0
+    assert len(central.receipts) == 1 and spool.stats()['queued'] == 0
+
+
+def test_rejections_are_parked_with_their_reason(spool, central):
+    spool.enqueue('a', payload('Donor #7', donor_id=7))
+    spool.enqueue('b', payload('Bilal'))
+    central.reject['a'] = 'not_eligible'
+    assert flush_intake() == 1
+    assert spool.stats() == {'queued': 0, 'failed': 1}
+    assert spool.failed()[0]['error'] == INTAKE_REJECTIONS['not_eligible']
+
+
+def test_bad_row_is_isolated_from_its_batch(spool, central):
+    for client_id in 'abc':
+        spool.enqueue(client_id, payload(client_id))
+    central.broken.add('b')
+    assert flush_intake() == 2
+    assert central.calls == [['a', 'b', 'c'], ['a'], ['b'], ['c']]
+    assert spool.stats() == {'queued': 1, 'failed': 0}
+    assert spool.claim(10)[0][1] == 'b'
+
+
+def test_unreachable_database_postpones_the_flush(spool, central):
+    spool.enqueue('a', payload('Ayesha'))
+    with mock.patch.object(app, 'get_db_connection', side_effect=app.pyodbc.Error('down')):
+        assert flush_intake() == 0
+    assert central.calls == []
+    assert spool.stats() == {'queued': 1, 'failed': 0}
@@ -0,0 +1,239 @@
+from collections import Counter
+from datetime import date
+from unittest import mock
+
+import pytest
+
+import app
+from app import RECONCILE_SOURCES, DonorReconciler, reconcile_campaign_donors
+
+COLUMNS = ['sourceID', 'donorName', 'donorAge', 'donorGender', 'donorBloodGroup',
+           'contactNumber', 'location', 'seenOn', 'donationDate']
+DRIVE = date(2024, 3, 1)
+GENDERS = {'male': 1, 'female': 2}
+GROUPS = {'a+': 1, 'o-': 2, 'b+': 3, 'o+': 4, 'ab+': 5}
+
+
+def source_row(source_id, name, phone, group, gender='Female', age=25, donated=True):
+    return dict(zip(COLUMNS, (source_id, name, age, gender, group, phone, 'Lahore, Punjab',
+                              DRIVE, DRIVE if donated else None)))
+
+
+class FakeCursor:
+    fast_executemany = False
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self._rows = []
+
+    def result(self, columns, rows):
+        self.description = [(column,) for column in columns]
+        self._rows = list(rows)
+
+    def execute(self, sql, params=()):
+        self.conn.handle(self, sql, params)
+
+    def executemany(self, sql, rows):
+        self.conn.handle_many(sql, list(rows))
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size):
+        batch, self._rows = self._rows[:size], self._rows[size:]
+        return batch
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows))
+
+    def close(self):
+        pass
+
+
+class FakeNGO:
+    """Campaign sources plus CampaignDonorLink and ReconcileCheckpoint; writes
+    only land on commit(), and commit number `fail_on_commit` raises instead"""
+
+    def __init__(self, sources, fail_on_commit=None):
+        self.sources = sources
+        self.checkpoints = {source: 0 for source in sources}
+        self.links = []
+        self.fail_on_commit = fail_on_commit
+        self.commits = 0
+        self._pending = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def handle(self, cursor, sql, params):
+        if 'sp_getapplock' in sql:
+            cursor.result(['result'], [(0,)])
+        elif 'FROM ReconcileCheckpoint' in sql:
+            cursor.result(['sourceTable', 'lastSourceID'], self.checkpoints.items())
+        elif 'UPDATE ReconcileCheckpoint' in sql:
+            self._pending.append(('checkpoint', params))
+        elif 'sp_releaseapplock' not in sql:
+            source = next(source for source, query in RECONCILE_SOURCES.items() if query == sql)
+            rows = [row for row in self.sources[source] if row['sourceID'] > params[0]]
+            cursor.result(COLUMNS, [tuple(row[column] for column in COLUMNS) for row in rows])
+
+    def handle_many(self, sql, rows):
+        assert 'INSERT INTO CampaignDonorLink' in sql
+        self._pending.append(('links', rows))
+
+    def commit(self):
+        pending, self._pending = self._pending, []
+        if self.commits == self.fail_on_commit:
+            self.fail_on_commit = None
+            raise RuntimeError('connection lost')
+        self.commits += 1
+        for kind, payload in pending:
+            if kind == 'links':
+                self.links.extend(payload)
+            else:
+                last_id, source = payload
+                self.checkpoints[source] = last_id
+
+    def close(self):
+        self._pending = []
+
+
+class FakeSystem:
+    """Just enough of Donor for load_donor_index and DonorReconciler.apply"""
+
+    def __init__(self, donors):
+        self.donors = {donor['donorID']: donor for donor in donors}
+        self._staged = []
+        self._donated = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def handle(self, cursor, sql, params):
+        if 'FROM Donor ORDER BY donorID' in sql:
+            cursor.result(['donorID', 'name', 'contactNo', 'bgID'],
+                          [(d['donorID'], d['name'], d['contactNo'], d['bgID']) for d in self.donors.values()])
+        elif 'MERGE Donor' in sql:
+            created = []
+            for row_no, name, dob, gender_id, bg_id, phone, city in self._staged:
+                donor_id = max(self.donors, default=0) + 1
+                self.donors[donor_id] = {'donorID': donor_id, 'name': name, 'contactNo': phone, 'bgID': bg_id,
+                                         'dateOfBirth': dob, 'city': city, 'lastDonationDate': None}
+                created.append((row_no, donor_id))
+            cursor.result(['rowNo', 'donorID'], created)
+        elif 'SET lastDonationDate' in sql:
+            for donor_id, day in self._donated:
+                donor = self.donors[donor_id]
+                if donor['lastDonationDate'] is None or donor['lastDonationDate'] < day:
+                    donor['lastDonationDate'] = day
+
+    def handle_many(self, sql, rows):
+        if '#ReconcileDonated' in sql:
+            self._donated = rows
+        else:
+            self._staged = rows
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def lookups():
+    tables = {'GenderType': GENDERS, 'BloodGroup': GROUPS}
+    with mock.patch.object(app, '_lookup', side_effect=lambda table, *_: tables[table]):
+        yield
+
+
+@pytest.fixture
+def databases(lookups):
+    sources = {
+        'CampaignDonor': [
+            source_row(1, 'Ayesha Khan', '0300-1234567', 'A+'),
+            source_row(2, 'Bilal Ahmed', '0301-7654321', 'O-', gender='Male'),
+            source_row(3, 'AYESHA  khan', '+92 300 1234567', 'A+'),
+            source_row(4, 'Hamza Qureshi', '0321-5550000', 'B+', gender='Male', age=40),
+            source_row(5, 'Sana Iqbal', '0333-1112222', 'AB+'),
+        ],
+        'CampaignDonorRegistration': [
+            source_row(1, 'Hamza Qureshi', '0321 5550000', 'O+', gender='Male', donated=False),
+            source_row(2, 'Noor', None, 'A+', donated=False),
+            source_row(3, 'bilal ahmed', '03017654321', 'O-', gender='Male', donated=False),
+        ],
+    }
+    system = FakeSystem([{'donorID': 1, 'name': 'Bilal Ahmed', 'contactNo': '+92 301 7654321',
+                          'bgID': GROUPS['o-'], 'lastDonationDate': date(2023, 1, 1)}])
+    ngo = FakeNGO(sources)
+    with mock.patch.object(app, 'get_db_connection', return_value=system), \
+            mock.patch.object(app, 'get_db_connection_ngo', return_value=ngo):
+        yield system, ngo
+
+
+def statuses(ngo):
+    return {(source, source_id): status for source, source_id, _, status in ngo.links}
+
+
+def test_run_links_every_row_and_advances_checkpoints(databases):
+    system, ngo = databases
+    counts = reconcile_campaign_donors(batch_size=2)
+
+    assert counts == Counter(created=3, matched=3, conflict=1, skipped=1)
+    assert statuses(ngo) == {
+        ('CampaignDonor', 1): 'created', ('CampaignDonor', 2): 'matched',
+        ('CampaignDonor', 3): 'matched', ('CampaignDonor', 4): 'created',
+        ('CampaignDonor', 5): 'created', ('CampaignDonorRegistration', 1): 'conflict',
+        ('CampaignDonorRegistration', 2): 'skipped', ('CampaignDonorRegistration', 3): 'matched',
+    }
+    assert ngo.checkpoints == {'CampaignDonor': 5, 'CampaignDonorRegistration': 3}
+    assert len(system.donors) == 4
+    assert system.donors[1]['lastDonationDate'] == DRIVE
+
+
+def test_second_run_only_reads_new_rows(databases):
+    system, ngo = databases
+    reconcile_campaign_donors(batch_size=2)
+    with mock.patch.object(app, 'load_donor_index') as load_index:
+        assert reconcile_campaign_donors(batch_size=2) == Counter()
+    load_index.assert_not_called()      # nothing new, so Donor isn't scanned
+
+    ngo.sources['CampaignDonor'].append(source_row(6, 'Sana Iqbal', '0333-1112222', 'AB+'))
+    assert reconcile_campaign_donors(batch_size=2) == Counter(matched=1)
+    assert ngo.checkpoints['CampaignDonor'] == 6
+    assert len(ngo.links) == 9 and len(system.donors) == 4
+
+
+def test_resume_after_crash_does_not_duplicate_donors_or_links(databases):
+    system, ngo = databases
+    ngo.fail_on_commit = 1              # the second batch's links never commit
+    with pytest.raises(RuntimeError):
+        reconcile_campaign_donors(batch_size=2)
+
+    # Rows 3-4 created Hamza in Donor, but their links and checkpoint rolled back
+    assert ngo.checkpoints['CampaignDonor'] == 2
+    assert [link[1] for link in ngo.links] == [1, 2]
+    assert len(system.donors) == 3
+
+    counts = reconcile_campaign_donors(batch_size=2)
+    assert counts == Counter(created=1, matched=3, conflict=1, skipped=1)
+    assert statuses(ngo)[('CampaignDonor', 4)] == 'matched'
+    assert len(ngo.links) == len({(source, source_id) for source, source_id, _, _ in ngo.links}) == 8
+    assert len(system.donors) == 4
+    assert ngo.checkpoints == {'CampaignDonor': 5, 'CampaignDonorRegistration': 3}
+
+
+def test_same_person_twice_in_a_batch_is_created_once(lookups):
+    reconciler = DonorReconciler({})
+    links, new_donors, donated = reconciler.plan([
+        source_row(1, 'Ayesha Khan', '0300-1234567', 'A+'),
+        source_row(2, 'ayesha khan', '923001234567', 'A+'),
+        source_row(3, 'Ayesha Khan', '0300-1234567', 'O-'),
+    ])
+    key = ('3001234567', 'ayesha khan')
+    assert [status for _, _, status in links] == ['created', 'matched', 'conflict']
+    assert list(new_donors) == [key]
+    assert new_donors[key] == ('Ayesha Khan', date(1999, 7, 1), GENDERS['female'], GROUPS['a+'],
+                               '0300-1234567', 'Lahore')
+    assert donated == {key: DRIVE}
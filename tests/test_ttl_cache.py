@@ -0,0 +1,101 @@
+import threading
+from unittest import mock
+
+from app import TTLCache
+
+
+def test_value_expires_after_ttl():
+    cache = TTLCache(ttl=10)
+    with mock.patch('app.time.monotonic', return_value=100.0):
+        cache.set('k', 1)
+    with mock.patch('app.time.monotonic', return_value=109.0):
+        assert cache.get('k') == 1
+    with mock.patch('app.time.monotonic', return_value=111.0):
+        assert cache.get('k') is None
+
+
+def test_none_is_not_cached():
+    cache = TTLCache(ttl=60)
+    calls = []
+    assert cache.get_or_load('k', lambda: calls.append(1)) is None
+    assert cache.get_or_load('k', lambda: calls.append(1)) is None
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_on_one_key_load_once():
+    cache = TTLCache(ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['value'] * 8
+    assert len(calls) == 1
+
+
+def test_different_keys_load_in_parallel():
+    cache = TTLCache(ttl=60)
+    a_started, b_started = threading.Event(), threading.Event()
+
+    def load_a():
+        a_started.set()
+        return 'a' if b_started.wait(5) else 'blocked'
+
+    def load_b():
+        b_started.set()
+        return 'b' if a_started.wait(5) else 'blocked'
+
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(a=cache.get_or_load('a', load_a)))
+    thread.start()
+    results['b'] = cache.get_or_load('b', load_b)
+    thread.join(5)
+    assert results == {'a': 'a', 'b': 'b'}
+
+
+def test_invalidate_during_load_is_not_cached():
+    cache = TTLCache(ttl=60)
+
+    def stale_loader():
+        cache.invalidate('k')       # a write lands while the loader is reading
+        return 'stale'
+
+    assert cache.get_or_load('k', stale_loader) == 'stale'
+    assert cache.get('k') is None
+    assert cache.get_or_load('k', lambda: 'fresh') == 'fresh'
+    assert cache.get('k') == 'fresh'
+
+
+def test_invalidate_all_during_load_is_not_cached():
+    cache = TTLCache(ttl=60)
+
+    def stale_loader():
+        cache.invalidate()
+        return 'stale'
+
+    assert cache.get_or_load('k', stale_loader) == 'stale'
+    assert cache.get('k') is None
+
+
+def test_invalidating_another_key_keeps_the_load():
+    cache = TTLCache(ttl=60)
+    cache.set('other', 1)
+
+    def loader():
+        cache.invalidate('other')
+        return 'value'
+
+    assert cache.get_or_load('k', loader) == 'value'
+    assert cache.get('k') == 'value'
+    assert cache.get('other') is None